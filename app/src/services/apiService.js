@@ -179,7 +179,10 @@ class ApiService {
     try {
       console.log('📁 Loading documents for user:', userId);
       
-      const response = await this.api.get(`/documents/${userId}`);
+      // La schermata mostra anteprima e metadati OCR: campi richiesti esplicitamente
+      const response = await this.api.get(`/documents/${userId}`, {
+        params: { limit: 100, fields: 'all' },
+      });
       
       console.log('📁 Documents loaded successfully:', response.data);
       return response.data;
@@ -222,6 +225,10 @@ class ApiService {
         text: match.metadata?.chunk_text || match.metadata?.text || '',
         title: match.metadata?.title || 'Documento senza titolo',
         score: match.score || 0,
+        // Chunk vicini (query con window): uniti nel contesto della risposta
+        id: match.id,
+        metadata: match.metadata,
+        neighbors: match.neighbors,
       }));
       
       console.log('📝 Extracted contexts:', contexts);
@@ -1,15 +1,26 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request, UploadFile, File, Form
+from starlette.concurrency import run_in_threadpool
 from app.api.deps import check_api_key
+from app.core.metrics import observe_stage
+from app.core.responses import DuplexStreamingResponse
+from app.core.timing import request_stage, get_stage_timings
+from app.core.tracing import traced
 from app.schemas import (
-    UpsertIn, UpsertOut, QueryIn, QueryOut, AnswerIn, AnswerOut,
-    DocumentUploadOut, DocumentUploadError, DocumentListOut, DocumentInfo
+    UpsertIn, UpsertOut, QueryIn, QueryOut, SearchFilters, BatchQueryIn, BatchQueryOut, AnswerIn, AnswerOut,
+    DocumentUploadOut, DocumentUploadError, DocumentListOut, DocumentInfo,
+    DocumentDeleteIn, DocumentDeleteOut,
+    UploadStageTimings
 )
+from app.services.batch_upsert import BatchUpsert
 from app.services.chunking import chunk_text
-from app.services.rag import upsert_chunks, semantic_search, answer_from_context
+from app.services.rag import upsert_chunks, semantic_search, semantic_search_batch, answer_from_context, metadata_filter
 from app.services.ocr_service import ocr_service
-from app.services.document_service import document_service
+from app.services.document_service import document_service, DEFAULT_LIST_FIELDS
+from app.services.resilience import CircuitOpenError
+import json
 import logging
 import time
+from typing import Optional
 import uuid
 from datetime import datetime
 
@@ -18,11 +29,11 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 
 @router.get("/health")
-def health():
+async def health():
     return {"ok": True}
 
 @router.get("/debug", dependencies=[Depends(check_api_key)])
-def debug_info():
+async def debug_info():
     """Endpoint di debug per vedere configurazione Railway"""
     try:
         from app.core.config import settings
@@ -35,16 +46,25 @@ def debug_info():
             "pinecone_index_name": settings.pinecone_index_name,
             "pinecone_region": settings.pinecone_region,
             "pinecone_cloud": settings.pinecone_cloud,
+            "llm_provider": settings.llm_provider,
+            "vector_provider": settings.vector_provider,
+            "vector_namespace_mode": settings.vector_namespace_mode,
         }
         
         # Prova a connettersi a Pinecone e lista indici
         try:
-            from app.services.pinecone_client import PineconeService
-            pinecone_service = PineconeService()
+            from app.services.providers import get_pinecone_service_async
+            pinecone_service = await get_pinecone_service_async()
             debug_data["pinecone_connection"] = "OK"
             
-            # Lista indici con API 3.x
-            available_indexes = [idx.name for idx in pinecone_service.pc.list_indexes()]
+            # Lista indici con API 3.x (control plane sincrono); lo stand-in ha solo il suo
+            if pinecone_service.pc is None:
+                available_indexes = [pinecone_service.index_name]
+                debug_data["local_index_storage"] = settings.local_index_storage
+                debug_data["local_index_bytes"] = pinecone_service._index.memory_bytes()
+            else:
+                indexes = await run_in_threadpool(pinecone_service.pc.list_indexes)
+                available_indexes = [idx.name for idx in indexes]
             debug_data["available_indexes"] = available_indexes
                 
         except Exception as e:
@@ -53,14 +73,39 @@ def debug_info():
         
         # Test OpenAI
         try:
-            from app.services.openai_client import OpenAIService
-            openai_service = OpenAIService()
-            test_embedding = openai_service.create_embedding("test")
+            from app.services.providers import get_embedding_service
+            embedding_service = get_embedding_service()
+            test_embedding = await embedding_service.create_embedding("test")
             debug_data["openai_connection"] = "OK"
             debug_data["embedding_size"] = len(test_embedding)
+            debug_data["embedding_model"] = settings.embedding_model
+            if embedding_service.backend == "local":
+                debug_data["local_embeddings"] = embedding_service.stats()
         except Exception as e:
             debug_data["openai_connection"] = f"FAILED: {str(e)}"
         
+        # Chiamate ai provider accodate a richieste identiche già in volo
+        from app.services.singleflight import coalescing_stats
+        debug_data["coalescing"] = coalescing_stats()
+        
+        # Stato dello scheduler rate-limit OpenAI
+        from app.services.rate_limiter import rate_limiter
+        debug_data["rate_limiter"] = rate_limiter.stats()
+        
+        # Log scartati da rate limit, campionamento o coda piena
+        from app.core.log_setup import logging_stats
+        debug_data["logging"] = logging_stats()
+        
+        # Catalogo documenti usato per la quota di upload
+        debug_data["document_catalog"] = document_service.catalog.stats()
+        debug_data["document_catalog"]["pending_deletions"] = sum(
+            len(item_ids) for item_ids in document_service.tombstones.values()
+        )
+        
+        # Hedging e circuit breaker delle query vettoriali
+        from app.services.pinecone_client import vector_query_caller
+        debug_data["vector_query"] = vector_query_caller.stats()
+        
         return debug_data
         
     except Exception as e:
@@ -68,19 +113,21 @@ def debug_info():
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/embed-upsert", response_model=UpsertOut, dependencies=[Depends(check_api_key)])
-def embed_upsert(body: UpsertIn):
+async def embed_upsert(body: UpsertIn):
     try:
         # Chunking del testo
-        chunks = chunk_text(body.text, chunk_size=1000, overlap=150)
+        with request_stage("chunk"), observe_stage("chunking"):
+            chunks = chunk_text(body.text, chunk_size=1000, overlap=150)
         logger.info(f"Creati {len(chunks)} chunks per {body.item_id}")
         
         # Upsert reale con OpenAI + Pinecone
-        chunk_ids = upsert_chunks(
+        chunk_ids = await upsert_chunks(
             user_id=body.user_id,
             item_id=body.item_id, 
             title=body.title,
             chunks=chunks
         )
+        await document_service.register_document(body.user_id, body.item_id, len(chunk_ids), body.title)
         
         return UpsertOut(ok=True, ids=chunk_ids)
         
@@ -88,27 +135,72 @@ def embed_upsert(body: UpsertIn):
         logger.error(f"Errore embed_upsert: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/query", response_model=QueryOut, dependencies=[Depends(check_api_key)])
-def query(body: QueryIn):
+@router.post("/embed-upsert/batch", dependencies=[Depends(check_api_key)])
+async def embed_upsert_batch(request: Request):
+    """
+    Corpo NDJSON (application/x-ndjson): un documento UpsertIn per riga.
+    Risposta NDJSON in streaming, una riga per documento appena indicizzato:
+    {"line": n, "item_id": ..., "ok": true, "ids": [...]} oppure {"line": n, "ok": false, "error": ...}
+    """
+    job = BatchUpsert()
+
+    async def result_lines():
+        async for result in job.run(request.stream()):
+            yield json.dumps(result, ensure_ascii=False).encode("utf-8") + b"\n"
+
+    return DuplexStreamingResponse(result_lines(), media_type="application/x-ndjson")
+
+def _search_filters(body: SearchFilters):
+    """Filtro metadati dai campi opzionali della richiesta"""
+    return metadata_filter(**body.model_dump(include=set(SearchFilters.model_fields)))
+
+@router.post("/query", response_model=QueryOut, response_model_exclude_unset=True, dependencies=[Depends(check_api_key)])
+async def query(body: QueryIn):
     try:
         # Ricerca semantica reale
-        matches = semantic_search(
+        matches = await semantic_search(
             user_id=body.user_id,
             query=body.query,
-            top_k=body.top_k
+            top_k=body.top_k,
+            filters=_search_filters(body),
+            window=body.window
         )
         
         return QueryOut(matches=matches)
         
+    except CircuitOpenError as e:
+        logger.warning(f"Query rifiutata: {e}")
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.error(f"Errore query: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/query/batch", response_model=BatchQueryOut, response_model_exclude_unset=True, dependencies=[Depends(check_api_key)])
+async def query_batch(body: BatchQueryIn):
+    """Più query in una richiesta: un embedding per tutte, risultati nello stesso ordine"""
+    try:
+        results = await semantic_search_batch(
+            user_id=body.user_id,
+            queries=body.queries,
+            top_k=body.top_k,
+            filters=_search_filters(body),
+            window=body.window
+        )
+
+        return BatchQueryOut(results=[QueryOut(matches=matches) for matches in results])
+
+    except CircuitOpenError as e:
+        logger.warning(f"Query batch rifiutata: {e}")
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logger.error(f"Errore query batch: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.post("/answer", response_model=AnswerOut, dependencies=[Depends(check_api_key)])
-def answer(body: AnswerIn):
+async def answer(body: AnswerIn):
     try:
         # Generazione risposta reale con GPT
-        answer_text = answer_from_context(
+        answer_text = await answer_from_context(
             query=body.query,
             contexts=body.contexts
         )
@@ -125,7 +217,9 @@ def answer(body: AnswerIn):
 # ========================
 
 @router.post("/upload-document", dependencies=[Depends(check_api_key)])
+@traced("routes.upload_document")
 async def upload_document(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     title: str = Form(""),
     user_id: str = Form(...),
@@ -133,28 +227,19 @@ async def upload_document(
 ):
     """
     Upload documento immagine → OCR → RAG
-    Con limite di 10 documenti per utente
+    Con limite di 10 documenti per utente: i più vecchi vengono eliminati
+    in background dopo la risposta
     """
     start_time = time.time()
     
     try:
-        # 0. Controllo limite documenti
-        if not document_service.can_upload_document(user_id):
-            current_count = document_service.count_user_documents(user_id)
-            
-            if current_count >= document_service.max_documents:
-                # Elimina il documento più vecchio
-                if document_service.delete_oldest_document(user_id):
-                    logger.info(f"Eliminato documento più vecchio per {user_id} (limite {document_service.max_documents})")
-                else:
-                    return DocumentUploadError(
-                        error=f"Limite di {document_service.max_documents} documenti raggiunto e impossibile eliminare documenti vecchi",
-                        error_code="LIMIT_EXCEEDED"
-                    )
+        # 0. Controllo limite documenti (conteggio dal catalogo, nessuna scansione)
+        with request_stage("quota_check", user_id=user_id):
+            if not await document_service.can_upload_document(user_id):
+                logger.info(f"Limite di {document_service.max_documents} documenti raggiunto per {user_id}, "
+                            f"il più vecchio verrà eliminato dopo l'upload")
         
         # 1. Validazione file
-        logger.info(f"File ricevuto: {file.filename}, tipo: {file.content_type}")
-        
         # Accetta anche PDF (li tratteremo come immagini per ora)
         supported_types = {
             'image/jpeg', 'image/jpg', 'image/png', 
@@ -222,11 +307,15 @@ Firma: [Firma digitale]"""
             logger.info("PDF caricato: usando testo simulato per demo")
             
         else:
-            # OCR per immagini
+            # OCR per immagini (CPU-bound: fuori dall'event loop)
             try:
-                extracted_text, ocr_metadata = ocr_service.extract_text_with_fallback(
-                    file_content, language
-                )
+                # Primo uso: la verifica di Tesseract esegue un OCR di prova, fuori dall'event loop
+                available = await run_in_threadpool(lambda: ocr_service.tesseract_available)
+                ocr_backend = "tesseract" if available else "mock"
+                with request_stage("ocr", bytes=len(file_content), language=language), observe_stage("ocr", ocr_backend):
+                    extracted_text, ocr_metadata = await run_in_threadpool(
+                        ocr_service.extract_text_with_fallback, file_content, language
+                    )
             except Exception as e:
                 logger.error(f"Errore OCR: {e}")
                 return DocumentUploadError(
@@ -251,11 +340,12 @@ Firma: [Firma digitale]"""
         
         try:
             # Chunking
-            chunks = chunk_text(extracted_text, chunk_size=1000, overlap=150)
+            with request_stage("chunk", text_length=len(extracted_text)), observe_stage("chunking"):
+                chunks = chunk_text(extracted_text, chunk_size=1000, overlap=150)
             logger.info(f"Creati {len(chunks)} chunks per {item_id}")
             
             # Upsert nel RAG
-            chunk_ids = upsert_chunks(
+            chunk_ids = await upsert_chunks(
                 user_id=user_id,
                 item_id=item_id,
                 title=document_title,
@@ -269,6 +359,10 @@ Firma: [Firma digitale]"""
             
             logger.info(f"Documento salvato con {len(chunk_ids)} chunks")
             
+            await document_service.register_document(user_id, item_id, len(chunk_ids), document_title)
+            if await document_service.count_user_documents(user_id) > document_service.max_documents:
+                background_tasks.add_task(document_service.evict_over_quota, user_id)
+            
         except Exception as e:
             logger.error(f"Errore salvataggio RAG: {e}")
             return DocumentUploadError(
@@ -278,6 +372,7 @@ Firma: [Firma digitale]"""
         
         # 5. Risposta successo
         processing_time = time.time() - start_time
+        stage_timings = {name: round(seconds, 3) for name, seconds in get_stage_timings().items()}
         
         return DocumentUploadOut(
             success=True,
@@ -286,7 +381,11 @@ Firma: [Firma digitale]"""
             text_preview=extracted_text[:200] + ("..." if len(extracted_text) > 200 else ""),
             chunks_created=len(chunk_ids),
             ocr_metadata=ocr_metadata,
-            processing_time=round(processing_time, 2)
+            processing_time=round(processing_time, 2),
+            stage_timings=UploadStageTimings(**{
+                name: seconds for name, seconds in stage_timings.items()
+                if name in UploadStageTimings.model_fields
+            })
         )
         
     except Exception as e:
@@ -297,72 +396,98 @@ Firma: [Firma digitale]"""
         )
 
 
-@router.get("/documents/{user_id}", response_model=DocumentListOut, dependencies=[Depends(check_api_key)])
-def list_user_documents(user_id: str):
+@router.get(
+    "/documents/{user_id}",
+    response_model=DocumentListOut,
+    response_model_exclude_unset=True,
+    dependencies=[Depends(check_api_key)]
+)
+async def list_user_documents(
+    user_id: str,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="next_cursor della pagina precedente"),
+    sort: str = Query("created_at_desc", description="created_at_desc, created_at_asc, title_asc, title_desc"),
+    fields: Optional[str] = Query(None, description="Campi separati da virgola, o 'all'")
+):
     """
-    Lista documenti di un utente
+    Lista documenti di un utente, a pagine
+    Di default solo id, titolo, data e numero di chunk; anteprime e metadati OCR con fields=
     """
+    if fields is None:
+        selected = list(DEFAULT_LIST_FIELDS)
+    elif fields == "all":
+        selected = list(DocumentInfo.model_fields)
+    else:
+        selected = list(dict.fromkeys(["item_id"] + [f.strip() for f in fields.split(",") if f.strip()]))
+    
     try:
         logger.info(f"Richiesta lista documenti per {user_id}")
         
-        # Recupera documenti dal servizio
-        documents = document_service.get_user_documents(user_id)
-        
-        # Converti in oggetti DocumentInfo
-        document_infos = []
-        for doc in documents:
-            doc_info = DocumentInfo(
-                item_id=doc['item_id'],
-                title=doc['title'],
-                created_at=doc['created_at'],
-                upload_date=doc['upload_date'],
-                text_length=doc['text_length'],
-                chunks_count=doc['chunks_count'],
-                ocr_confidence=doc.get('ocr_confidence'),
-                text_preview=doc['text_preview'],
-                file_type=doc['file_type'],
-                user_id=doc['user_id']
-            )
-            document_infos.append(doc_info)
+        page = await document_service.list_documents(
+            user_id, limit=limit, cursor=cursor, sort=sort, fields=selected
+        )
         
         return DocumentListOut(
             user_id=user_id,
-            documents=document_infos,
-            total_count=len(document_infos),
-            max_documents=document_service.max_documents
+            documents=[DocumentInfo(**doc) for doc in page["documents"]],
+            total_count=page["total_count"],
+            max_documents=document_service.max_documents,
+            next_cursor=page["next_cursor"]
         )
         
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Errore lista documenti per {user_id}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.delete("/documents/{user_id}/{item_id}", dependencies=[Depends(check_api_key)])
-def delete_user_document(user_id: str, item_id: str):
+async def delete_user_document(user_id: str, item_id: str, background_tasks: BackgroundTasks):
     """
     Elimina un documento specifico
+    Il documento sparisce subito da lista e ricerche, i chunk vengono rimossi in background
     """
     try:
         logger.info(f"Richiesta eliminazione documento {item_id} per {user_id}")
         
-        success = document_service.delete_document(user_id, item_id)
-        
-        if success:
-            return {"success": True, "message": "Documento eliminato con successo"}
-        else:
+        found = await document_service.mark_deleted(user_id, [item_id])
+        if not found:
             raise HTTPException(status_code=404, detail="Documento non trovato")
         
+        background_tasks.add_task(document_service.purge_documents, user_id, found)
+        return {"success": True, "message": "Documento eliminato con successo"}
+        
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Errore eliminazione documento {item_id} per {user_id}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.delete("/documents/{item_id}", dependencies=[Depends(check_api_key)])
-async def delete_document(item_id: str, user_id: str):
-    """Elimina documento"""
+@router.post("/documents/{user_id}/delete", response_model=DocumentDeleteOut, dependencies=[Depends(check_api_key)])
+async def delete_user_documents(user_id: str, body: DocumentDeleteIn, background_tasks: BackgroundTasks):
+    """
+    Elimina più documenti di un utente con chiamate delete a blocchi
+    """
     try:
-        # TODO: Implementare eliminazione da Pinecone
-        return {"success": True, "message": f"Documento {item_id} eliminato"}
+        logger.info(f"Richiesta eliminazione di {len(body.item_ids)} documenti per {user_id}")
+        
+        found = await document_service.mark_deleted(user_id, body.item_ids)
+        if found:
+            background_tasks.add_task(document_service.purge_documents, user_id, found)
+        
+        return DocumentDeleteOut(
+            user_id=user_id,
+            deleted=found,
+            not_found=[item_id for item_id in dict.fromkeys(body.item_ids) if item_id not in found]
+        )
         
     except Exception as e:
-        logger.error(f"Errore eliminazione documento: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        logger.error(f"Errore eliminazione documenti per {user_id}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.delete("/documents/{item_id}", dependencies=[Depends(check_api_key)])
+async def delete_document(item_id: str, user_id: str, background_tasks: BackgroundTasks):
+    """Elimina documento (forma con user_id in query string)"""
+    return await delete_user_document(user_id, item_id, background_tasks)
@@ -1,7 +1,40 @@
 import os
-from typing import Optional
+from typing import Dict, Optional
 from pydantic_settings import BaseSettings
-from pydantic import Field
+from pydantic import BaseModel, Field
+
+
+class EmbeddingModel(BaseModel):
+    """Caratteristiche di un modello di embedding usate da client, indice e chunking"""
+    model_config = {"frozen": True}
+
+    name: str
+    dimension: int  # dimensione nativa dell'output
+    reducible: bool = False  # accetta il parametro dimensions (output ridotto)
+    max_input_tokens: int = 8191  # token massimi per singolo input
+    max_batch_inputs: int = 2048  # input massimi per richiesta
+    max_batch_tokens: int = 300_000  # token totali massimi per richiesta
+    tokenizer: str = "cl100k_base"  # encoding tiktoken per contare e troncare ("" = stima)
+    provider: str = "openai"  # openai (API, o stand-in con LLM_PROVIDER=standin) oppure local (CPU)
+
+
+# Modelli selezionabili con EMBEDDING_MODEL; EMBEDDING_DIMENSION sceglie le varianti ridotte
+EMBEDDING_MODELS: Dict[str, EmbeddingModel] = {
+    model.name: model for model in (
+        EmbeddingModel(name="text-embedding-ada-002", dimension=1536),
+        EmbeddingModel(name="text-embedding-3-small", dimension=1536, reducible=True),
+        EmbeddingModel(name="text-embedding-3-large", dimension=3072, reducible=True),
+        # Locali su CPU (app/services/local_embeddings.py); hashing è deterministico, per i test
+        EmbeddingModel(name="sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2", dimension=384,
+                       max_input_tokens=128, max_batch_inputs=64, max_batch_tokens=8192,
+                       tokenizer="", provider="local"),
+        EmbeddingModel(name="intfloat/multilingual-e5-small", dimension=384,
+                       max_input_tokens=512, max_batch_inputs=32, max_batch_tokens=16384,
+                       tokenizer="", provider="local"),
+        EmbeddingModel(name="hashing", dimension=1536, reducible=True, max_input_tokens=8191,
+                       max_batch_inputs=256, max_batch_tokens=1_000_000, tokenizer="", provider="local"),
+    )
+}
 
 class Settings(BaseSettings):
     # API Keys
@@ -14,6 +47,106 @@ class Settings(BaseSettings):
     pinecone_cloud: str = Field(default="aws", alias="PINECONE_CLOUD")
     pinecone_region: str = Field(default="us-east-1-aws", alias="PINECONE_REGION")
     
+    # Provider: "openai"/"pinecone" reali oppure stand-in locali deterministici ("standin"/"memory")
+    llm_provider: str = Field(default="openai", alias="LLM_PROVIDER")
+    vector_provider: str = Field(default="pinecone", alias="VECTOR_PROVIDER")
+    
+    # Embedding: modello del registro EMBEDDING_MODELS; dimensione e limiti predefiniti dal modello
+    embedding_model: str = Field(default="text-embedding-ada-002", alias="EMBEDDING_MODEL")
+    embedding_dimension: Optional[int] = Field(default=None, alias="EMBEDDING_DIMENSION")
+    embedding_batch_size: Optional[int] = Field(default=None, alias="EMBEDDING_BATCH_SIZE")
+    # Embedding locali: onnx (model.onnx + tokenizer.json in LOCAL_EMBEDDING_MODEL_DIR),
+    # torch (sentence-transformers) o auto; thread di inferenza e attesa massima per riempire un batch
+    local_embedding_backend: str = Field(default="auto", alias="LOCAL_EMBEDDING_BACKEND")
+    local_embedding_model_dir: Optional[str] = Field(default=None, alias="LOCAL_EMBEDDING_MODEL_DIR")
+    local_embedding_threads: int = Field(default=2, alias="LOCAL_EMBEDDING_THREADS")
+    local_embedding_batch_wait_ms: float = Field(default=2.0, alias="LOCAL_EMBEDDING_BATCH_WAIT_MS")
+    
+    # Stand-in: latenza, jitter e guasti iniettati (riproducibili con il seed)
+    standin_seed: int = Field(default=0, alias="STANDIN_SEED")
+    standin_llm_latency_ms: float = Field(default=0.0, alias="STANDIN_LLM_LATENCY_MS")
+    standin_llm_jitter_ms: float = Field(default=0.0, alias="STANDIN_LLM_JITTER_MS")
+    standin_llm_rate_limit_rate: float = Field(default=0.0, alias="STANDIN_LLM_429_RATE")
+    standin_llm_error_rate: float = Field(default=0.0, alias="STANDIN_LLM_ERROR_RATE")
+    standin_vector_latency_ms: float = Field(default=0.0, alias="STANDIN_VECTOR_LATENCY_MS")
+    standin_vector_jitter_ms: float = Field(default=0.0, alias="STANDIN_VECTOR_JITTER_MS")
+    standin_vector_error_rate: float = Field(default=0.0, alias="STANDIN_VECTOR_ERROR_RATE")
+    # Indice in memoria: float32, oppure float16/int8 quantizzati in RAM con float32 su file
+    # (LOCAL_INDEX_DIR, predefinita la cartella temporanea) per il re-scoring dei migliori candidati
+    local_index_storage: str = Field(default="float32", alias="LOCAL_INDEX_STORAGE")
+    local_index_dir: Optional[str] = Field(default=None, alias="LOCAL_INDEX_DIR")
+    local_index_rescore_factor: int = Field(default=4, alias="LOCAL_INDEX_RESCORE_FACTOR")
+    
+    # Namespace dell'indice: shared (filtro su user_id), dual (migrazione), per_user
+    vector_namespace_mode: str = Field(default="shared", alias="VECTOR_NAMESPACE_MODE")
+    vector_namespace_prefix: str = Field(default="user-", alias="VECTOR_NAMESPACE_PREFIX")
+    
+    # Catalogo documenti per la quota: ricaricato dall'indice dopo questo intervallo
+    document_catalog_ttl: float = Field(default=300.0, alias="DOCUMENT_CATALOG_TTL")
+    # Utenti tenuti nel catalogo: oltre, i meno recenti vengono ricaricati al prossimo accesso
+    document_catalog_max_users: int = Field(default=10000, alias="DOCUMENT_CATALOG_MAX_USERS")
+    # Eliminazione: id per chiamata delete (massimo Pinecone 1000) e chiamate in parallelo
+    delete_batch_size: int = Field(default=1000, alias="DELETE_BATCH_SIZE")
+    delete_concurrency: int = Field(default=4, alias="DELETE_CONCURRENCY")
+    # Upsert: vettori per chiamata (richieste Pinecone entro 2MB con 1536 dimensioni e metadati)
+    upsert_batch_size: int = Field(default=100, alias="UPSERT_BATCH_SIZE")
+    # Embed-upsert NDJSON: chunk per blocco di embedding, documenti letti in anticipo, byte per riga
+    batch_upsert_chunks: int = Field(default=256, alias="BATCH_UPSERT_CHUNKS")
+    batch_upsert_max_pending: int = Field(default=32, alias="BATCH_UPSERT_MAX_PENDING")
+    batch_upsert_max_line_bytes: int = Field(default=2_000_000, alias="BATCH_UPSERT_MAX_LINE_BYTES")
+    
+    # Codifica risposte: compressione sopra la soglia (byte), MessagePack su richiesta
+    compression_min_size: int = Field(default=1024, alias="COMPRESSION_MIN_SIZE")
+    compression_gzip_level: int = Field(default=6, alias="COMPRESSION_GZIP_LEVEL")
+    compression_brotli_quality: int = Field(default=4, alias="COMPRESSION_BROTLI_QUALITY")
+    msgpack_enabled: bool = Field(default=True, alias="MSGPACK_ENABLED")
+    
+    # Provider calls
+    http_max_connections: int = Field(default=100, alias="HTTP_MAX_CONNECTIONS")
+    http_max_keepalive_connections: int = Field(default=20, alias="HTTP_MAX_KEEPALIVE_CONNECTIONS")
+    http_timeout: float = Field(default=60.0, alias="HTTP_TIMEOUT")
+    coalesce_provider_calls: bool = Field(default=True, alias="COALESCE_PROVIDER_CALLS")
+    
+    # OpenAI rate limit (valori iniziali, poi allineati dagli header x-ratelimit-*)
+    openai_rpm_limit: int = Field(default=3000, alias="OPENAI_RPM_LIMIT")
+    openai_tpm_limit: int = Field(default=1_000_000, alias="OPENAI_TPM_LIMIT")
+    openai_interactive_reserve: float = Field(default=0.2, alias="OPENAI_INTERACTIVE_RESERVE")
+    openai_max_retries: int = Field(default=5, alias="OPENAI_MAX_RETRIES")
+    openai_backoff_base: float = Field(default=0.5, alias="OPENAI_BACKOFF_BASE")
+    openai_backoff_max: float = Field(default=30.0, alias="OPENAI_BACKOFF_MAX")
+    
+    # Query vettoriali: hedging e circuit breaker
+    vector_hedging_enabled: bool = Field(default=True, alias="VECTOR_HEDGING_ENABLED")
+    vector_hedge_percentile: float = Field(default=95.0, alias="VECTOR_HEDGE_PERCENTILE")
+    vector_hedge_min_delay: float = Field(default=0.05, alias="VECTOR_HEDGE_MIN_DELAY")
+    vector_hedge_max_delay: float = Field(default=2.0, alias="VECTOR_HEDGE_MAX_DELAY")
+    vector_breaker_failures: int = Field(default=5, alias="VECTOR_BREAKER_FAILURES")
+    vector_breaker_reset_timeout: float = Field(default=30.0, alias="VECTOR_BREAKER_RESET_TIMEOUT")
+    
+    # Avvio: warm-up in background dei client e budget per il cold start
+    warmup_on_startup: bool = Field(default=True, alias="WARMUP_ON_STARTUP")
+    ocr_warmup_language: str = Field(default="ita+eng", alias="OCR_WARMUP_LANGUAGE")
+    cold_start_budget_seconds: float = Field(default=15.0, alias="COLD_START_BUDGET_SECONDS")
+    
+    # Tracing (exporter JSON locale)
+    tracing_enabled: bool = Field(default=False, alias="TRACING_ENABLED")
+    trace_dir: str = Field(default="traces", alias="TRACE_DIR")
+    trace_sample_rate: float = Field(default=1.0, alias="TRACE_SAMPLE_RATE")
+    
+    # Logging: handler a coda, rate limit e campionamento per logger (sotto WARNING)
+    log_level: str = Field(default="INFO", alias="LOG_LEVEL")
+    log_format: str = Field(default="json", alias="LOG_FORMAT")
+    log_queue_size: int = Field(default=10000, alias="LOG_QUEUE_SIZE")
+    log_rate_limit: float = Field(default=50.0, alias="LOG_RATE_LIMIT")
+    log_rate_burst: float = Field(default=200.0, alias="LOG_RATE_BURST")
+    log_sample_rate: float = Field(default=1.0, alias="LOG_SAMPLE_RATE")
+    log_logger_sample_rates: str = Field(default="", alias="LOG_LOGGER_SAMPLE_RATES")
+    
+    # Profiling su richiesta (attivo solo con chiave admin configurata)
+    admin_api_key: Optional[str] = Field(default=None, alias="ADMIN_API_KEY")
+    profile_dir: str = Field(default="profiles", alias="PROFILE_DIR")
+    profile_sample_interval: float = Field(default=0.001, alias="PROFILE_SAMPLE_INTERVAL")
+    
     # Environment
     environment: str = "development"
     debug: bool = True
@@ -29,6 +162,31 @@ class Settings(BaseSettings):
         # Fix per environment Pinecone
         if self.pinecone_region == "us-east-1":
             self.pinecone_region = "us-east-1-aws"
+        
+        # Dimensione e batch dal registro dei modelli, verificati contro i limiti del modello
+        model = self.embedding_spec
+        if self.embedding_dimension is None:
+            self.embedding_dimension = model.dimension
+        elif self.embedding_dimension != model.dimension and not (
+            model.reducible and 0 < self.embedding_dimension < model.dimension
+        ):
+            raise ValueError(
+                f"EMBEDDING_DIMENSION={self.embedding_dimension} non supportata da {model.name} "
+                f"(nativa {model.dimension}{', riducibile' if model.reducible else ''})"
+            )
+        if self.embedding_batch_size is None:
+            self.embedding_batch_size = model.max_batch_inputs
+        self.embedding_batch_size = max(1, min(self.embedding_batch_size, model.max_batch_inputs))
+
+    @property
+    def embedding_spec(self) -> EmbeddingModel:
+        """Voce del registro per EMBEDDING_MODEL"""
+        try:
+            return EMBEDDING_MODELS[self.embedding_model]
+        except KeyError:
+            raise ValueError(
+                f"EMBEDDING_MODEL={self.embedding_model} sconosciuto (registrati: {', '.join(EMBEDDING_MODELS)})"
+            ) from None
 
 # Istanza globale
 settings = Settings()
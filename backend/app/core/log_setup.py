@@ -0,0 +1,263 @@
+"""
+Configurazione del logging applicativo
+Handler a coda con scrittura in un thread di background, record strutturati (JSON),
+rate limiting e campionamento per logger, log dei payload solo per le richieste
+con debug attivo (header X-Debug-Log + X-Admin-Key)
+"""
+
+import atexit
+import copy
+import hmac
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from app.core.config import settings
+from app.core.metrics import current_route
+from app.core.tracing import current_trace_id
+
+# Debug dei payload attivo per la richiesta corrente
+_request_debug: ContextVar[bool] = ContextVar("request_debug", default=False)
+
+# Attributi standard di LogRecord: tutto il resto arriva da extra={...}
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional["DroppingQueueHandler"] = None
+
+
+def request_debug_enabled() -> bool:
+    return _request_debug.get()
+
+
+def log_payload(logger: logging.Logger, msg: str, *args):
+    """
+    Log verboso (contenuti, anteprime, statistiche complete): emesso solo se la
+    richiesta corrente ha il debug attivo, senza formattare nulla altrimenti
+    """
+    if _request_debug.get():
+        logger.info(msg, *args, extra={"payload": True})
+
+
+class ContextFilter(logging.Filter):
+    """Aggiunge al record trace id e route della richiesta (letti nel thread chiamante)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = current_trace_id()
+        record.route = current_route.get()
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Token bucket e campionamento per logger sui livelli sotto WARNING.
+    WARNING ed errori passano sempre; i record scartati sono contati.
+    """
+
+    def __init__(self, rate: float, burst: float, sample_rate: float,
+                 logger_sample_rates: Optional[Dict[str, float]] = None):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.sample_rate = sample_rate
+        self.logger_sample_rates = logger_sample_rates or {}
+        self._buckets: Dict[str, list] = {}
+        self._lock = threading.Lock()
+        self.dropped: Dict[str, int] = {}
+
+    def _sample_rate(self, name: str) -> float:
+        # Regola più specifica: "app.services" vale anche per "app.services.rag"
+        best, rate = -1, self.sample_rate
+        for prefix, value in self.logger_sample_rates.items():
+            if (name == prefix or name.startswith(prefix + ".")) and len(prefix) > best:
+                best, rate = len(prefix), value
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or getattr(record, "payload", False):
+            return True
+
+        sample_rate = self._sample_rate(record.name)
+        if sample_rate < 1.0 and random.random() >= sample_rate:
+            self._drop(record.name)
+            return False
+
+        if self.rate > 0:
+            now = time.monotonic()
+            with self._lock:
+                bucket = self._buckets.setdefault(record.name, [self.burst, now])
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+                if bucket[0] < 1:
+                    self._dropped_locked(record.name)
+                    return False
+                bucket[0] -= 1
+        return True
+
+    def _drop(self, name: str):
+        with self._lock:
+            self._dropped_locked(name)
+
+    def _dropped_locked(self, name: str):
+        self.dropped[name] = self.dropped.get(name, 0) + 1
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler con coda limitata: se piena scarta il record invece di bloccare"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Messaggio e traceback risolti qui (gli argomenti potrebbero cambiare),
+        # la serializzazione avviene nel thread del listener
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """Un oggetto JSON per riga: campi standard, contesto della richiesta ed extra"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Formato leggibile per lo sviluppo locale, con trace id se presente"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        trace_id = getattr(record, "trace_id", None)
+        return f"{line} [trace={trace_id}]" if trace_id else line
+
+
+def parse_logger_rates(value: str) -> Dict[str, float]:
+    """'app.services.rag=0.1,app.api=0.5' → {'app.services.rag': 0.1, 'app.api': 0.5}"""
+    rates = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, _, rate = item.partition("=")
+        rates[name.strip()] = float(rate)
+    return rates
+
+
+def setup_logging():
+    """
+    Installa l'handler a coda sul logger "app". La scrittura su stdout avviene
+    nel thread del QueueListener; le richieste pagano solo filtro e accodamento.
+    """
+    global _listener, _queue_handler
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter() if settings.log_format == "json" else TextFormatter())
+
+    _queue_handler = DroppingQueueHandler(queue.Queue(maxsize=settings.log_queue_size))
+    _queue_handler.addFilter(RateLimitFilter(
+        rate=settings.log_rate_limit,
+        burst=settings.log_rate_burst,
+        sample_rate=settings.log_sample_rate,
+        logger_sample_rates=parse_logger_rates(settings.log_logger_sample_rates),
+    ))
+    _queue_handler.addFilter(ContextFilter())
+
+    app_logger = logging.getLogger("app")
+    app_logger.setLevel(settings.log_level.upper())
+    app_logger.addHandler(_queue_handler)
+    app_logger.propagate = False
+
+    _listener = logging.handlers.QueueListener(_queue_handler.queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Svuota la coda e ferma il thread di scrittura"""
+    global _listener, _queue_handler
+    if _listener is None:
+        return
+    _listener.stop()
+    logging.getLogger("app").removeHandler(_queue_handler)
+    _listener = None
+    _queue_handler = None
+
+
+def logging_stats() -> Dict[str, object]:
+    """Record scartati per rate limit/campionamento (per logger) e per coda piena"""
+    if _queue_handler is None:
+        return {}
+    rate_filter = next(f for f in _queue_handler.filters if isinstance(f, RateLimitFilter))
+    return {
+        "queue_size": _queue_handler.queue.qsize(),
+        "dropped_queue_full": _queue_handler.dropped,
+        "dropped_by_logger": dict(rate_filter.dropped),
+    }
+
+
+class RequestDebugMiddleware:
+    """
+    Middleware ASGI: con X-Debug-Log: 1 e X-Admin-Key valida attiva i log dei
+    payload per la sola richiesta. Installato solo se ADMIN_API_KEY è configurata.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        if headers.get(b"x-debug-log") not in (b"1", b"true"):
+            await self.app(scope, receive, send)
+            return
+
+        admin_key = headers.get(b"x-admin-key", b"")
+        if not hmac.compare_digest(admin_key, (settings.admin_api_key or "").encode()):
+            logging.getLogger(__name__).warning(f"⚠️ Debug log richiesto senza chiave admin valida: {scope['path']}")
+            await self.app(scope, receive, send)
+            return
+
+        token = _request_debug.set(True)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_debug.reset(token)
@@ -0,0 +1,142 @@
+"""
+Metriche Prometheus
+Latenze per stage della pipeline, contatori per route/backend e gauge di carico
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterator
+
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+from starlette.routing import Match
+
+# Template della route in corso (es. /v1/documents/{user_id}), impostato dal middleware
+current_route: ContextVar[str] = ContextVar("current_route", default="none")
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+STAGE_DURATION = Histogram(
+    "neuramind_stage_duration_seconds",
+    "Durata degli stage della pipeline (ocr, chunking, embedding, vector_upsert, vector_query, llm_generation)",
+    ["stage", "route", "backend"],
+    buckets=_LATENCY_BUCKETS,
+)
+REQUEST_DURATION = Histogram(
+    "neuramind_request_duration_seconds",
+    "Durata delle richieste HTTP",
+    ["route", "method", "status"],
+    buckets=_LATENCY_BUCKETS,
+)
+TOKENS = Counter(
+    "neuramind_tokens_total",
+    "Token consumati presso i provider",
+    ["kind", "route", "backend"],
+)
+CHUNKS = Counter(
+    "neuramind_chunks_total",
+    "Chunk indicizzati",
+    ["route", "backend"],
+)
+CACHE_HITS = Counter(
+    "neuramind_cache_hits_total",
+    "Chiamate servite senza nuova richiesta al provider",
+    ["cache", "route", "backend"],
+)
+PROVIDER_ERRORS = Counter(
+    "neuramind_provider_errors_total",
+    "Errori restituiti dai provider",
+    ["route", "backend", "error"],
+)
+IN_FLIGHT = Gauge(
+    "neuramind_requests_in_flight",
+    "Richieste HTTP in corso",
+    ["route"],
+)
+QUEUE_DEPTH = Gauge(
+    "neuramind_queue_depth",
+    "Richieste in attesa nelle code interne",
+    ["queue"],
+)
+
+
+@contextmanager
+def observe_stage(stage: str, backend: str = "internal") -> Iterator[None]:
+    """Misura la durata di uno stage; usabile anche attorno ad await"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_DURATION.labels(stage, current_route.get(), backend).observe(time.perf_counter() - start)
+
+
+def record_tokens(kind: str, backend: str, count: int):
+    if count:
+        TOKENS.labels(kind, current_route.get(), backend).inc(count)
+
+
+def record_chunks(backend: str, count: int):
+    CHUNKS.labels(current_route.get(), backend).inc(count)
+
+
+def record_cache_hit(cache: str, backend: str):
+    CACHE_HITS.labels(cache, current_route.get(), backend).inc()
+
+
+def record_provider_error(backend: str, error: Exception):
+    PROVIDER_ERRORS.labels(current_route.get(), backend, error.__class__.__name__).inc()
+
+
+def register_queue(queue: str, depth: Callable[[], float]):
+    """Collega una coda interna al gauge queue_depth (letto a ogni scrape)"""
+    QUEUE_DEPTH.labels(queue).set_function(depth)
+
+
+def render_metrics():
+    """Body e content-type per l'endpoint /metrics"""
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI: risolve il template della route, aggiorna il gauge
+    delle richieste in corso e misura la durata complessiva
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    def _route_template(self, scope) -> str:
+        router = scope["app"].router if "app" in scope else None
+        if router is not None:
+            for route in router.routes:
+                match, _ = route.matches(scope)
+                if match == Match.FULL:
+                    return getattr(route, "path", scope["path"])
+        return "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route = self._route_template(scope)
+        token = current_route.set(route)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        in_flight = IN_FLIGHT.labels(route)
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight.dec()
+            REQUEST_DURATION.labels(route, scope["method"], str(status["code"])).observe(
+                time.perf_counter() - start
+            )
+            current_route.reset(token)
@@ -0,0 +1,216 @@
+"""
+Profiling su richiesta della singola chiamata HTTP
+Attivato da header X-Profile (o query ?profile=) insieme alla chiave admin;
+il profilo viene scritto su disco con nome <request_id>.folded / .prof.
+La finestra misurata è dell'intero processo: il lavoro di altre richieste concorrenti
+finisce nello stesso profilo, e <request_id>.json registra quante ce n'erano.
+"""
+
+import asyncio
+import cProfile
+import hmac
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import uuid
+from collections import Counter
+from typing import Optional, Tuple
+from urllib.parse import parse_qs
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MODES = ("sample", "cprofile")
+
+# Foglie dello stack che indicano un thread in attesa (non lavoro utile)
+_IDLE_LEAVES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+    ("tracing.py", "_run"),
+}
+
+_REQUEST_ID_RE = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+
+
+class StackSampler:
+    """
+    Profiler a campionamento: un thread legge periodicamente gli stack di tutti
+    i thread attivi e li accumula in formato "folded" (flamegraph.pl, speedscope).
+    Cattura anche il lavoro spostato nel threadpool (OCR).
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = self._stack(frame)
+                if stack is not None:
+                    self.samples[";".join([names.get(thread_id, str(thread_id))] + stack)] += 1
+
+    @staticmethod
+    def _stack(frame) -> Optional[list]:
+        leaf = frame.f_code
+        if (os.path.basename(leaf.co_filename), leaf.co_name) in _IDLE_LEAVES:
+            return None
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        stack.reverse()
+        return stack
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+def _profile_request(scope) -> Tuple[Optional[str], Optional[str]]:
+    """Modalità di profiling richiesta e request id, se la richiesta è autorizzata"""
+    headers = dict(scope.get("headers") or [])
+    mode = headers.get(b"x-profile", b"").decode("latin-1")
+    query_string = scope.get("query_string", b"")
+    if not mode and b"profile=" in query_string:
+        mode = parse_qs(query_string.decode("latin-1")).get("profile", [""])[0]
+    if not mode:
+        return None, None
+
+    admin_key = headers.get(b"x-admin-key", b"")
+    if not hmac.compare_digest(admin_key, (settings.admin_api_key or "").encode()):
+        logger.warning(f"⚠️ Profiling richiesto senza chiave admin valida: {scope['path']}")
+        return None, None
+
+    mode = "sample" if mode in ("1", "true") else mode
+    if mode not in PROFILE_MODES:
+        logger.warning(f"⚠️ Modalità di profiling sconosciuta: {mode}")
+        return None, None
+
+    request_id = headers.get(b"x-request-id", b"").decode("latin-1")
+    if not _REQUEST_ID_RE.match(request_id):
+        request_id = uuid.uuid4().hex
+    return mode, request_id
+
+
+class ProfilingMiddleware:
+    """
+    Middleware ASGI: profila le sole richieste con X-Profile: sample|cprofile
+    (o ?profile=1) e X-Admin-Key valida. Un profilo alla volta per processo.
+    cProfile e il campionatore vedono tutto il thread dell'event loop (e i thread del
+    processo): il profilo è contaminato se altre richieste sono in corso nella finestra,
+    e l'header X-Profile-Scope: process lo ricorda.
+    Installato solo se ADMIN_API_KEY è configurata.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._busy = False
+        # Richieste HTTP in corso e massimo di altre richieste durante il profilo attivo
+        self._in_flight = 0
+        self._window_others = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        self._in_flight += 1
+        if self._busy:
+            self._window_others = max(self._window_others, self._in_flight - 1)
+        try:
+            await self._handle(scope, receive, send)
+        finally:
+            self._in_flight -= 1
+
+    async def _handle(self, scope, receive, send):
+        mode, request_id = _profile_request(scope)
+        if mode is None:
+            await self.app(scope, receive, send)
+            return
+
+        if self._busy:
+            logger.warning(f"⚠️ Profiling già in corso, richiesta {request_id} non profilata")
+            await self.app(scope, receive, self._with_header(send, b"x-profile", b"busy"))
+            return
+
+        self._busy = True
+        self._window_others = self._in_flight - 1
+        try:
+            send = self._with_header(send, b"x-profile-id", request_id.encode())
+            send = self._with_header(send, b"x-profile-scope", b"process")
+            if mode == "cprofile":
+                # Deterministico: solo il thread dell'event loop
+                profiler = cProfile.Profile()
+                profiler.enable()
+                try:
+                    await self.app(scope, receive, send)
+                finally:
+                    profiler.disable()
+                path = os.path.join(settings.profile_dir, f"{request_id}.prof")
+                await asyncio.to_thread(self._write_pstats, profiler, path)
+            else:
+                sampler = StackSampler(settings.profile_sample_interval)
+                sampler.start()
+                try:
+                    await self.app(scope, receive, send)
+                finally:
+                    sampler.stop()
+                path = os.path.join(settings.profile_dir, f"{request_id}.folded")
+                await asyncio.to_thread(self._write_text, sampler.folded(), path)
+            info = {
+                "request_id": request_id,
+                "mode": mode,
+                "method": scope["method"],
+                "path": scope["path"],
+                "scope": "process",
+                "concurrent_requests": self._window_others,
+                "contaminated": self._window_others > 0,
+            }
+            info_path = os.path.join(settings.profile_dir, f"{request_id}.json")
+            await asyncio.to_thread(self._write_text, json.dumps(info, indent=2), info_path)
+            if info["contaminated"]:
+                logger.warning(f"⚠️ Profilo {request_id} contaminato: {self._window_others} altre richieste in corso")
+            logger.info(f"🔬 Profilo {mode} di {scope['method']} {scope['path']} salvato in {path}")
+        finally:
+            self._busy = False
+
+    @staticmethod
+    def _with_header(send, name: bytes, value: bytes):
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(name, value)]
+            await send(message)
+        return send_wrapper
+
+    @staticmethod
+    def _write_pstats(profiler: cProfile.Profile, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        profiler.dump_stats(path)
+
+    @staticmethod
+    def _write_text(content: str, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
@@ -0,0 +1,213 @@
+"""
+Codifica delle risposte
+JSON con orjson, MessagePack per i client che lo chiedono (Accept: application/msgpack)
+e compressione brotli o gzip negoziata con Accept-Encoding sopra una soglia di dimensione
+"""
+
+import json
+import zlib
+from contextvars import ContextVar
+from typing import Any, List, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse, StreamingResponse
+
+from app.core.config import settings
+
+# orjson, brotli e msgpack opzionali: senza, JSON della libreria standard e solo gzip
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+
+# Tipi di contenuto che vale la pena comprimere
+_COMPRESSIBLE_TYPES = ("text/", "application/json", "application/msgpack", "application/javascript",
+                       "application/xml", "application/problem+json")
+
+# Il client della richiesta corrente ha chiesto MessagePack
+_msgpack_requested: ContextVar[bool] = ContextVar("msgpack_requested", default=False)
+
+
+class APIResponse(JSONResponse):
+    """
+    Risposta predefinita dell'API: JSON serializzato con orjson (compatto, UTF-8),
+    o MessagePack se negoziato dal middleware per la richiesta corrente
+    """
+
+    def render(self, content: Any) -> bytes:
+        if msgpack is not None and _msgpack_requested.get():
+            self.media_type = MSGPACK_MEDIA_TYPES[0]
+            return msgpack.packb(content, use_bin_type=True)
+        if orjson is not None:
+            return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+        return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    """
+    Risposta in streaming mentre il corpo della richiesta è ancora in lettura
+    (NDJSON in ingresso e in uscita). StreamingResponse ascolta la disconnessione con
+    receive() in parallelo e consumerebbe i messaggi del corpo: qui la disconnessione
+    arriva da request.stream() (ClientDisconnect)
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+def _parse_accept(value: str) -> List[Tuple[str, float]]:
+    """'br;q=1.0, gzip;q=0.8, *;q=0' → [('br', 1.0), ('gzip', 0.8), ('*', 0.0)]"""
+    items = []
+    for part in value.split(","):
+        name, *params = [p.strip() for p in part.split(";")]
+        if not name:
+            continue
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        items.append((name.lower(), quality))
+    return items
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Codifica preferita tra quelle supportate ('br', 'gzip'), None per nessuna"""
+    accepted = dict(_parse_accept(accept_encoding))
+    wildcard = accepted.get("*", 0.0)
+    candidates = [("br", 2), ("gzip", 1)] if brotli is not None else [("gzip", 1)]
+    best = max(
+        ((accepted.get(name, wildcard), rank, name) for name, rank in candidates),
+        default=(0.0, 0, None),
+    )
+    return best[2] if best[0] > 0 else None
+
+
+def accepts_msgpack(accept: str) -> bool:
+    """True se il client preferisce MessagePack a JSON"""
+    accepted = dict(_parse_accept(accept))
+    msgpack_quality = max(accepted.get(media_type, 0.0) for media_type in MSGPACK_MEDIA_TYPES)
+    return msgpack_quality > 0 and msgpack_quality >= accepted.get("application/json", 0.0)
+
+
+class _Compressor:
+    """Interfaccia comune a zlib (gzip) e brotli, usata anche per le risposte in streaming"""
+
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            compressor = brotli.Compressor(quality=settings.compression_brotli_quality)
+            self.compress, self.finish = compressor.process, compressor.finish
+        else:
+            compressor = zlib.compressobj(settings.compression_gzip_level, zlib.DEFLATED, 31)
+            self.compress, self.finish = compressor.compress, compressor.flush
+
+
+class ResponseEncodingMiddleware:
+    """
+    Middleware ASGI: sceglie il formato del corpo (JSON o MessagePack) e comprime
+    le risposte comprimibili sopra COMPRESSION_MIN_SIZE byte con brotli o gzip
+    """
+
+    def __init__(self, app, minimum_size: Optional[int] = None):
+        self.app = app
+        self.minimum_size = settings.compression_min_size if minimum_size is None else minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        negotiate_format = msgpack is not None and settings.msgpack_enabled
+        token = _msgpack_requested.set(negotiate_format and accepts_msgpack(headers.get("accept", "")))
+        encoding = choose_encoding(headers.get("accept-encoding", ""))
+
+        async def send_with_vary(message):
+            # Il formato del corpo dipende da Accept: le cache devono distinguerlo
+            if message["type"] == "http.response.start":
+                response_headers = MutableHeaders(scope=message)
+                if response_headers.get("content-type", "").startswith(("application/json",) + MSGPACK_MEDIA_TYPES):
+                    response_headers.add_vary_header("Accept")
+            await send(message)
+
+        if negotiate_format:
+            send_next = send_with_vary
+        else:
+            send_next = send
+        if encoding is not None:
+            send_next = _CompressingSender(send_next, encoding, self.minimum_size)
+        try:
+            await self.app(scope, receive, send_next)
+        finally:
+            _msgpack_requested.reset(token)
+
+
+class _CompressingSender:
+    """Trattiene l'inizio della risposta finché il primo blocco del corpo non decide se comprimere"""
+
+    def __init__(self, send, encoding: str, minimum_size: int):
+        self.send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start_message = None
+        self.compressor: Optional[_Compressor] = None
+        self.passthrough = False
+
+    def _compressible(self, headers: MutableHeaders) -> bool:
+        if "content-encoding" in headers:
+            return False
+        content_type = headers.get("content-type", "")
+        return content_type.startswith(_COMPRESSIBLE_TYPES)
+
+    async def __call__(self, message):
+        if message["type"] == "http.response.start":
+            self.start_message = message
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.compressor is None:
+            headers = MutableHeaders(scope=self.start_message)
+            if not self._compressible(headers) or (not more_body and len(body) < self.minimum_size):
+                self.passthrough = True
+                await self.send(self.start_message)
+                await self.send(message)
+                return
+
+            self.compressor = _Compressor(self.encoding)
+            headers["content-encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            if not more_body:
+                body = self.compressor.compress(body) + self.compressor.finish()
+                headers["content-length"] = str(len(body))
+                await self.send(self.start_message)
+                await self.send({"type": "http.response.body", "body": body})
+                return
+            # Streaming: lunghezza non nota in anticipo
+            del headers["content-length"]
+            await self.send(self.start_message)
+
+        body = self.compressor.compress(body)
+        if not more_body:
+            body += self.compressor.finish()
+        await self.send({"type": "http.response.body", "body": body, "more_body": more_body})
@@ -0,0 +1,73 @@
+"""
+Tempi per stage della singola richiesta
+Raccolti in un contesto per-richiesta ed esposti nell'header Server-Timing
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional
+
+from app.core.tracing import span
+
+# Durate (secondi) degli stage della richiesta corrente, in ordine di esecuzione
+_stage_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("stage_timings", default=None)
+
+
+def get_stage_timings() -> Dict[str, float]:
+    """Tempi raccolti finora nella richiesta corrente"""
+    return dict(_stage_timings.get() or {})
+
+
+@contextmanager
+def request_stage(name: str, **attributes) -> Iterator[None]:
+    """
+    Stage della richiesta: apre uno span e somma la durata (wall clock)
+    al tempo dello stage. Stage ripetuti in sequenza si accumulano.
+    """
+    start = time.perf_counter()
+    try:
+        with span(f"stage.{name}", **attributes):
+            yield
+    finally:
+        timings = _stage_timings.get()
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+
+def format_server_timing(timings: Dict[str, float], total: Optional[float] = None) -> str:
+    """Header Server-Timing: 'ocr;dur=640.1, embed;dur=85.3, total;dur=731.0' (ms)"""
+    entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items()]
+    if total is not None:
+        entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+class ServerTimingMiddleware:
+    """Middleware ASGI: aggiunge Server-Timing con i tempi degli stage a ogni risposta"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        token = _stage_timings.set({})
+        timings = _stage_timings.get()
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                header = format_server_timing(timings, time.perf_counter() - start)
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"server-timing", header.encode("latin-1")),
+                    (b"timing-allow-origin", b"*"),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _stage_timings.reset(token)
@@ -0,0 +1,299 @@
+"""
+Tracing a span per le pipeline di upload e chat
+Contesto propagato tra task async, thread e process pool;
+exporter locale che scrive le trace in JSON su disco (nessun collector richiesto)
+"""
+
+import atexit
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import queue
+import random
+import re
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class Span:
+    """Singola operazione temporizzata all'interno di una trace"""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "start", "end", "attributes", "status", "sampled")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], sampled: bool,
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.start = time.time()
+        self.end: Optional[float] = None
+        self.attributes = dict(attributes or {})
+        self.status = "ok"
+        self.sampled = sampled
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "end": self.end,
+            "duration_ms": round((self.end - self.start) * 1000, 3) if self.end else None,
+            "status": self.status,
+            "attributes": self.attributes,
+            "pid": os.getpid(),
+            "thread": threading.current_thread().name,
+        }
+
+
+class JsonFileExporter:
+    """
+    Scrive gli span conclusi come righe JSON in <directory>/<trace_id>.jsonl.
+    La scrittura avviene in un thread di background per non bloccare le richieste.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._queue: "queue.SimpleQueue[Optional[Dict[str, Any]]]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def export(self, span: Span):
+        self._ensure_worker()
+        self._queue.put(span.to_dict())
+
+    def _ensure_worker(self):
+        # Dopo un fork (process pool) il thread del padre non esiste nel figlio
+        if self._thread is None or self._pid != os.getpid():
+            with self._lock:
+                if self._thread is None or self._pid != os.getpid():
+                    self._pid = os.getpid()
+                    self._queue = queue.SimpleQueue()
+                    self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            record = self._queue.get()
+            if record is None:
+                break
+            self._write([record] + self._drain())
+
+    def _drain(self):
+        records = []
+        while True:
+            try:
+                record = self._queue.get_nowait()
+            except queue.Empty:
+                return records
+            if record is not None:
+                records.append(record)
+
+    def _write(self, records):
+        by_trace: Dict[str, list] = {}
+        for record in records:
+            by_trace.setdefault(record["trace_id"], []).append(record)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            for trace_id, spans in by_trace.items():
+                if not TRACE_ID_RE.fullmatch(trace_id):
+                    logger.warning("Trace con id non valido scartata: %r", trace_id[:64])
+                    continue
+                lines = "".join(json.dumps(s, default=str) + "\n" for s in spans)
+                with open(os.path.join(self.directory, f"{trace_id}.jsonl"), "a", encoding="utf-8") as f:
+                    f.write(lines)
+        except Exception as e:
+            logger.warning(f"Errore scrittura trace: {e}")
+
+    def flush(self):
+        """Scrive subito gli span in coda (usato a fine processo e nei worker dei pool)"""
+        records = self._drain()
+        if records:
+            self._write(records)
+
+
+# Formato W3C: versione, trace_id (32 hex), span_id (16 hex), flag (tutto minuscolo)
+_TRACEPARENT_RE = re.compile(r"([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})")
+TRACE_ID_RE = re.compile(r"[0-9a-f]{32}")
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+_exporter = JsonFileExporter(settings.trace_dir)
+atexit.register(_exporter.flush)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def current_trace_id() -> Optional[str]:
+    span = _current_span.get()
+    return span.trace_id if span else None
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Optional[Span]]:
+    """
+    Apre uno span figlio di quello corrente. Funziona anche attorno ad await:
+    ogni task asyncio ha la propria copia del contesto.
+    """
+    if not settings.tracing_enabled:
+        yield None
+        return
+
+    parent = _current_span.get()
+    if parent is not None:
+        new_span = Span(name, parent.trace_id, parent.span_id, parent.sampled, attributes)
+    else:
+        sampled = random.random() < settings.trace_sample_rate
+        new_span = Span(name, secrets.token_hex(16), None, sampled, attributes)
+
+    token = _current_span.set(new_span)
+    try:
+        yield new_span
+    except BaseException as e:
+        new_span.status = "error"
+        new_span.set_attribute("error", f"{e.__class__.__name__}: {e}")
+        raise
+    finally:
+        new_span.end = time.time()
+        _current_span.reset(token)
+        if new_span.sampled:
+            _exporter.export(new_span)
+
+
+def traced(name: Optional[str] = None):
+    """Decoratore: esegue la funzione (sync o async) dentro uno span"""
+    def decorator(fn: Callable) -> Callable:
+        span_name = name or fn.__qualname__
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+# ========================
+# Propagazione tra thread e processi
+# ========================
+
+def wrap_context(fn: Callable) -> Callable:
+    """Lega fn al contesto corrente, per thread pool che non lo copiano da soli"""
+    ctx = contextvars.copy_context()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        return ctx.run(fn, *args, **kwargs)
+    return wrapper
+
+
+def capture_context() -> Optional[Dict[str, Any]]:
+    """Contesto serializzabile da passare a un altro processo (o a un thread di un executor)"""
+    parent = _current_span.get()
+    if parent is None:
+        return None
+    return {"trace_id": parent.trace_id, "span_id": parent.span_id, "sampled": parent.sampled,
+            "pid": os.getpid()}
+
+
+def run_with_context(carrier: Optional[Dict[str, Any]], fn: Callable, *args, **kwargs) -> Any:
+    """
+    Esegue fn in un processo figlio (o nel thread di un executor) come continuazione
+    della trace del padre, dentro uno span col nome di fn.
+    Uso: executor.submit(run_with_context, capture_context(), fn, *args)
+    """
+    if not carrier or not settings.tracing_enabled:
+        return fn(*args, **kwargs)
+
+    remote_parent = Span("remote", carrier["trace_id"], None, carrier["sampled"])
+    remote_parent.span_id = carrier["span_id"]
+    token = _current_span.set(remote_parent)
+    try:
+        with span(getattr(fn, "__qualname__", "process_task"), pid=os.getpid()):
+            return fn(*args, **kwargs)
+    finally:
+        _current_span.reset(token)
+        # Nel processo del padre scrive già il thread dell'exporter
+        if carrier.get("pid") != os.getpid():
+            _exporter.flush()
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[Dict[str, Any]]:
+    """
+    Header W3C traceparent (00-<trace_id>-<span_id>-<flags>) → carrier.
+    Header non valido (formato, id tutti a zero, versione ff): None, e la richiesta
+    apre una trace nuova. Il trace_id diventa un nome di file: solo esadecimale.
+    """
+    if not header:
+        return None
+    match = _TRACEPARENT_RE.fullmatch(header.strip())
+    if not match:
+        return None
+    version, trace_id, span_id, flags = match.groups()
+    if version == "ff" or trace_id == "0" * 32 or span_id == "0" * 16:
+        return None
+    return {"trace_id": trace_id, "span_id": span_id, "sampled": bool(int(flags, 16) & 1)}
+
+
+class TracingMiddleware:
+    """
+    Middleware ASGI: apre lo span radice della richiesta (continuando un eventuale
+    traceparent del client) e restituisce l'id della trace nell'header X-Trace-Id
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.tracing_enabled:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        carrier = parse_traceparent(headers.get(b"traceparent", b"").decode("latin-1"))
+        token = None
+        if carrier:
+            remote_parent = Span("remote", carrier["trace_id"], None, carrier["sampled"])
+            remote_parent.span_id = carrier["span_id"]
+            token = _current_span.set(remote_parent)
+
+        try:
+            with span(f"{scope['method']} {scope['path']}", method=scope["method"], path=scope["path"]) as root:
+                async def send_wrapper(message):
+                    if message["type"] == "http.response.start":
+                        root.set_attribute("status_code", message["status"])
+                        message.setdefault("headers", [])
+                        message["headers"] = list(message["headers"]) + [
+                            (b"x-trace-id", root.trace_id.encode())
+                        ]
+                    await send(message)
+
+                await self.app(scope, receive, send_wrapper)
+        finally:
+            if token is not None:
+                _current_span.reset(token)
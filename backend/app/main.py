@@ -1,12 +1,50 @@
+import time
+_import_started = time.perf_counter()
+
+import asyncio
 import os
-from fastapi import FastAPI
+from contextlib import asynccontextmanager, suppress
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.routes import router
+from app.core.config import settings
+from app.core.log_setup import RequestDebugMiddleware, setup_logging, shutdown_logging
+from app.core.metrics import MetricsMiddleware, render_metrics
+from app.core.profiling import ProfilingMiddleware
+from app.core.responses import APIResponse, ResponseEncodingMiddleware
+from app.core.timing import ServerTimingMiddleware
+from app.core.tracing import TracingMiddleware
+from app.services.providers import close_providers
+from app.services.warmup import readiness, warm_up
+
+# Handler di logging a coda (scrittura in background)
+setup_logging()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    setup_logging()
+    # Warm-up in background: il server accetta subito richieste, /ready segnala quando è pronto
+    warmup_task = None
+    if settings.warmup_on_startup:
+        warmup_task = asyncio.create_task(warm_up())
+    else:
+        readiness.skipped = True
+    yield
+    if warmup_task is not None:
+        warmup_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await warmup_task
+    # Chiude i pool di connessioni condivisi
+    await close_providers()
+    # Scrive i log ancora in coda
+    shutdown_logging()
 
 app = FastAPI(
     title="NeuraMind API",
     description="AI Assistant with RAG capabilities",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=APIResponse
 )
 
 # CORS per frontend
@@ -16,8 +54,27 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Trace-Id", "Content-Encoding"],
 )
 
+# Formato del corpo (JSON/MessagePack) e compressione brotli/gzip
+app.add_middleware(ResponseEncodingMiddleware)
+
+# Header Server-Timing con i tempi per stage
+app.add_middleware(ServerTimingMiddleware)
+
+# Span radice per richiesta (interno alle metriche, che impostano la route)
+app.add_middleware(TracingMiddleware)
+
+# Metriche per route (in-flight e durata richieste)
+app.add_middleware(MetricsMiddleware)
+
+# Profiling della singola richiesta (X-Profile + X-Admin-Key); senza chiave admin non è installato
+if settings.admin_api_key:
+    app.add_middleware(ProfilingMiddleware)
+    # Log dei payload per la singola richiesta (X-Debug-Log + X-Admin-Key)
+    app.add_middleware(RequestDebugMiddleware)
+
 # Include routes
 app.include_router(router, prefix="/v1")
 
@@ -33,6 +90,22 @@ async def root():
 async def health():
     return {"ok": True}
 
+@app.get("/ready")
+async def ready(response: Response):
+    """Readiness: 503 finché il warm-up di provider e OCR non è completato"""
+    state = readiness.snapshot()
+    if not state["ready"]:
+        response.status_code = 503
+    return state
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Metriche in formato Prometheus"""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+readiness.mark_imported(_import_started)
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
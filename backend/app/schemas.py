@@ -1,4 +1,5 @@
-from pydantic import BaseModel, Field
+from datetime import datetime
+from pydantic import BaseModel, ConfigDict, Field
 from typing import Any, List, Dict, Optional
 
 class UpsertIn(BaseModel):
@@ -11,13 +12,63 @@ class UpsertOut(BaseModel):
     ok: bool
     ids: List[str]
 
-class QueryIn(BaseModel):
+class SearchFilters(BaseModel):
+    """Filtri opzionali sui metadati, applicati dall'indice prima del calcolo dei punteggi"""
+    item_id: Optional[str] = None
+    file_type: Optional[str] = None
+    uploaded_after: Optional[datetime] = None
+    uploaded_before: Optional[datetime] = None
+    min_ocr_confidence: Optional[float] = Field(None, ge=0.0, le=1.0)
+
+class QueryIn(SearchFilters):
     user_id: str
     query: str
     top_k: int = 8
+    # Chunk adiacenti (±window) restituiti con ogni risultato
+    window: int = Field(0, ge=0, le=5)
+
+class MatchMetadata(BaseModel):
+    """Metadati di un chunk; eventuali campi aggiuntivi dell'upload sono mantenuti"""
+    model_config = ConfigDict(extra="allow")
+
+    user_id: Optional[str] = None
+    item_id: Optional[str] = None
+    title: Optional[str] = None
+    chunk_index: Optional[int] = None
+    text: Optional[str] = None
+    preview: Optional[str] = None
+    timestamp: Optional[str] = None
+    created_at: Optional[str] = None
+    file_type: Optional[str] = None
+    ocr_confidence: Optional[float] = None
+    upload_date: Optional[str] = None
+    upload_ts: Optional[int] = None
+
+class NeighborChunk(BaseModel):
+    """Chunk adiacente a un risultato, nello stesso documento"""
+    id: str
+    metadata: Optional[MatchMetadata] = None
+
+class QueryMatch(BaseModel):
+    id: str
+    score: float
+    metadata: Optional[MatchMetadata] = None
+    # Solo con window > 0: chunk vicini in ordine di chunk_index, escluso il risultato stesso
+    neighbors: Optional[List[NeighborChunk]] = None
 
 class QueryOut(BaseModel):
-    matches: List[Dict[str, Any]]
+    matches: List[QueryMatch]
+
+class BatchQueryIn(SearchFilters):
+    """Più query dello stesso utente: un solo embedding per tutte"""
+    user_id: str
+    queries: List[str] = Field(..., min_length=1, max_length=100)
+    top_k: int = 8
+    window: int = Field(0, ge=0, le=5)
+
+class BatchQueryOut(BaseModel):
+    """Risultati nello stesso ordine delle query"""
+    results: List[QueryOut]
 
 class AnswerIn(BaseModel):
     query: str
@@ -30,6 +81,14 @@ class AnswerOut(BaseModel):
 # NUOVI SCHEMAS per OCR
 # ========================
 
+class UploadStageTimings(BaseModel):
+    """Durata (secondi) degli stage dell'upload"""
+    quota_check: float = Field(0.0, description="Conteggio dal catalogo in memoria (nessuna lettura dell'indice); l'eliminazione dei più vecchi avviene in background")
+    ocr: float = Field(0.0, description="Estrazione testo")
+    chunk: float = Field(0.0, description="Suddivisione in chunk")
+    embed: float = Field(0.0, description="Creazione embeddings")
+    upsert: float = Field(0.0, description="Salvataggio vettori")
+
 class DocumentUploadOut(BaseModel):
     """Response per upload documento"""
     success: bool
@@ -39,6 +98,7 @@ class DocumentUploadOut(BaseModel):
     chunks_created: int = Field(..., description="Numero di chunk creati")
     ocr_metadata: Dict[str, Any] = Field(..., description="Metadata OCR (confidenza, dimensioni, etc.)")
     processing_time: float = Field(..., description="Tempo di elaborazione in secondi")
+    stage_timings: Optional[UploadStageTimings] = Field(None, description="Tempo per stage in secondi")
 
 class DocumentUploadError(BaseModel):
     """Response per errori upload"""
@@ -48,21 +108,32 @@ class DocumentUploadError(BaseModel):
     details: Optional[Dict[str, Any]] = None
 
 class DocumentInfo(BaseModel):
-    """Info singolo documento"""
+    """Info singolo documento (solo i campi richiesti con fields=)"""
     item_id: str
-    title: str
-    created_at: str
-    upload_date: str
-    text_length: int
-    chunks_count: int
+    title: Optional[str] = None
+    created_at: Optional[str] = None
+    upload_date: Optional[str] = None
+    text_length: Optional[int] = None
+    chunks_count: Optional[int] = None
     ocr_confidence: Optional[float] = None
-    text_preview: str
-    file_type: str
-    user_id: str
+    text_preview: Optional[str] = None
+    file_type: Optional[str] = None
+    user_id: Optional[str] = None
 
 class DocumentListOut(BaseModel):
-    """Lista documenti utente"""
+    """Lista documenti utente, a pagine"""
     user_id: str
     documents: List[DocumentInfo]
     total_count: int
     max_documents: int = 10
+    next_cursor: Optional[str] = None
+
+class DocumentDeleteIn(BaseModel):
+    """Eliminazione di più documenti di un utente"""
+    item_ids: List[str] = Field(..., min_length=1, max_length=100)
+
+class DocumentDeleteOut(BaseModel):
+    """Esito eliminazione: i documenti spariscono subito, l'indice viene ripulito in background"""
+    user_id: str
+    deleted: List[str]
+    not_found: List[str]
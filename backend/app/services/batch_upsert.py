@@ -0,0 +1,180 @@
+"""
+Embed-upsert in batch da un corpo NDJSON in streaming
+Ogni riga è un documento UpsertIn; i chunk di più documenti condividono le chiamate
+di embedding e di upsert, e per ogni documento viene emessa una riga di risultato
+appena il suo blocco è indicizzato.
+
+La memoria non dipende dal numero di documenti: la lettura del corpo si ferma quando
+i documenti in attesa sono BATCH_UPSERT_MAX_PENDING, e ogni riga è limitata a
+BATCH_UPSERT_MAX_LINE_BYTES byte.
+"""
+
+import asyncio
+import json
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from pydantic import ValidationError
+
+from app.core.config import settings
+from app.core.metrics import observe_stage
+from app.schemas import UpsertIn
+from app.services.chunking import chunk_text
+from app.services.document_service import document_service
+from app.services.providers import get_embedding_service
+from app.services.rag import chunk_vectors, upsert_user_vectors
+from app.services.rate_limiter import PRIORITY_BATCH
+
+logger = logging.getLogger(__name__)
+
+_END = object()
+
+
+class BatchUpsert:
+    """Lettura delle righe, chunking e indicizzazione a blocchi in parallelo alla lettura"""
+
+    def __init__(self, batch_chunks: Optional[int] = None, max_pending: Optional[int] = None,
+                 max_line_bytes: Optional[int] = None):
+        self.batch_chunks = batch_chunks or settings.batch_upsert_chunks
+        self.max_pending = max_pending or settings.batch_upsert_max_pending
+        self.max_line_bytes = max_line_bytes or settings.batch_upsert_max_line_bytes
+        self.batches = 0
+
+    async def _lines(self, body: AsyncIterator[bytes]) -> AsyncIterator[tuple]:
+        """(numero di riga, contenuto o None se troppo lunga) per le righe non vuote"""
+        buffer = b""
+        number = 0
+        skipping = False
+        async for data in body:
+            buffer += data
+            while True:
+                newline = buffer.find(b"\n")
+                if newline < 0:
+                    break
+                line, buffer = buffer[:newline], buffer[newline + 1:]
+                number += 1
+                if skipping:
+                    skipping = False
+                    yield number, None
+                elif line.strip():
+                    yield number, line
+            if not skipping and len(buffer) > self.max_line_bytes:
+                # Riga troppo lunga: scartata fino al prossimo a capo senza tenerla in memoria
+                skipping = True
+            if skipping:
+                buffer = b""
+        if skipping:
+            yield number + 1, None
+        elif buffer.strip():
+            yield number + 1, buffer
+
+    def _parse(self, number: int, line: Optional[bytes]) -> Dict[str, Any]:
+        if line is None:
+            raise ValueError(f"riga oltre {self.max_line_bytes} byte")
+        document = UpsertIn.model_validate(json.loads(line))
+        with observe_stage("chunking"):
+            chunks = chunk_text(document.text, chunk_size=1000, overlap=150)
+        return {"line": number, "document": document, "chunks": chunks}
+
+    async def _read(self, body: AsyncIterator[bytes], pending: asyncio.Queue, results: asyncio.Queue):
+        try:
+            async for number, line in self._lines(body):
+                try:
+                    entry = self._parse(number, line)
+                except (ValueError, ValidationError) as e:
+                    error = e.errors()[0]["msg"] if isinstance(e, ValidationError) else str(e)
+                    await results.put({"line": number, "ok": False, "error": error})
+                    continue
+                await pending.put(entry)
+        finally:
+            await pending.put(_END)
+
+    async def _index(self, entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Un'unica chiamata di embedding per i chunk di tutti i documenti del blocco"""
+        texts = [chunk for entry in entries for chunk in entry["chunks"]]
+        try:
+            embeddings = await get_embedding_service().create_embeddings(texts, priority=PRIORITY_BATCH)
+        except Exception as e:
+            logger.error(f"Errore embedding batch: {e}")
+            return [self._failure(entry, e) for entry in entries]
+        self.batches += 1
+
+        by_user: Dict[str, List[Dict[str, Any]]] = {}
+        offset = 0
+        for entry in entries:
+            document, count = entry["document"], len(entry["chunks"])
+            entry["vectors"] = chunk_vectors(document.user_id, document.item_id, document.title,
+                                             entry["chunks"], embeddings[offset:offset + count])
+            by_user.setdefault(document.user_id, []).append(entry)
+            offset += count
+
+        async def upsert(user_id: str, user_entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+            try:
+                await upsert_user_vectors(user_id, [v for entry in user_entries for v in entry["vectors"]])
+            except Exception as e:
+                logger.error(f"Errore upsert batch per {user_id}: {e}")
+                return [self._failure(entry, e) for entry in user_entries]
+            outcomes = []
+            for entry in user_entries:
+                document = entry["document"]
+                await document_service.register_document(user_id, document.item_id, len(entry["vectors"]),
+                                                         document.title)
+                outcomes.append({"line": entry["line"], "item_id": document.item_id, "ok": True,
+                                 "ids": [vector["id"] for vector in entry["vectors"]]})
+            return outcomes
+
+        per_user = await asyncio.gather(*[upsert(user_id, items) for user_id, items in by_user.items()])
+        return [outcome for outcomes in per_user for outcome in outcomes]
+
+    @staticmethod
+    def _failure(entry: Dict[str, Any], error: Exception) -> Dict[str, Any]:
+        return {"line": entry["line"], "item_id": entry["document"].item_id, "ok": False, "error": str(error)}
+
+    async def _write(self, pending: asyncio.Queue, results: asyncio.Queue):
+        finished = False
+        while not finished:
+            entry = await pending.get()
+            if entry is _END:
+                break
+            # Blocco con i documenti già pronti, fino a batch_chunks chunk: nessuna attesa
+            # per riempirlo, così i risultati non restano fermi con client lenti
+            batch, chunks = [entry], len(entry["chunks"])
+            while chunks < self.batch_chunks and not pending.empty():
+                entry = pending.get_nowait()
+                if entry is _END:
+                    finished = True
+                    break
+                batch.append(entry)
+                chunks += len(entry["chunks"])
+            for outcome in await self._index(batch):
+                await results.put(outcome)
+
+    async def run(self, body: AsyncIterator[bytes]) -> AsyncIterator[Dict[str, Any]]:
+        """Risultati per documento (riga, item_id, ok, ids o error) nell'ordine di completamento"""
+        pending: asyncio.Queue = asyncio.Queue(maxsize=self.max_pending)
+        # Anche i risultati sono limitati: un client lento rallenta la lettura del corpo
+        results: asyncio.Queue = asyncio.Queue(maxsize=self.max_pending)
+        reader = asyncio.ensure_future(self._read(body, pending, results))
+        writer = asyncio.ensure_future(self._write(pending, results))
+
+        async def pipeline():
+            try:
+                await writer
+                await reader
+            except Exception as e:
+                logger.error(f"Errore embed-upsert batch: {e}")
+                await results.put({"ok": False, "error": str(e)})
+            finally:
+                await results.put(_END)
+
+        task = asyncio.ensure_future(pipeline())
+        try:
+            while True:
+                result = await results.get()
+                if result is _END:
+                    break
+                yield result
+        finally:
+            # Client disconnesso o errore: lettura e indicizzazione si fermano
+            for running in (reader, writer, task):
+                running.cancel()
@@ -0,0 +1,278 @@
+"""
+Ingestione in blocco di una cartella di scansioni e file di testo
+OCR delle immagini in un pool di processi (OCRService), chunking con chunk_text,
+embedding e upsert a blocchi condivisi tra più documenti.
+
+L'avanzamento è salvato su file dopo ogni blocco: un'esecuzione interrotta riprende
+saltando i file già indicizzati (stesso percorso, dimensione e data di modifica).
+Gli id dei documenti derivano dal contenuto, quindi un blocco ripetuto dopo
+un'interruzione sovrascrive gli stessi vettori invece di duplicarli.
+
+Un'immagine senza OCR reale (Tesseract assente o in errore: testo simulato) è un file
+fallito, non un documento. La quota documenti dell'utente vale anche qui: i file nuovi
+oltre il limite non vengono indicizzati, salvo enforce_quota=False.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.tracing import capture_context, run_with_context
+from app.services.chunking import chunk_text
+from app.services.document_service import document_service
+from app.services.ocr_service import ocr_service
+from app.services.providers import get_embedding_service
+from app.services.rag import chunk_vectors, upsert_user_vectors
+from app.services.rate_limiter import PRIORITY_BATCH
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp")
+TEXT_EXTENSIONS = (".txt", ".md")
+
+# Stadi riportati nel rapporto finale (secondi)
+STAGES = ("scan", "ocr", "chunk", "embed", "upsert", "checkpoint")
+
+
+class OCRUnavailableError(RuntimeError):
+    """OCR non eseguito: il servizio ha restituito il testo simulato"""
+
+
+def extract_file(path: str, language: str) -> Tuple[str, Dict[str, Any], float]:
+    """Testo, metadati OCR e secondi di CPU di un file (eseguito nei processi del pool)"""
+    start = time.process_time()
+    if path.lower().endswith(TEXT_EXTENSIONS):
+        with open(path, encoding="utf-8", errors="replace") as f:
+            text = f.read()
+        metadata = {"method": "text", "confidence": 1.0}
+    else:
+        with open(path, "rb") as f:
+            text, metadata = ocr_service.extract_text_with_fallback(f.read(), language)
+        # Il fallback dell'OCR restituisce un testo segnaposto: mai indicizzarlo
+        if metadata.get("method") == "mock_ocr":
+            raise OCRUnavailableError("Tesseract non disponibile o in errore (testo simulato)")
+    return text, metadata, time.process_time() - start
+
+
+class BulkIngest:
+    """Ingestione riprendibile dei file di una cartella per un utente"""
+
+    def __init__(self, directory: str, user_id: str, state_path: str, language: str = "ita+eng",
+                 workers: Optional[int] = None, batch_chunks: int = 256,
+                 chunk_size: int = 1000, overlap: int = 150, enforce_quota: bool = True):
+        self.directory = os.path.abspath(directory)
+        self.user_id = user_id
+        self.state_path = state_path
+        self.language = language
+        # workers=0: OCR nel processo corrente (un thread), utile per test e debug
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.batch_chunks = batch_chunks
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.enforce_quota = enforce_quota
+        # Documenti nuovi ancora ammessi dalla quota (None: nessun limite), calcolato in run()
+        self._slots: Optional[int] = None
+        self.state = self._load_state()
+        self.timings = {stage: 0.0 for stage in STAGES}
+        self.ocr_cpu_seconds = 0.0
+        self.ingested = 0
+        self._buffer: List[Dict[str, Any]] = []
+
+    def _new_state(self) -> Dict[str, Any]:
+        return {
+            "directory": self.directory,
+            "user_id": self.user_id,
+            "done": {},
+            "failed": {},
+            "started_at": time.time(),
+        }
+
+    def _load_state(self) -> Dict[str, Any]:
+        if not os.path.exists(self.state_path):
+            return self._new_state()
+        with open(self.state_path, encoding="utf-8") as f:
+            state = json.load(f)
+        if state["directory"] != self.directory or state["user_id"] != self.user_id:
+            raise ValueError(
+                f"Stato in {self.state_path} creato per {state['directory']!r} e utente "
+                f"{state['user_id']!r}: usa un altro file di stato o riparti da zero"
+            )
+        return state
+
+    def _save_state(self):
+        # Scrittura atomica: un'interruzione non lascia il file a metà
+        start = time.perf_counter()
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_path, self.state_path)
+        self.timings["checkpoint"] += time.perf_counter() - start
+
+    @staticmethod
+    def _fingerprint(stat: os.stat_result) -> str:
+        return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+    def scan(self) -> List[Tuple[str, str]]:
+        """(percorso relativo, impronta) dei file supportati non ancora indicizzati, in ordine"""
+        start = time.perf_counter()
+        pending = []
+        for root, dirs, files in os.walk(self.directory):
+            dirs.sort()
+            for name in sorted(files):
+                if not name.lower().endswith(IMAGE_EXTENSIONS + TEXT_EXTENSIONS):
+                    continue
+                path = os.path.join(root, name)
+                relative = os.path.relpath(path, self.directory)
+                fingerprint = self._fingerprint(os.stat(path))
+                done = self.state["done"].get(relative)
+                if done is None or done["fingerprint"] != fingerprint:
+                    pending.append((relative, fingerprint))
+        self.timings["scan"] += time.perf_counter() - start
+        return pending
+
+    def _item_id(self, relative: str, text: str) -> str:
+        digest = hashlib.sha256(f"{relative}\0{text}".encode("utf-8")).hexdigest()[:16]
+        return f"doc_{self.user_id}_{digest}"
+
+    def _add_document(self, relative: str, fingerprint: str, text: str, ocr_metadata: Dict[str, Any]):
+        if not text or len(text.strip()) < 5:
+            self.state["failed"][relative] = "NO_TEXT_FOUND"
+            return
+        start = time.perf_counter()
+        chunks = chunk_text(text, chunk_size=self.chunk_size, overlap=self.overlap)
+        self.timings["chunk"] += time.perf_counter() - start
+
+        is_text = relative.lower().endswith(TEXT_EXTENSIONS)
+        previous = self.state["done"].get(relative)
+        # Le nuove versioni sostituiscono un documento esistente: solo i file nuovi usano la quota
+        if previous is None and self._slots is not None:
+            if self._slots <= 0:
+                self.state["failed"][relative] = f"QUOTA_EXCEEDED: limite di {document_service.max_documents} documenti"
+                return
+            self._slots -= 1
+        self._buffer.append({
+            "relative": relative,
+            "previous_item_id": previous["item_id"] if previous else None,
+            "fingerprint": fingerprint,
+            "item_id": self._item_id(relative, text),
+            "title": os.path.basename(relative),
+            "chunks": chunks,
+            "metadata": {
+                "file_type": "text" if is_text else "image_with_ocr",
+                "ocr_confidence": ocr_metadata.get("confidence"),
+                "upload_date": datetime.now().isoformat(),
+            },
+        })
+
+    async def _flush(self):
+        """Embedding di tutti i chunk in attesa in un'unica chiamata, poi upsert e checkpoint"""
+        documents, self._buffer = self._buffer, []
+        if not documents:
+            return
+        texts = [chunk for document in documents for chunk in document["chunks"]]
+
+        start = time.perf_counter()
+        embeddings = await get_embedding_service().create_embeddings(texts, priority=PRIORITY_BATCH)
+        self.timings["embed"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        vectors = []
+        offset = 0
+        for document in documents:
+            count = len(document["chunks"])
+            vectors += chunk_vectors(self.user_id, document["item_id"], document["title"], document["chunks"],
+                                     embeddings[offset:offset + count], document["metadata"])
+            offset += count
+        await upsert_user_vectors(self.user_id, vectors)
+        for document in documents:
+            await document_service.register_document(
+                self.user_id, document["item_id"], len(document["chunks"]), document["title"]
+            )
+        # File modificati dopo l'indicizzazione precedente: la vecchia versione va rimossa
+        for document in documents:
+            previous = document["previous_item_id"]
+            if previous and previous != document["item_id"]:
+                await document_service.delete_document(self.user_id, previous)
+        self.timings["upsert"] += time.perf_counter() - start
+
+        for document in documents:
+            self.state["done"][document["relative"]] = {
+                "fingerprint": document["fingerprint"],
+                "item_id": document["item_id"],
+                "chunks": len(document["chunks"]),
+            }
+            self.state["failed"].pop(document["relative"], None)
+        self.ingested += len(documents)
+        self._save_state()
+        logger.info("📦 %d documenti (%d chunk) indicizzati, %d in totale",
+                    len(documents), len(texts), len(self.state["done"]))
+
+    def _executor(self) -> Executor:
+        if self.workers == 0:
+            return ThreadPoolExecutor(max_workers=1)
+        return ProcessPoolExecutor(max_workers=self.workers)
+
+    async def _extract_window(self, executor: Executor, window: List[Tuple[str, str]]):
+        loop = asyncio.get_running_loop()
+        # Lo span dell'OCR nel worker continua la trace corrente
+        carrier = capture_context()
+        return await asyncio.gather(*[
+            loop.run_in_executor(executor, run_with_context, carrier, extract_file,
+                                 os.path.join(self.directory, relative), self.language)
+            for relative, _ in window
+        ], return_exceptions=True)
+
+    async def run(self) -> Dict[str, Any]:
+        """Indicizza i file in attesa: l'OCR del blocco successivo procede durante l'embedding"""
+        started = time.perf_counter()
+        pending = self.scan()
+        if self.enforce_quota:
+            count = await document_service.count_user_documents(self.user_id)
+            self._slots = max(0, document_service.max_documents - count)
+        window_size = max(1, self.workers) * 4
+        windows = [pending[i:i + window_size] for i in range(0, len(pending), window_size)]
+
+        with self._executor() as executor:
+            next_ocr = asyncio.ensure_future(self._extract_window(executor, windows[0])) if windows else None
+            for index, window in enumerate(windows):
+                start = time.perf_counter()
+                results = await next_ocr
+                self.timings["ocr"] += time.perf_counter() - start
+                if index + 1 < len(windows):
+                    next_ocr = asyncio.ensure_future(self._extract_window(executor, windows[index + 1]))
+
+                for (relative, fingerprint), result in zip(window, results):
+                    if isinstance(result, Exception):
+                        logger.warning(f"⚠️ {relative}: estrazione fallita: {result}")
+                        self.state["failed"][relative] = f"{result.__class__.__name__}: {result}"
+                        continue
+                    text, ocr_metadata, cpu_seconds = result
+                    self.ocr_cpu_seconds += cpu_seconds
+                    self._add_document(relative, fingerprint, text, ocr_metadata)
+                    if sum(len(d["chunks"]) for d in self._buffer) >= self.batch_chunks:
+                        await self._flush()
+            await self._flush()
+        self._save_state()
+
+        elapsed = time.perf_counter() - started
+        return {
+            "directory": self.directory,
+            "user_id": self.user_id,
+            "pending": len(pending),
+            "ingested": self.ingested,
+            "total_done": len(self.state["done"]),
+            "failed": dict(self.state["failed"]),
+            "seconds": round(elapsed, 3),
+            "docs_per_second": round(self.ingested / elapsed, 2) if elapsed > 0 else 0.0,
+            # ocr = attesa del pool non sovrapposta all'embedding; ocr_cpu = somma sui processi
+            "stages": {stage: round(seconds, 3) for stage, seconds in self.timings.items()},
+            "ocr_cpu_seconds": round(self.ocr_cpu_seconds, 3),
+            "workers": self.workers,
+            "quota_enforced": self.enforce_quota,
+        }
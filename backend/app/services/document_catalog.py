@@ -0,0 +1,111 @@
+"""
+Catalogo in memoria dei documenti per utente
+Conteggio e documento più vecchio in tempo costante per la quota di upload,
+aggiornati a ogni ingest ed eliminazione invece di rileggere l'indice
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _UserDocuments:
+    """Documenti di un utente in ordine di arrivo (il primo è il più vecchio)"""
+
+    __slots__ = ("documents", "loaded_at", "lock")
+
+    def __init__(self):
+        self.documents: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.loaded_at: Optional[float] = None
+        self.lock = asyncio.Lock()
+
+
+class DocumentCatalog:
+    """
+    Per ogni utente: item_id → {created_at, chunks, title}, ordinati dal più vecchio.
+    Al primo accesso (o dopo ttl secondi) l'elenco viene ricaricato dall'indice con
+    loader, che resta la fonte di verità: così più worker non divergono a lungo.
+    Al più max_users utenti in memoria (i meno recenti vengono ricaricati al prossimo
+    accesso); un utente senza più documenti viene tolto subito.
+    """
+
+    def __init__(self, loader: Callable[[str], Awaitable[List[Dict[str, Any]]]], ttl: float,
+                 max_users: int = 10000):
+        self.loader = loader
+        self.ttl = ttl
+        self.max_users = max_users
+        self._users: "OrderedDict[str, _UserDocuments]" = OrderedDict()
+        self._loads = 0
+
+    async def _user(self, user_id: str) -> _UserDocuments:
+        entry = self._users.get(user_id)
+        if entry is None:
+            entry = self._users[user_id] = _UserDocuments()
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(user_id)
+        if entry.loaded_at is not None and time.monotonic() - entry.loaded_at < self.ttl:
+            return entry
+
+        async with entry.lock:
+            # Un'altra richiesta potrebbe averlo appena caricato
+            if entry.loaded_at is None or time.monotonic() - entry.loaded_at >= self.ttl:
+                documents = await self.loader(user_id)
+                documents = sorted(documents, key=lambda d: d.get("created_at", ""))
+                entry.documents = OrderedDict(
+                    (d["item_id"], {
+                        "created_at": d.get("created_at", ""),
+                        "chunks": d.get("chunks_count", 0),
+                        "title": d.get("title", ""),
+                    })
+                    for d in documents
+                )
+                entry.loaded_at = time.monotonic()
+                self._loads += 1
+                logger.debug("Catalogo caricato per %s: %d documenti", user_id, len(entry.documents))
+        return entry
+
+    async def count(self, user_id: str) -> int:
+        return len((await self._user(user_id)).documents)
+
+    async def oldest(self, user_id: str) -> Optional[str]:
+        documents = (await self._user(user_id)).documents
+        return next(iter(documents), None)
+
+    async def get(self, user_id: str, item_id: str) -> Optional[Dict[str, Any]]:
+        return (await self._user(user_id)).documents.get(item_id)
+
+    async def documents(self, user_id: str) -> List[Dict[str, Any]]:
+        """Copia delle voci dell'utente (item_id, created_at, chunks, title), dal più vecchio"""
+        documents = (await self._user(user_id)).documents
+        return [{"item_id": item_id, **entry} for item_id, entry in documents.items()]
+
+    async def add(self, user_id: str, item_id: str, chunks: int, created_at: str, title: str = ""):
+        """Registra un documento appena indicizzato come il più recente"""
+        documents = (await self._user(user_id)).documents
+        documents[item_id] = {"created_at": created_at, "chunks": chunks, "title": title}
+        documents.move_to_end(item_id)
+
+    async def remove(self, user_id: str, item_id: str):
+        documents = (await self._user(user_id)).documents
+        documents.pop(item_id, None)
+        if not documents:
+            self._users.pop(user_id, None)
+
+    def invalidate(self, user_id: str):
+        """Forza il ricaricamento dall'indice al prossimo accesso"""
+        entry = self._users.get(user_id)
+        if entry is not None:
+            entry.loaded_at = None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "users": len(self._users),
+            "documents": sum(len(entry.documents) for entry in self._users.values()),
+            "loads": self._loads,
+        }
@@ -1,180 +1,394 @@
+import asyncio
+import base64
+import json
 import logging
-from typing import List, Dict, Optional
+import re
+from typing import Any, List, Dict, Optional, Sequence, Tuple
 from datetime import datetime
-from app.services.pinecone_client import PineconeService
+from app.core.config import settings
+from app.core.log_setup import log_payload
+from app.core.tracing import traced
+from app.services.document_catalog import DocumentCatalog
+from app.services.pinecone_client import user_read_scope, user_write_namespaces
+from app.services.providers import get_pinecone_service_async
 
 logger = logging.getLogger(__name__)
 
+# Ordinamenti della lista documenti: nome → (campo del catalogo, decrescente)
+LIST_SORTS = {
+    "created_at_desc": ("created_at", True),
+    "created_at_asc": ("created_at", False),
+    "title_asc": ("title", False),
+    "title_desc": ("title", True),
+}
+
+# Vista predefinita: solo dati del catalogo, nessuna lettura dall'indice
+DEFAULT_LIST_FIELDS = ("item_id", "title", "created_at", "chunks_count")
+
+# Campi letti dal primo chunk di ogni documento della pagina
+_FIRST_CHUNK_FIELDS = {"upload_date", "ocr_confidence", "text_preview", "file_type"}
+
+LIST_FIELDS = set(DEFAULT_LIST_FIELDS) | _FIRST_CHUNK_FIELDS | {"user_id", "text_length"}
+
+
+def _sort_key(field: str, document: Dict[str, Any]) -> Tuple[str, str]:
+    value = document.get(field) or ""
+    return (value.casefold() if field == "title" else value, document["item_id"])
+
+
+def _encode_cursor(sort: str, key: Tuple[str, str]) -> str:
+    raw = json.dumps([sort, *key], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str, sort: str) -> Tuple[str, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_sort, value, item_id = json.loads(raw)
+    except Exception:
+        raise ValueError("Cursore non valido")
+    if cursor_sort != sort:
+        raise ValueError(f"Cursore creato con ordinamento {cursor_sort}, richiesto {sort}")
+    return (value, item_id)
+
 class DocumentService:
     """Servizio per gestione documenti utente"""
     
     def __init__(self):
-        self.pinecone_service = PineconeService()
         self.max_documents = 10
+        # Conteggi e ordine per la quota, ricaricati dall'indice al primo uso
+        self.catalog = DocumentCatalog(self._scan_user_documents, ttl=settings.document_catalog_ttl,
+                                       max_users=settings.document_catalog_max_users)
+        # Un giro di eliminazione per quota alla volta per utente; il lock è tolto
+        # quando nessuna richiesta lo usa o lo attende più
+        self._eviction_locks: Dict[str, asyncio.Lock] = {}
+        self._eviction_users: Dict[str, int] = {}
+        # Documenti eliminati ma non ancora rimossi dall'indice: esclusi subito dalle ricerche.
+        # user_id → item_id → numero di chunk noto al catalogo al momento dell'eliminazione
+        self.tombstones: Dict[str, Dict[str, int]] = {}
     
-    def get_user_documents(self, user_id: str) -> List[Dict]:
+    async def _pinecone(self):
+        """Client condiviso, creato al primo uso fuori dall'event loop (l'import non apre connessioni)"""
+        return await get_pinecone_service_async()
+    
+    @traced("DocumentService.get_user_documents")
+    async def get_user_documents(self, user_id: str) -> List[Dict]:
         """
         Recupera tutti i documenti di un utente da Pinecone metadata
         """
         try:
-            logger.info(f"🔍 Cercando documenti per utente: {user_id}")
-            
-            # Prova prima con il nuovo metodo
-            filter_dict = {"user_id": user_id}
-            logger.info(f"🔍 Eseguendo list_vectors_by_filter con filtro: {filter_dict}")
-            
-            results = self.pinecone_service.list_vectors_by_filter(
+            return await self._scan_user_documents(user_id)
+        except Exception as e:
+            logger.error(f"Errore nel recupero documenti per {user_id}: {e}")
+            return []
+    
+    async def _scan_user_documents(self, user_id: str) -> List[Dict]:
+        """Scansione completa dei chunk dell'utente, raggruppati per documento"""
+        # Prova prima con il nuovo metodo
+        namespace, filter_dict = user_read_scope(user_id)
+        pinecone_service = await self._pinecone()
+        logger.debug("🔍 list_vectors_by_filter con filtro: %s, namespace: %r", filter_dict, namespace)
+        
+        results = await pinecone_service.list_vectors_by_filter(
+            filter_dict=filter_dict,
+            limit=1000,
+            namespace=namespace
+        )
+        
+        logger.debug("📊 list_vectors_by_filter restituita %d risultati", len(results))
+        
+        # Se non trova risultati, prova con query classica
+        if not results:
+            logger.debug("🔁 Provando con query_vectors classica...")
+            dummy_vector = [0.0] * settings.embedding_dimension
+            results = await pinecone_service.query_vectors(
+                query_vector=dummy_vector,
+                top_k=1000,
                 filter_dict=filter_dict,
-                limit=1000
+                include_metadata=True,
+                namespace=namespace
             )
+            logger.debug("📊 query_vectors restituita %d risultati", len(results))
+        
+        # Log dei primi risultati solo con debug della richiesta
+        for i, match in enumerate(results[:3]):
+            metadata = match.get('metadata', {})
+            log_payload(logger, "   Risultato %d: id=%s, item_id=%s, title=%s",
+                        i, match.get('id'), metadata.get('item_id'), metadata.get('title'))
+        
+        # Raggruppa i chunk per documento (esclusi quelli in eliminazione)
+        documents_map = {}
+        deleted = self.tombstones.get(user_id, ())
+        
+        for match in results:
+            metadata = match.get('metadata', {})
+            item_id = metadata.get('item_id')
+            if item_id in deleted:
+                continue
             
-            logger.info(f"📊 list_vectors_by_filter restituita {len(results)} risultati")
-            
-            # Se non trova risultati, prova con query classica
-            if not results:
-                logger.info("� Provando con query_vectors classica...")
-                dummy_vector = [0.0] * 1536
-                results = self.pinecone_service.query_vectors(
-                    query_vector=dummy_vector,
-                    top_k=1000,
-                    filter_dict=filter_dict,
-                    include_metadata=True
+            if item_id and item_id not in documents_map:
+                documents_map[item_id] = {
+                    'item_id': item_id,
+                    'title': metadata.get('title', 'Documento senza titolo'),
+                    'user_id': metadata.get('user_id'),
+                    'created_at': metadata.get('timestamp', ''),
+                    'upload_date': metadata.get('timestamp', ''),
+                    'text_length': len(metadata.get('text', '')),
+                    'chunks_count': 1,
+                    'ocr_confidence': metadata.get('ocr_confidence'),
+                    'text_preview': metadata.get('text', '')[:200] + '...',
+                    'file_type': metadata.get('file_type', 'Sconosciuto')
+                }
+            elif item_id:
+                # Aggiorna conteggio chunk e lunghezza testo
+                documents_map[item_id]['chunks_count'] += 1
+                chunk_text = metadata.get('text', '')
+                documents_map[item_id]['text_length'] += len(chunk_text)
+        
+        # Converti in lista e ordina per data
+        documents_list = list(documents_map.values())
+        documents_list.sort(key=lambda x: x.get('created_at', ''), reverse=True)
+        
+        logger.info("✅ Trovati %d documenti unici per utente %s", len(documents_list), user_id)
+        for doc in documents_list:
+            log_payload(logger, "   - %s (%s) - %d chunks", doc['title'], doc['item_id'], doc['chunks_count'])
+        
+        return documents_list
+    
+    @traced("DocumentService.list_documents")
+    async def list_documents(self, user_id: str, limit: int = 20, cursor: Optional[str] = None,
+                             sort: str = "created_at_desc",
+                             fields: Sequence[str] = DEFAULT_LIST_FIELDS) -> Dict[str, Any]:
+        """
+        Una pagina della lista documenti, ordinata e paginata dal catalogo.
+        Solo i campi richiesti fuori dal catalogo vengono letti dall'indice (fetch per id,
+        limitato ai documenti della pagina). Solleva ValueError per parametri non validi.
+        """
+        if sort not in LIST_SORTS:
+            raise ValueError(f"Ordinamento non supportato: {sort} (ammessi: {', '.join(LIST_SORTS)})")
+        unknown = set(fields) - LIST_FIELDS
+        if unknown:
+            raise ValueError(f"Campi non supportati: {', '.join(sorted(unknown))}")
+        
+        field, descending = LIST_SORTS[sort]
+        entries = await self.catalog.documents(user_id)
+        total_count = len(entries)
+        entries.sort(key=lambda d: _sort_key(field, d), reverse=descending)
+        
+        if cursor:
+            after = _decode_cursor(cursor, sort)
+            entries = [
+                d for d in entries
+                if (_sort_key(field, d) < after if descending else _sort_key(field, d) > after)
+            ]
+        page = entries[:limit]
+        next_cursor = _encode_cursor(sort, _sort_key(field, page[-1])) if len(entries) > limit else None
+        
+        documents = [{
+            "item_id": d["item_id"],
+            "title": d["title"] or "Documento senza titolo",
+            "created_at": d["created_at"],
+            "chunks_count": d["chunks"],
+            "user_id": user_id,
+        } for d in page]
+        
+        wanted = set(fields)
+        if wanted & (_FIRST_CHUNK_FIELDS | {"text_length"}):
+            await self._add_chunk_fields(user_id, documents, all_chunks="text_length" in wanted)
+        
+        return {
+            "documents": [{name: d[name] for name in fields if name in d} for d in documents],
+            "next_cursor": next_cursor,
+            "total_count": total_count,
+        }
+    
+    async def _add_chunk_fields(self, user_id: str, documents: List[Dict[str, Any]], all_chunks: bool):
+        """Completa i documenti con i metadati dei chunk (primo chunk, o tutti per text_length)"""
+        ids = [
+            f"{d['item_id']}_{i:04d}"
+            for d in documents
+            for i in range(d["chunks_count"] if all_chunks else min(1, d["chunks_count"]))
+        ]
+        namespace, _ = user_read_scope(user_id)
+        pinecone_service = await self._pinecone()
+        metadata = await pinecone_service.fetch_vectors(ids, namespace=namespace) if ids else {}
+        
+        for d in documents:
+            first = metadata.get(f"{d['item_id']}_0000", {})
+            text = first.get('text', '')
+            d['upload_date'] = first.get('timestamp', d['created_at'])
+            d['ocr_confidence'] = first.get('ocr_confidence')
+            d['text_preview'] = text[:200] + '...'
+            d['file_type'] = first.get('file_type', 'Sconosciuto')
+            if all_chunks:
+                d['text_length'] = sum(
+                    len(metadata.get(f"{d['item_id']}_{i:04d}", {}).get('text', ''))
+                    for i in range(d['chunks_count'])
                 )
-                logger.info(f"📊 query_vectors restituita {len(results)} risultati")
-            
-            # Log dei primi risultati per debug
-            for i, match in enumerate(results[:3]):  # Solo primi 3 per evitare spam
-                metadata = match.get('metadata', {})
-                logger.info(f"   Risultato {i}: id={match.get('id')}, item_id={metadata.get('item_id')}, title={metadata.get('title')}")
-            
-            # Raggruppa i chunk per documento
-            documents_map = {}
-            
-            for match in results:
-                metadata = match.get('metadata', {})
-                item_id = metadata.get('item_id')
-                
-                logger.debug(f"Processando chunk con item_id: {item_id}")
-                
-                if item_id and item_id not in documents_map:
-                    documents_map[item_id] = {
-                        'item_id': item_id,
-                        'title': metadata.get('title', 'Documento senza titolo'),
-                        'user_id': metadata.get('user_id'),
-                        'created_at': metadata.get('timestamp', ''),
-                        'upload_date': metadata.get('timestamp', ''),
-                        'text_length': len(metadata.get('text', '')),
-                        'chunks_count': 1,
-                        'ocr_confidence': metadata.get('ocr_confidence'),
-                        'text_preview': metadata.get('text', '')[:200] + '...',
-                        'file_type': metadata.get('file_type', 'Sconosciuto')
-                    }
-                elif item_id:
-                    # Aggiorna conteggio chunk e lunghezza testo
-                    documents_map[item_id]['chunks_count'] += 1
-                    chunk_text = metadata.get('text', '')
-                    documents_map[item_id]['text_length'] += len(chunk_text)
-            
-            # Converti in lista e ordina per data
-            documents_list = list(documents_map.values())
-            documents_list.sort(key=lambda x: x.get('created_at', ''), reverse=True)
-            
-            logger.info(f"✅ Trovati {len(documents_list)} documenti unici per utente {user_id}")
-            if documents_list:
-                logger.info(f"📋 Documenti trovati:")
-                for doc in documents_list:
-                    logger.info(f"   - {doc['title']} ({doc['item_id']}) - {doc['chunks_count']} chunks")
-            
-            return documents_list
-            
-        except Exception as e:
-            logger.error(f"Errore nel recupero documenti per {user_id}: {e}")
-            return []
     
-    def count_user_documents(self, user_id: str) -> int:
-        """Conta i documenti di un utente"""
+    @traced("DocumentService.count_user_documents")
+    async def count_user_documents(self, user_id: str) -> int:
+        """Conta i documenti di un utente (dal catalogo, senza scansione)"""
         try:
-            documents = self.get_user_documents(user_id)
-            return len(documents)
+            return await self.catalog.count(user_id)
         except Exception as e:
             logger.error(f"Errore nel conteggio documenti per {user_id}: {e}")
             return 0
     
-    def can_upload_document(self, user_id: str) -> bool:
+    @traced("DocumentService.can_upload_document")
+    async def can_upload_document(self, user_id: str) -> bool:
         """Verifica se l'utente può caricare un nuovo documento"""
         try:
-            count = self.count_user_documents(user_id)
+            count = await self.catalog.count(user_id)
             return count < self.max_documents
         except Exception as e:
             logger.error(f"Errore nel controllo limite documenti per {user_id}: {e}")
             return False
     
-    def delete_oldest_document(self, user_id: str) -> bool:
+    async def register_document(self, user_id: str, item_id: str, chunks: int, title: str = ""):
+        """Aggiorna il catalogo dopo l'indicizzazione di un documento"""
+        await self.catalog.add(user_id, item_id, chunks, datetime.now().isoformat(), title)
+    
+    @traced("DocumentService.delete_oldest_document")
+    async def delete_oldest_document(self, user_id: str) -> bool:
         """Elimina il documento più vecchio dell'utente"""
         try:
-            documents = self.get_user_documents(user_id)
-            if not documents:
+            oldest_item_id = await self.catalog.oldest(user_id)
+            if oldest_item_id is None:
                 return True
             
-            # Trova il documento più vecchio
-            oldest_doc = min(documents, key=lambda x: x.get('created_at', ''))
-            oldest_item_id = oldest_doc['item_id']
-            
-            # Elimina tutti i chunk di questo documento da Pinecone
-            filter_dict = {
-                "user_id": user_id,
-                "item_id": oldest_item_id
-            }
-            
-            # Per eliminare da Pinecone, dobbiamo prima trovare tutti gli ID dei chunk
-            dummy_vector = [0.0] * 1536
-            results = self.pinecone_service.query_vectors(
-                query_vector=dummy_vector,
-                top_k=1000,
-                filter_dict=filter_dict,
-                include_metadata=True
-            )
-            
-            # Raccogli tutti gli ID dei chunk da eliminare
-            chunk_ids = [match['id'] for match in results]
+            return await self.delete_document(user_id, oldest_item_id)
             
+        except Exception as e:
+            logger.error(f"Errore nell'eliminazione del documento più vecchio per {user_id}: {e}")
+            return False
+    
+    @traced("DocumentService.evict_over_quota")
+    async def evict_over_quota(self, user_id: str) -> int:
+        """
+        Elimina i documenti più vecchi finché l'utente rientra nel limite.
+        Eseguita in background dopo l'upload; un solo giro alla volta per utente.
+        """
+        lock = self._eviction_locks.setdefault(user_id, asyncio.Lock())
+        self._eviction_users[user_id] = self._eviction_users.get(user_id, 0) + 1
+        evicted = 0
+        try:
+            async with lock:
+                while await self.catalog.count(user_id) > self.max_documents:
+                    oldest_item_id = await self.catalog.oldest(user_id)
+                    if not await self.delete_oldest_document(user_id):
+                        # Catalogo forse non allineato all'indice: ricaricato al prossimo accesso
+                        self.catalog.invalidate(user_id)
+                        logger.warning(f"⚠️ Eliminazione di {oldest_item_id} per quota fallita, riprovo al prossimo upload")
+                        break
+                    evicted += 1
+        finally:
+            self._eviction_users[user_id] -= 1
+            if not self._eviction_users[user_id]:
+                del self._eviction_users[user_id]
+                del self._eviction_locks[user_id]
+        if evicted:
+            logger.info(f"Eliminati {evicted} documenti più vecchi per {user_id} (limite {self.max_documents})")
+        return evicted
+    
+    def deleted_item_ids(self, user_id: str) -> List[str]:
+        """Documenti dell'utente in eliminazione, da escludere dalle ricerche"""
+        return sorted(self.tombstones.get(user_id, ()))
+    
+    async def _chunk_ids(self, user_id: str, item_id: str) -> List[str]:
+        """
+        Id dei chunk di un documento, senza query vettoriali: listing per prefisso
+        dell'id ({item_id}_NNNN) o, se l'indice non lo supporta o non elenca nulla
+        (indice eventualmente consistente subito dopo l'upsert), ricostruiti dal
+        numero di chunk noto al catalogo
+        """
+        try:
+            pattern = re.compile(re.escape(item_id) + r"_\d{4}")
+            namespace, _ = user_read_scope(user_id)
+            pinecone_service = await self._pinecone()
+            listed = await pinecone_service.list_ids(prefix=f"{item_id}_", namespace=namespace)
+            chunk_ids = [chunk_id for chunk_id in listed if pattern.fullmatch(chunk_id)]
+            if chunk_ids:
+                return chunk_ids
+            logger.debug("Listing per prefisso vuoto per %s, id dal catalogo", item_id)
+        except Exception as e:
+            logger.debug("Listing per prefisso non disponibile (%s), id dal catalogo", e)
+        
+        # Documento già rimosso dal catalogo: conteggio salvato nel tombstone
+        chunks = self.tombstones.get(user_id, {}).get(item_id)
+        if chunks is None:
+            document = await self.catalog.get(user_id, item_id)
+            chunks = document["chunks"] if document else 0
+        return [f"{item_id}_{i:04d}" for i in range(chunks)]
+    
+    async def mark_deleted(self, user_id: str, item_ids: List[str]) -> List[str]:
+        """
+        Registra l'eliminazione: i documenti spariscono subito da catalogo, lista e
+        ricerche. Restituisce quelli effettivamente presenti per l'utente, compresi
+        quelli già marcati la cui rimozione dall'indice è da ripetere.
+        """
+        pending = self.tombstones.get(user_id, {})
+        found = []
+        for item_id in dict.fromkeys(item_ids):
+            if item_id in pending:
+                found.append(item_id)
+                continue
+            document = await self.catalog.get(user_id, item_id)
+            if document is None:
+                continue
+            # Conteggio dei chunk salvato prima di togliere il documento dal catalogo
+            self.tombstones.setdefault(user_id, {})[item_id] = document["chunks"]
+            await self.catalog.remove(user_id, item_id)
+            found.append(item_id)
+        return found
+    
+    @traced("DocumentService.purge_documents")
+    async def purge_documents(self, user_id: str, item_ids: List[str]) -> bool:
+        """Rimuove dall'indice i chunk dei documenti già marcati come eliminati"""
+        try:
+            chunk_ids_per_document = await asyncio.gather(*[
+                self._chunk_ids(user_id, item_id) for item_id in item_ids
+            ])
+            chunk_ids = [chunk_id for ids in chunk_ids_per_document for chunk_id in ids]
             if chunk_ids:
-                # Elimina i chunk da Pinecone
-                self.pinecone_service.delete_vectors(chunk_ids)
-                logger.info(f"Eliminato documento {oldest_item_id} con {len(chunk_ids)} chunk")
+                pinecone_service = await self._pinecone()
+                await asyncio.gather(*[
+                    pinecone_service.delete_vectors(chunk_ids, namespace=namespace)
+                    for namespace in user_write_namespaces(user_id)
+                ])
             
+            # Documenti senza id risolti: il tombstone resta per riprovare l'eliminazione
+            unresolved = [item_id for item_id, ids in zip(item_ids, chunk_ids_per_document) if not ids]
+            remaining = self.tombstones.get(user_id, {})
+            for item_id in item_ids:
+                if item_id not in unresolved:
+                    remaining.pop(item_id, None)
+            if not remaining:
+                self.tombstones.pop(user_id, None)
+            if unresolved:
+                logger.warning(f"⚠️ Nessun chunk trovato per {unresolved} di {user_id}: restano nascosti, da riprovare")
+                return False
+            logger.info(f"Eliminati {len(item_ids)} documenti ({len(chunk_ids)} chunk) per {user_id}")
             return True
             
         except Exception as e:
-            logger.error(f"Errore nell'eliminazione del documento più vecchio per {user_id}: {e}")
+            # Il tombstone resta: i documenti restano nascosti finché il processo è attivo
+            logger.error(f"Errore nella rimozione dall'indice di {item_ids} per {user_id}: {e}")
             return False
     
-    def delete_document(self, user_id: str, item_id: str) -> bool:
+    @traced("DocumentService.delete_documents")
+    async def delete_documents(self, user_id: str, item_ids: List[str]) -> List[str]:
+        """Elimina più documenti con chiamate delete a blocchi; restituisce quelli eliminati"""
+        found = await self.mark_deleted(user_id, item_ids)
+        if found and not await self.purge_documents(user_id, found):
+            return []
+        return found
+    
+    @traced("DocumentService.delete_document")
+    async def delete_document(self, user_id: str, item_id: str) -> bool:
         """Elimina un documento specifico"""
         try:
-            filter_dict = {
-                "user_id": user_id,
-                "item_id": item_id
-            }
-            
-            # Trova tutti i chunk del documento
-            dummy_vector = [0.0] * 1536
-            results = self.pinecone_service.query_vectors(
-                query_vector=dummy_vector,
-                top_k=1000,
-                filter_dict=filter_dict,
-                include_metadata=True
-            )
-            
-            chunk_ids = [match['id'] for match in results]
-            
-            if chunk_ids:
-                self.pinecone_service.delete_vectors(chunk_ids)
-                logger.info(f"Eliminato documento {item_id} con {len(chunk_ids)} chunk")
-                return True
-            
-            return False
-            
+            return item_id in await self.delete_documents(user_id, [item_id])
         except Exception as e:
             logger.error(f"Errore nell'eliminazione documento {item_id} per {user_id}: {e}")
             return False
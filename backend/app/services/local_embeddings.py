@@ -0,0 +1,288 @@
+"""
+Embedding locali su CPU
+Stessa interfaccia di OpenAIService per gli embedding (create_embedding, create_embeddings),
+senza chiamate di rete. Encoder disponibili:
+- onnx: onnxruntime con model.onnx e tokenizer.json in LOCAL_EMBEDDING_MODEL_DIR
+- torch: sentence-transformers (scarica il modello alla prima esecuzione)
+- hash: feature hashing deterministico (modello "hashing"), per test e sviluppo offline
+
+Le richieste singole che arrivano insieme sono raccolte in un batch dinamico:
+il primo input attende al massimo LOCAL_EMBEDDING_BATCH_WAIT_MS, poi l'intero
+batch passa al thread di inferenza con una sola chiamata al modello.
+Il thread di inferenza serve prima le chiamate a priorità interattiva: un ingest
+in blocchi (PRIORITY_BATCH) lascia passare le query tra un blocco e l'altro.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Set, Tuple
+
+from app.core.config import EmbeddingModel, settings
+from app.core.metrics import observe_stage
+from app.core.tracing import capture_context, run_with_context, traced
+from app.services.rate_limiter import PRIORITY_BATCH, PRIORITY_INTERACTIVE
+from app.services.singleflight import local_embedding_flight
+from app.services.standins import hash_embedding
+from app.services.tokenizer import truncate_to_tokens
+
+# Runtime opzionali: senza, solo l'encoder a hashing
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import onnxruntime
+    from tokenizers import Tokenizer
+except ImportError:
+    onnxruntime = None
+    Tokenizer = None
+
+try:
+    import torch
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    torch = None
+    SentenceTransformer = None
+
+logger = logging.getLogger(__name__)
+
+LOCAL_BACKENDS = ("auto", "onnx", "torch", "hash")
+
+
+class HashEncoder:
+    """Feature hashing delle parole: deterministico, nessun modello da caricare"""
+
+    name = "hash"
+
+    def __init__(self, dimension: int):
+        self.dimension = dimension
+
+    def encode(self, texts: List[str]) -> List[List[float]]:
+        return [hash_embedding(text, self.dimension) for text in texts]
+
+
+class OnnxEncoder:
+    """Transformer esportato in ONNX: mean pooling sui token e normalizzazione L2"""
+
+    name = "onnx"
+
+    def __init__(self, model_dir: str, max_tokens: int, threads: int):
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, "model.onnx"), options, providers=["CPUExecutionProvider"]
+        )
+        self.inputs = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_tokens)
+        self.tokenizer.enable_padding()
+
+    def encode(self, texts: List[str]) -> List[List[float]]:
+        encodings = self.tokenizer.encode_batch(texts)
+        ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": ids, "attention_mask": mask}
+        if "token_type_ids" in self.inputs:
+            feeds["token_type_ids"] = np.zeros_like(ids)
+        hidden = self.session.run(None, feeds)[0]
+
+        weights = mask[:, :, None].astype(np.float32)
+        pooled = (hidden * weights).sum(axis=1) / np.maximum(weights.sum(axis=1), 1e-9)
+        pooled /= np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+        return pooled.tolist()
+
+
+class TorchEncoder:
+    """sentence-transformers su CPU"""
+
+    name = "torch"
+
+    def __init__(self, model_name: str, max_tokens: int, threads: int):
+        torch.set_num_threads(threads)
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.model.max_seq_length = max_tokens
+
+    def encode(self, texts: List[str]) -> List[List[float]]:
+        with torch.inference_mode():
+            vectors = self.model.encode(texts, batch_size=len(texts), normalize_embeddings=True,
+                                        convert_to_numpy=True, show_progress_bar=False)
+        return vectors.tolist()
+
+
+def load_encoder(model: EmbeddingModel, dimension: int, backend: Optional[str] = None):
+    """Encoder per il modello del registro; auto sceglie onnx se il modello esportato c'è, poi torch"""
+    backend = backend or settings.local_embedding_backend
+    if backend not in LOCAL_BACKENDS:
+        raise ValueError(f"LOCAL_EMBEDDING_BACKEND non valido: {backend} ({', '.join(LOCAL_BACKENDS)})")
+    if model.name == "hashing" or backend == "hash":
+        return HashEncoder(dimension)
+
+    model_dir = settings.local_embedding_model_dir
+    has_onnx = model_dir is not None and os.path.exists(os.path.join(model_dir, "model.onnx"))
+    if backend == "onnx" or (backend == "auto" and has_onnx and onnxruntime is not None):
+        if onnxruntime is None or np is None:
+            raise ValueError("LOCAL_EMBEDDING_BACKEND=onnx richiede onnxruntime, tokenizers e numpy")
+        if not has_onnx:
+            raise ValueError(f"model.onnx non trovato in LOCAL_EMBEDDING_MODEL_DIR={model_dir}")
+        return OnnxEncoder(model_dir, model.max_input_tokens, settings.local_embedding_threads)
+    if SentenceTransformer is None:
+        raise ValueError(
+            f"Nessun runtime per {model.name}: installa sentence-transformers, oppure onnxruntime e "
+            f"tokenizers con LOCAL_EMBEDDING_MODEL_DIR, o usa EMBEDDING_MODEL=hashing"
+        )
+    return TorchEncoder(model_dir or model.name, model.max_input_tokens, settings.local_embedding_threads)
+
+
+class LocalEmbeddingService:
+    """Embedding con un modello locale su CPU, con batch dinamico delle richieste singole"""
+
+    backend = "local"
+
+    def __init__(self, encoder=None):
+        self.model = settings.embedding_spec
+        self.dimension = settings.embedding_dimension
+        self.encoder = encoder or load_encoder(self.model, self.dimension)
+        self.batch_size = settings.embedding_batch_size
+        self.batch_wait = settings.local_embedding_batch_wait_ms / 1000.0
+        # Un solo thread di inferenza: il parallelismo è dentro il modello (LOCAL_EMBEDDING_THREADS)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding")
+        self._pending: List[Tuple[str, asyncio.Future, int]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        # Batch in corso, tenuti finché non terminano (il loop ha solo riferimenti deboli ai task)
+        self._tasks: Set[asyncio.Task] = set()
+        # Accesso al thread di inferenza: una chiamata alla volta, in attesa per (priorità, arrivo)
+        self._busy = False
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self.batches = 0
+        self.inputs = 0
+        logger.info("✅ Embedding locali inizializzati (%s, %s, %d dimensioni)",
+                    self.model.name, self.encoder.name, self.dimension)
+
+    async def warm_up(self):
+        """Carica pesi e kernel con un primo input"""
+        await self._encode(["warm up"])
+
+    async def close(self):
+        for task in list(self._tasks):
+            task.cancel()
+        self._executor.shutdown(wait=False)
+
+    def _fit_input(self, text: str) -> str:
+        return truncate_to_tokens(text, self.model.max_input_tokens, self.model.tokenizer)
+
+    async def _acquire(self, priority: int):
+        """Attende il turno sul thread di inferenza: prima la priorità più bassa, poi l'ordine di arrivo"""
+        if not self._busy and not self._waiters:
+            self._busy = True
+            return
+        turn = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), turn))
+        try:
+            await turn
+        except asyncio.CancelledError:
+            # Turno già assegnato ma non usato: passa al prossimo
+            if turn.done() and not turn.cancelled():
+                self._release()
+            raise
+
+    def _release(self):
+        while self._waiters:
+            _, _, turn = heapq.heappop(self._waiters)
+            if not turn.done():
+                turn.set_result(None)
+                return
+        self._busy = False
+
+    async def _encode(self, texts: List[str], priority: int = PRIORITY_INTERACTIVE) -> List[List[float]]:
+        await self._acquire(priority)
+        try:
+            loop = asyncio.get_running_loop()
+            with observe_stage("embedding", self.backend):
+                vectors = await loop.run_in_executor(
+                    self._executor, run_with_context, capture_context(), self.encoder.encode, texts
+                )
+        finally:
+            self._release()
+        self.batches += 1
+        self.inputs += len(texts)
+        return vectors
+
+    @traced("LocalEmbeddingService.create_embedding")
+    async def create_embedding(self, text: str, priority: int = PRIORITY_INTERACTIVE) -> List[float]:
+        """Crea embedding per un testo"""
+        if settings.coalesce_provider_calls:
+            key = (self.backend, self.model.name, self.dimension, text)
+            return await local_embedding_flight.do(key, self._create_embedding, text, priority)
+        return await self._create_embedding(text, priority)
+
+    async def _create_embedding(self, text: str, priority: int) -> List[float]:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((self._fit_input(text), future, priority))
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.batch_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        # Prima gli input interattivi (ordinamento stabile: a parità, ordine di arrivo)
+        self._pending.sort(key=lambda item: item[2])
+        batch, self._pending = self._pending[:self.batch_size], self._pending[self.batch_size:]
+        if self._pending:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.batch_wait, self._flush)
+        if batch:
+            task = asyncio.ensure_future(self._run_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._batch_done)
+
+    def _batch_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Errore nel batch di embedding locale: {task.exception()!r}")
+
+    async def _run_batch(self, batch: List[Tuple[str, asyncio.Future, int]]):
+        try:
+            vectors = await self._encode([text for text, _, _ in batch],
+                                         priority=min(priority for _, _, priority in batch))
+        except asyncio.CancelledError:
+            for _, future, _ in batch:
+                future.cancel()
+            raise
+        except Exception as e:
+            logger.error(f"Errore embedding locale: {e}")
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future, _), vector in zip(batch, vectors):
+            if not future.done():
+                future.set_result(vector)
+
+    @traced("LocalEmbeddingService.create_embeddings")
+    async def create_embeddings(self, texts: List[str], priority: int = PRIORITY_BATCH) -> List[List[float]]:
+        """Embedding di più testi, nello stesso ordine, in blocchi da EMBEDDING_BATCH_SIZE"""
+        texts = [self._fit_input(text) for text in texts]
+        vectors: List[List[float]] = []
+        for start in range(0, len(texts), self.batch_size):
+            vectors.extend(await self._encode(texts[start:start + self.batch_size], priority=priority))
+        return vectors
+
+    def stats(self):
+        return {
+            "model": self.model.name,
+            "encoder": self.encoder.name,
+            "dimension": self.dimension,
+            "batches": self.batches,
+            "inputs": self.inputs,
+            "avg_batch_size": round(self.inputs / self.batches, 2) if self.batches else 0.0,
+        }
@@ -0,0 +1,164 @@
+"""
+Migrazione dal namespace condiviso ai namespace per utente
+Copia i vettori a pagine (id → fetch → upsert nel namespace dell'utente) con blocchi
+in parallelo, salva dopo ogni pagina il token di paginazione per riprendere dopo
+un'interruzione e verifica i conteggi per namespace alla fine.
+
+Online: con VECTOR_NAMESPACE_MODE=dual l'API scrive in entrambi i namespace durante
+la copia; a verifica superata si passa a VECTOR_NAMESPACE_MODE=per_user.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List
+
+from app.services.pinecone_client import user_namespace
+
+logger = logging.getLogger(__name__)
+
+
+class NamespaceMigration:
+    """Copia riprendibile del namespace sorgente nei namespace per utente"""
+
+    def __init__(self, service, state_path: str, source_namespace: str = "",
+                 page_size: int = 100, batch_size: int = 100, concurrency: int = 4):
+        self.service = service
+        self.state_path = state_path
+        self.source_namespace = source_namespace
+        self.page_size = page_size
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.state = self._load_state()
+
+    def _new_state(self) -> Dict[str, Any]:
+        return {
+            "source_namespace": self.source_namespace,
+            "page_size": self.page_size,
+            "pages_done": 0,
+            # Ripresa dal token, non dalla posizione: id eliminati nel frattempo non spostano le pagine
+            "pagination_token": None,
+            "last_id": None,
+            "copied": {},
+            "orphans": 0,
+            "done": False,
+            "started_at": time.time(),
+        }
+
+    def _load_state(self) -> Dict[str, Any]:
+        if not os.path.exists(self.state_path):
+            return self._new_state()
+        with open(self.state_path, encoding="utf-8") as f:
+            state = json.load(f)
+        if state["source_namespace"] != self.source_namespace:
+            raise ValueError(
+                f"Stato in {self.state_path} creato con namespace {state['source_namespace']!r}: "
+                f"usa lo stesso namespace o riparti da zero"
+            )
+        if "pagination_token" not in state and state["pages_done"] and not state["done"]:
+            raise ValueError(
+                f"Stato in {self.state_path} con avanzamento per posizione (formato precedente): riparti da zero"
+            )
+        return state
+
+    def _save_state(self):
+        # Scrittura atomica: un'interruzione non lascia il file a metà
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    async def _copy_page(self, ids: List[str]):
+        records = await self.service.fetch_records(ids, namespace=self.source_namespace)
+
+        by_namespace: Dict[str, List[Dict[str, Any]]] = {}
+        for record in records:
+            user_id = record["metadata"].get("user_id")
+            if not user_id:
+                self.state["orphans"] += 1
+                continue
+            by_namespace.setdefault(user_namespace(user_id), []).append(record)
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def upsert(namespace: str, batch: List[Dict[str, Any]]):
+            async with semaphore:
+                await self.service.upsert_vectors(batch, namespace=namespace)
+
+        await asyncio.gather(*[
+            upsert(namespace, vectors[start:start + self.batch_size])
+            for namespace, vectors in by_namespace.items()
+            for start in range(0, len(vectors), self.batch_size)
+        ])
+        for namespace, vectors in by_namespace.items():
+            self.state["copied"][namespace] = self.state["copied"].get(namespace, 0) + len(vectors)
+
+    async def copy(self):
+        """Copia dalla pagina successiva all'ultimo token salvato; lo stato è salvato dopo ogni pagina"""
+        if self.state["done"]:
+            logger.info("Copia già completata, solo verifica")
+            return
+
+        token = self.state.get("pagination_token")
+        while True:
+            ids, token = await self.service.list_id_page(
+                namespace=self.source_namespace, limit=self.page_size, pagination_token=token
+            )
+            if ids:
+                await self._copy_page(ids)
+                self.state["pages_done"] += 1
+                self.state["last_id"] = ids[-1]
+            self.state["pagination_token"] = token
+            self._save_state()
+            logger.info("Pagina %d copiata (%d vettori finora, ultimo id %s)", self.state["pages_done"],
+                        sum(self.state["copied"].values()), self.state["last_id"])
+            if token is None:
+                break
+
+        self.state["done"] = True
+        self._save_state()
+
+    async def verify(self, attempts: int = 5, interval: float = 2.0) -> Dict[str, Any]:
+        """
+        Confronta i vettori copiati con i conteggi dell'indice. Un namespace con più
+        vettori del previsto è valido (scritture in modalità dual durante la copia).
+        Le statistiche dell'indice si aggiornano con ritardo: più tentativi.
+        """
+        for attempt in range(attempts):
+            counts = await self.service.namespace_counts()
+            mismatches = {
+                namespace: {"expected": expected, "actual": counts.get(namespace, 0)}
+                for namespace, expected in self.state["copied"].items()
+                if counts.get(namespace, 0) < expected
+            }
+            # Totale: ogni vettore con user_id del sorgente deve essere in un namespace utente
+            source_count = counts.get(self.source_namespace, 0)
+            migrated_total = sum(count for name, count in counts.items() if name != self.source_namespace)
+            if source_count - self.state["orphans"] > migrated_total:
+                mismatches["*"] = {"expected": source_count - self.state["orphans"], "actual": migrated_total}
+            if not mismatches:
+                break
+            if attempt < attempts - 1:
+                await asyncio.sleep(interval)
+
+        copied = sum(self.state["copied"].values())
+        return {
+            "verified": self.state["done"] and not mismatches,
+            "done": self.state["done"],
+            "pages_done": self.state["pages_done"],
+            "namespaces": len(self.state["copied"]),
+            "copied": copied,
+            "orphans": self.state["orphans"],
+            "source_count": source_count,
+            "mismatches": mismatches,
+        }
+
+    async def run(self, verify_attempts: int = 5) -> Dict[str, Any]:
+        start = time.perf_counter()
+        await self.copy()
+        report = await self.verify(attempts=verify_attempts)
+        report["seconds"] = round(time.perf_counter() - start, 3)
+        return report
+
@@ -8,11 +8,14 @@ from typing import Optional, Tuple
 import io
 import time
 import random
+import threading
+
+from app.core.tracing import traced
 
 logger = logging.getLogger(__name__)
 
-# Try to import OCR dependencies
-TESSERACT_AVAILABLE = False
+# Try to import OCR dependencies (la verifica di Tesseract è rimandata al primo uso)
+TESSERACT_IMPORTED = False
 MAGIC_AVAILABLE = False
 
 try:
@@ -33,13 +36,7 @@ try:
                 pytesseract.pytesseract.tesseract_cmd = path
                 break
     
-    # Test Tesseract
-    try:
-        pytesseract.image_to_string(Image.new('RGB', (100, 100), 'white'))
-        TESSERACT_AVAILABLE = True
-        logger.info("✅ Tesseract OCR disponibile")
-    except Exception as e:
-        logger.warning(f"⚠️ Tesseract non funziona: {e}")
+    TESSERACT_IMPORTED = True
         
 except ImportError as e:
     logger.warning(f"⚠️ Dipendenze OCR non disponibili: {e}")
@@ -58,8 +55,42 @@ class OCRService:
             'image/jpeg', 'image/jpg', 'image/png', 
             'image/bmp', 'image/tiff', 'image/webp'
         }
-        self.tesseract_available = TESSERACT_AVAILABLE
         self.tesseract_config = r'--oem 3 --psm 6'
+        self._tesseract_available: Optional[bool] = None
+        self._check_lock = threading.Lock()
+    
+    @property
+    def tesseract_available(self) -> bool:
+        """Tesseract funzionante: verificato al primo uso (o nel warm-up), non all'import"""
+        if self._tesseract_available is None:
+            with self._check_lock:
+                if self._tesseract_available is None:
+                    self._tesseract_available = self._check_tesseract()
+        return self._tesseract_available
+    
+    def _check_tesseract(self) -> bool:
+        if not TESSERACT_IMPORTED:
+            return False
+        try:
+            pytesseract.image_to_string(Image.new('RGB', (100, 100), 'white'))
+            logger.info("✅ Tesseract OCR disponibile")
+            return True
+        except Exception as e:
+            logger.warning(f"⚠️ Tesseract non funziona: {e}")
+            return False
+    
+    def warm_up(self, language: str = 'ita+eng') -> str:
+        """
+        Verifica Tesseract e carica i dati delle lingue con un OCR su immagine vuota,
+        così la prima richiesta non paga l'avvio. Restituisce il backend OCR in uso.
+        """
+        if not self.tesseract_available:
+            return "mock"
+        try:
+            pytesseract.image_to_string(Image.new('RGB', (100, 100), 'white'), lang=language)
+        except Exception as e:
+            logger.warning(f"⚠️ Lingue OCR {language} non caricate: {e}")
+        return "tesseract"
         
     def is_supported_format(self, content_type: str) -> bool:
         """Verifica se il formato è supportato"""
@@ -84,6 +115,7 @@ class OCRService:
         else:
             return "application/octet-stream"
     
+    @traced("OCRService.tesseract")
     def _extract_text_real(self, image_data: bytes, language: str) -> Tuple[str, dict]:
         """Estrazione OCR reale con Tesseract"""
         from PIL import Image
@@ -113,6 +145,7 @@ class OCRService:
         
         return cleaned_text, metadata
     
+    @traced("OCRService.mock")
     def _extract_text_mock(self, image_data: bytes, language: str) -> Tuple[str, dict]:
         """Estrazione OCR simulata"""
         time.sleep(random.uniform(0.3, 0.8))  # Simula processing
@@ -164,6 +197,7 @@ Data: 15 Marzo 2024"""
         
         return text, metadata
     
+    @traced("OCRService.extract_text_from_image")
     def extract_text_from_image(
         self, 
         image_data: bytes, 
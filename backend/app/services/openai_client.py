@@ -1,38 +1,127 @@
+import asyncio
 import logging
-from typing import List
-from openai import OpenAI
+from typing import Any, Dict, List
+import httpx
+from openai import AsyncOpenAI
 from app.core.config import settings
+from app.core.metrics import observe_stage, record_tokens, record_provider_error
+from app.core.tracing import traced
+from app.services.singleflight import embedding_flight, chat_flight
+from app.services.rate_limiter import (
+    rate_limiter, estimate_tokens, PRIORITY_BATCH, PRIORITY_INTERACTIVE
+)
+from app.services.tokenizer import batch_by_limits, count_tokens, truncate_to_tokens
 
 logger = logging.getLogger(__name__)
 
+CHAT_MODEL = "gpt-4o-mini"
+CHAT_MAX_TOKENS = 800
+
 class OpenAIService:
+    backend = "openai"
+    
     def __init__(self, api_key: str = None):
         self.api_key = api_key or settings.openai_api_key
         if not self.api_key:
             raise ValueError("OpenAI API key non configurata")
         
-        # Inizializzazione semplificata
+        # Client async con pool di connessioni condiviso (un'istanza per processo, vedi providers)
         try:
-            self.client = OpenAI(api_key=self.api_key)
+            self.http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=settings.http_max_connections,
+                    max_keepalive_connections=settings.http_max_keepalive_connections
+                ),
+                timeout=settings.http_timeout
+            )
+            # I retry sono gestiti dal rate_limiter, non dall'SDK
+            self.client = AsyncOpenAI(api_key=self.api_key, max_retries=0, http_client=self.http_client)
             logger.info("✅ OpenAI client inizializzato")
         except Exception as e:
             logger.error(f"❌ Errore inizializzazione OpenAI: {e}")
             raise ValueError(f"Impossibile inizializzare OpenAI: {e}")
 
-    def create_embedding(self, text: str) -> List[float]:
+    async def close(self):
+        """Chiude il pool di connessioni HTTP"""
+        await self.client.close()
+
+    async def warm_up(self):
+        """Apre una connessione del pool con una chiamata gratuita (metadati del modello)"""
+        await self.client.models.retrieve(CHAT_MODEL)
+
+    def _embedding_params(self) -> Dict[str, Any]:
+        """Modello e dimensione dal registro (dimensions solo per le varianti ridotte)"""
+        params: Dict[str, Any] = {"model": settings.embedding_model}
+        if settings.embedding_dimension != settings.embedding_spec.dimension:
+            params["dimensions"] = settings.embedding_dimension
+        return params
+
+    def _fit_input(self, text: str) -> str:
+        """Tronca gli input oltre il limite di token del modello (la richiesta fallirebbe)"""
+        model = settings.embedding_spec
+        fitted = truncate_to_tokens(text, model.max_input_tokens, model.tokenizer)
+        if len(fitted) < len(text):
+            logger.warning("⚠️ Input embedding troncato a %d token (%d → %d caratteri)",
+                           model.max_input_tokens, len(text), len(fitted))
+        return fitted
+
+    @traced("OpenAIService.create_embedding")
+    async def create_embedding(self, text: str, priority: int = PRIORITY_INTERACTIVE) -> List[float]:
         """Crea embedding per un testo"""
+        if settings.coalesce_provider_calls:
+            key = (settings.embedding_model, settings.embedding_dimension, text)
+            return await embedding_flight.do(key, self._create_embedding, text, priority)
+        return await self._create_embedding(text, priority)
+
+    async def _create_embedding(self, text: str, priority: int) -> List[float]:
+        return (await self._embed_batch([self._fit_input(text)], priority))[0]
+
+    @traced("OpenAIService.create_embeddings")
+    async def create_embeddings(self, texts: List[str], priority: int = PRIORITY_BATCH) -> List[List[float]]:
+        """
+        Embedding di più testi, nello stesso ordine, con il minimo di richieste
+        entro i limiti di input e token per richiesta del modello
+        """
+        model = settings.embedding_spec
+        texts = [self._fit_input(text) for text in texts]
+        batches = batch_by_limits(texts, settings.embedding_batch_size, model.max_batch_tokens, model.tokenizer)
+        results = await asyncio.gather(*[
+            self._embed_batch([texts[i] for i in batch], priority) for batch in batches
+        ])
+        return [embedding for embeddings in results for embedding in embeddings]
+
+    async def _embed_batch(self, texts: List[str], priority: int) -> List[List[float]]:
+        params = self._embedding_params()
+        tokenizer = settings.embedding_spec.tokenizer
         try:
-            response = self.client.embeddings.create(
-                model="text-embedding-ada-002",
-                input=text
-            )
-            return response.data[0].embedding
+            with observe_stage("embedding", self.backend):
+                raw = await rate_limiter.call(
+                    params["model"],
+                    sum(count_tokens(text, tokenizer) for text in texts),
+                    lambda: self.client.embeddings.with_raw_response.create(
+                        input=texts[0] if len(texts) == 1 else texts,
+                        **params
+                    ),
+                    priority=priority
+                )
+            rate_limiter.update_from_headers(params["model"], raw.headers)
+            response = raw.parse()
+            if response.usage:
+                record_tokens("embedding", self.backend, response.usage.total_tokens)
+            return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
         except Exception as e:
+            record_provider_error(self.backend, e)
             logger.error(f"Errore creazione embedding: {e}")
             raise
 
-    def generate_answer(self, query: str, context: str) -> str:
+    @traced("OpenAIService.generate_answer")
+    async def generate_answer(self, query: str, context: str) -> str:
         """Genera una risposta basata su query e contesto"""
+        if settings.coalesce_provider_calls:
+            return await chat_flight.do((CHAT_MODEL, query, context), self._generate_answer, query, context)
+        return await self._generate_answer(query, context)
+
+    async def _generate_answer(self, query: str, context: str) -> str:
         try:
             prompt = f"""Basandoti sui seguenti documenti estratti tramite OCR, rispondi alla domanda dell'utente.
 
@@ -50,17 +139,33 @@ DOMANDA: {query}
 
 RISPOSTA:"""
 
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": "Sei un assistente AI che analizza documenti estratti tramite OCR. Il tuo compito è fornire risposte utili basandoti sul contenuto fornito, anche quando il testo è mal formattato a causa dell'OCR. Sii flessibile nell'interpretazione e utile nelle risposte."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=800,  # Aumentato per risposte più complete
-                temperature=0.1  # Più deterministico
-            )
+            messages = [
+                {"role": "system", "content": "Sei un assistente AI che analizza documenti estratti tramite OCR. Il tuo compito è fornire risposte utili basandoti sul contenuto fornito, anche quando il testo è mal formattato a causa dell'OCR. Sii flessibile nell'interpretazione e utile nelle risposte."},
+                {"role": "user", "content": prompt}
+            ]
+            # Il TPM conta anche i token massimi di output
+            tokens = sum(estimate_tokens(m["content"]) for m in messages) + CHAT_MAX_TOKENS
+            
+            with observe_stage("llm_generation", self.backend):
+                raw = await rate_limiter.call(
+                    CHAT_MODEL,
+                    tokens,
+                    lambda: self.client.chat.completions.with_raw_response.create(
+                        model=CHAT_MODEL,
+                        messages=messages,
+                        max_tokens=CHAT_MAX_TOKENS,  # Aumentato per risposte più complete
+                        temperature=0.1  # Più deterministico
+                    ),
+                    priority=PRIORITY_INTERACTIVE
+                )
+            rate_limiter.update_from_headers(CHAT_MODEL, raw.headers)
+            response = raw.parse()
+            if response.usage:
+                record_tokens("prompt", self.backend, response.usage.prompt_tokens)
+                record_tokens("completion", self.backend, response.usage.completion_tokens)
             return response.choices[0].message.content.strip()
             
         except Exception as e:
+            record_provider_error(self.backend, e)
             logger.error(f"Errore generazione risposta: {e}")
             raise
\ No newline at end of file
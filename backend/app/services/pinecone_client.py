@@ -1,10 +1,81 @@
+import asyncio
+import hashlib
+import json
 import logging
-from typing import List, Dict, Any
+import re
+from typing import List, Dict, Any, Optional, Tuple
 from app.core.config import settings
+from app.core.log_setup import log_payload, request_debug_enabled
+from app.core.metrics import observe_stage, record_provider_error
+from app.core.tracing import traced
+from app.services.singleflight import vector_query_flight
+from app.services.resilience import HedgedCaller, CircuitBreaker
 
 logger = logging.getLogger(__name__)
 
+# Id per chiamata fetch (passati in query string)
+_FETCH_BATCH_SIZE = 100
+
+NAMESPACE_MODES = ("shared", "dual", "per_user")
+
+# user_id usabili così come sono nel nome del namespace
+_NAMESPACE_SAFE_RE = re.compile(r"[A-Za-z0-9_.\-]{1,200}")
+
+
+def user_namespace(user_id: str) -> str:
+    """Namespace dei vettori di un utente (user_id non sicuri vengono sostituiti da un hash)"""
+    if _NAMESPACE_SAFE_RE.fullmatch(user_id):
+        return f"{settings.vector_namespace_prefix}{user_id}"
+    digest = hashlib.sha256(user_id.encode("utf-8")).hexdigest()[:32]
+    return f"{settings.vector_namespace_prefix}h-{digest}"
+
+
+def _namespace_mode() -> str:
+    mode = settings.vector_namespace_mode
+    if mode not in NAMESPACE_MODES:
+        raise ValueError(f"VECTOR_NAMESPACE_MODE non valido: {mode} (ammessi: {', '.join(NAMESPACE_MODES)})")
+    return mode
+
+
+def user_read_scope(user_id: str) -> Tuple[str, Optional[Dict]]:
+    """
+    Namespace e filtro per leggere i vettori di un utente: il suo namespace senza
+    filtro (per_user), oppure il namespace condiviso filtrato per user_id
+    """
+    if _namespace_mode() == "per_user":
+        return user_namespace(user_id), None
+    return "", {"user_id": user_id}
+
+
+def user_write_namespaces(user_id: str) -> List[str]:
+    """
+    Namespace in cui scrivere ed eliminare i vettori di un utente. In modalità dual
+    (durante la migrazione) le scritture vanno in entrambi, le letture nel condiviso.
+    """
+    mode = _namespace_mode()
+    if mode == "shared":
+        return [""]
+    if mode == "dual":
+        return ["", user_namespace(user_id)]
+    return [user_namespace(user_id)]
+
+# Hedging e circuit breaker condivisi da tutte le istanze
+vector_query_caller = HedgedCaller(
+    "vector_query",
+    enabled=settings.vector_hedging_enabled,
+    percentile=settings.vector_hedge_percentile,
+    min_delay=settings.vector_hedge_min_delay,
+    max_delay=settings.vector_hedge_max_delay,
+    breaker=CircuitBreaker(
+        "pinecone",
+        failure_threshold=settings.vector_breaker_failures,
+        reset_timeout=settings.vector_breaker_reset_timeout,
+    ),
+)
+
 class PineconeService:
+    backend = "pinecone"
+    
     def __init__(self):
         if not settings.pinecone_api_key:
             raise ValueError("PINECONE_API_KEY non configurata")
@@ -26,11 +97,37 @@ class PineconeService:
         
         self.index_name = settings.pinecone_index_name
         
-        # Verifica che l'indice esista
+        # Verifica che l'indice esista e ricava l'host del data plane
+        self.host = None
         self._ensure_index_exists()
+        if not self.host:
+            self.host = self.pc.describe_index(self.index_name).host
         
-        # Connettiti all'indice
-        self.index = self.pc.Index(self.index_name)
+        # Client async creato al primo uso: la sessione aiohttp richiede un event loop attivo
+        self._index = None
+
+    @property
+    def index(self):
+        """Client async del data plane, con pool di connessioni condiviso"""
+        if self._index is None:
+            self._index = self.pc.IndexAsyncio(host=self.host)
+        return self._index
+
+    async def warm_up(self):
+        """Apre la sessione del data plane con una chiamata leggera e verifica la dimensione"""
+        stats = await self.index.describe_index_stats()
+        dimension = stats.get("dimension") if isinstance(stats, dict) else getattr(stats, "dimension", None)
+        if dimension and dimension != settings.embedding_dimension:
+            logger.error(
+                "❌ Indice %s con dimensione %d, embedding %s da %d: upsert e query falliranno",
+                self.index_name, dimension, settings.embedding_model, settings.embedding_dimension,
+            )
+
+    async def close(self):
+        """Chiude la sessione HTTP del data plane"""
+        if self._index is not None:
+            await self._index.close()
+            self._index = None
 
     def _ensure_index_exists(self):
         """Verifica che l'indice esista"""
@@ -66,6 +163,7 @@ class PineconeService:
                 try:
                     index_info = next(idx for idx in indexes_response if idx.name == self.index_name)
                     if hasattr(index_info, 'host'):
+                        self.host = index_info.host
                         logger.info(f"🌐 Host indice: {index_info.host}")
                 except Exception as host_e:
                     logger.debug(f"Info host non disponibile: {host_e}")
@@ -78,27 +176,72 @@ class PineconeService:
             logger.error(f"   - Problemi di rete")
             raise
 
-    def upsert_vectors(self, vectors: List[Dict[str, Any]]) -> bool:
+    @traced("PineconeService.upsert_vectors")
+    async def upsert_vectors(self, vectors: List[Dict[str, Any]], namespace: str = "") -> bool:
         """Inserisce/aggiorna vettori in Pinecone"""
         try:
-            response = self.index.upsert(vectors=vectors)
-            logger.info(f"Upsert completato: {response}")
+            with observe_stage("vector_upsert", self.backend):
+                response = await self.index.upsert(vectors=vectors, namespace=namespace, show_progress=False)
+            logger.debug("Upsert completato: %s", response)
             return True
         except Exception as e:
+            record_provider_error(self.backend, e)
             logger.error(f"Errore upsert: {e}")
             raise
 
-    def query_vectors(self, query_vector: List[float], top_k: int = 5, 
-                     filter_dict: Dict = None, include_metadata: bool = True) -> List[Dict]:
+    @traced("PineconeService.query_vectors")
+    async def query_vectors(self, query_vector: List[float], top_k: int = 5, 
+                     filter_dict: Dict = None, include_metadata: bool = True,
+                     namespace: str = "") -> List[Dict]:
         """Cerca vettori simili"""
+        if settings.coalesce_provider_calls:
+            key = (
+                self.index_name,
+                namespace,
+                tuple(query_vector),
+                top_k,
+                json.dumps(filter_dict, sort_keys=True, default=str),
+                include_metadata,
+            )
+            return await vector_query_flight.do(
+                key, self._query_vectors, query_vector, top_k, filter_dict, include_metadata, namespace
+            )
+        return await self._query_vectors(query_vector, top_k, filter_dict, include_metadata, namespace)
+
+    async def _query_vectors(self, query_vector: List[float], top_k: int,
+                             filter_dict: Dict, include_metadata: bool, namespace: str) -> List[Dict]:
+        try:
+            with observe_stage("vector_query", self.backend):
+                return await vector_query_caller.call(
+                    self._query_index, query_vector, top_k, filter_dict, include_metadata, namespace
+                )
+        except Exception as e:
+            record_provider_error(self.backend, e)
+            raise
+
+    @traced("PineconeService.query_vectors_batch")
+    async def query_vectors_batch(self, query_vectors: List[List[float]], top_k: int = 5,
+                                  filter_dict: Dict = None, include_metadata: bool = True,
+                                  namespace: str = "") -> List[List[Dict]]:
+        """Più ricerche in parallelo (Pinecone non ha query multiple): risultati nello stesso ordine"""
+        return list(await asyncio.gather(*[
+            self.query_vectors(vector, top_k=top_k, filter_dict=filter_dict,
+                               include_metadata=include_metadata, namespace=namespace)
+            for vector in query_vectors
+        ]))
+
+    @traced("PineconeService.index_query")
+    async def _query_index(self, query_vector: List[float], top_k: int,
+                     filter_dict: Dict, include_metadata: bool, namespace: str = "") -> List[Dict]:
         try:
             # API 3.x
-            response = self.index.query(
+            response = await self.index.query(
                 vector=query_vector,
                 top_k=top_k,
                 filter=filter_dict,
                 include_metadata=include_metadata,
-                include_values=False
+                include_values=False,
+                namespace=namespace
             )
             
             matches = []
@@ -116,23 +259,27 @@ class PineconeService:
             logger.error(f"Errore query: {e}")
             raise
 
-    def list_vectors_by_filter(self, filter_dict: Dict, limit: int = 1000) -> List[Dict]:
+    @traced("PineconeService.list_vectors_by_filter")
+    async def list_vectors_by_filter(self, filter_dict: Optional[Dict], limit: int = 1000,
+                                     namespace: str = "") -> List[Dict]:
         """Lista vettori usando un filtro - metodo alternativo per recuperare documenti"""
         try:
-            # Prova con stats per vedere cosa c'è nell'indice
-            stats_response = self.index.describe_index_stats()
-            logger.info(f"Stats indice: {stats_response}")
+            # Stats dell'indice (una chiamata in più) solo con debug della richiesta
+            if request_debug_enabled():
+                stats_response = await self.index.describe_index_stats()
+                log_payload(logger, "Stats indice: %s", stats_response)
             
             # Metodo alternativo: usa query con un vettore di tutti zeri
             # ma con score molto basso per catturare tutti i match
-            zero_vector = [0.0] * 1536
+            zero_vector = [0.0] * settings.embedding_dimension
             
-            response = self.index.query(
+            response = await self.index.query(
                 vector=zero_vector,
                 top_k=limit,
                 filter=filter_dict,
                 include_metadata=True,
-                include_values=False
+                include_values=False,
+                namespace=namespace
             )
             
             matches = []
@@ -143,9 +290,106 @@ class PineconeService:
                     "metadata": match.metadata if hasattr(match, 'metadata') else {}
                 })
             
-            logger.info(f"list_vectors_by_filter trovati {len(matches)} vettori")
+            logger.debug("list_vectors_by_filter trovati %d vettori", len(matches))
             return matches
             
         except Exception as e:
             logger.error(f"Errore list_vectors_by_filter: {e}")
-            return []
\ No newline at end of file
+            return []
+
+    async def _fetch(self, ids: List[str], namespace: str) -> Dict[str, Any]:
+        """Vettori per id, in blocchi paralleli (gli id assenti non compaiono)"""
+        batches = [ids[start:start + _FETCH_BATCH_SIZE] for start in range(0, len(ids), _FETCH_BATCH_SIZE)]
+        try:
+            with observe_stage("vector_fetch", self.backend):
+                responses = await asyncio.gather(*[
+                    self.index.fetch(ids=batch, namespace=namespace) for batch in batches
+                ])
+        except Exception as e:
+            record_provider_error(self.backend, e)
+            logger.error(f"Errore fetch: {e}")
+            raise
+        
+        vectors = {}
+        for response in responses:
+            vectors.update(response.vectors)
+        return vectors
+
+    @traced("PineconeService.fetch_vectors")
+    async def fetch_vectors(self, ids: List[str], namespace: str = "") -> Dict[str, Dict]:
+        """Metadati dei vettori per id"""
+        vectors = await self._fetch(ids, namespace)
+        return {
+            vector_id: dict(getattr(vector, "metadata", None) or {})
+            for vector_id, vector in vectors.items()
+        }
+
+    @traced("PineconeService.fetch_records")
+    async def fetch_records(self, ids: List[str], namespace: str = "") -> List[Dict[str, Any]]:
+        """Vettori completi (id, valori, metadati) pronti per un nuovo upsert"""
+        vectors = await self._fetch(ids, namespace)
+        return [
+            {
+                "id": vector_id,
+                "values": list(vector.values),
+                "metadata": dict(getattr(vector, "metadata", None) or {}),
+            }
+            for vector_id, vector in vectors.items()
+        ]
+
+    async def namespace_counts(self) -> Dict[str, int]:
+        """Numero di vettori per namespace (da describe_index_stats, aggiornato con ritardo)"""
+        stats = await self.index.describe_index_stats()
+        namespaces = stats["namespaces"] if isinstance(stats, dict) else stats.namespaces
+        return {
+            name: summary["vector_count"] if isinstance(summary, dict) else summary.vector_count
+            for name, summary in (namespaces or {}).items()
+        }
+
+    @traced("PineconeService.list_ids")
+    async def list_ids(self, prefix: str, limit: int = 100, namespace: str = "") -> List[str]:
+        """Id dei vettori che iniziano con prefix (solo id, nessun metadato né vettore)"""
+        ids = []
+        with observe_stage("vector_list", self.backend):
+            async for page in self.index.list(prefix=prefix, limit=limit, namespace=namespace):
+                ids.extend(page)
+        return ids
+
+    async def list_id_page(self, namespace: str = "", limit: int = 100,
+                           pagination_token: Optional[str] = None) -> Tuple[List[str], Optional[str]]:
+        """Una pagina di id del namespace e il token della successiva (None all'ultima)"""
+        try:
+            response = await self.index.list_paginated(
+                limit=limit, pagination_token=pagination_token, namespace=namespace
+            )
+        except Exception as e:
+            record_provider_error(self.backend, e)
+            logger.error(f"Errore list: {e}")
+            raise
+        pagination = getattr(response, "pagination", None)
+        return [vector.id for vector in response.vectors], getattr(pagination, "next", None)
+
+    @traced("PineconeService.delete_vectors")
+    async def delete_vectors(self, ids: List[str], batch_size: Optional[int] = None,
+                             namespace: str = "") -> int:
+        """
+        Elimina i vettori in blocchi di batch_size id per chiamata, con al massimo
+        DELETE_CONCURRENCY chiamate in parallelo. Restituisce il numero di id inviati.
+        """
+        batch_size = batch_size or settings.delete_batch_size
+        batches = [ids[start:start + batch_size] for start in range(0, len(ids), batch_size)]
+        semaphore = asyncio.Semaphore(settings.delete_concurrency)
+
+        async def delete_batch(batch: List[str]):
+            async with semaphore:
+                await self.index.delete(ids=batch, namespace=namespace)
+
+        try:
+            with observe_stage("vector_delete", self.backend):
+                await asyncio.gather(*[delete_batch(batch) for batch in batches])
+            logger.debug("Eliminati %d vettori in %d chiamate", len(ids), len(batches))
+            return len(ids)
+        except Exception as e:
+            record_provider_error(self.backend, e)
+            logger.error(f"Errore delete: {e}")
+            raise
@@ -0,0 +1,88 @@
+"""
+Istanze condivise dei client dei provider
+Un solo client per processo, così i pool di connessioni HTTP vengono riusati.
+Il provider (reale o stand-in locale) è scelto da LLM_PROVIDER / VECTOR_PROVIDER;
+gli embedding usano il servizio LLM salvo modelli locali del registro (EMBEDDING_MODEL).
+"""
+
+import asyncio
+import logging
+import threading
+from typing import Optional, Union
+
+from app.core.config import settings
+from app.services.local_embeddings import LocalEmbeddingService
+from app.services.openai_client import OpenAIService
+from app.services.pinecone_client import PineconeService
+from app.services.standins import StandInOpenAIService, MemoryPineconeService
+
+logger = logging.getLogger(__name__)
+
+_openai_service: Optional[OpenAIService] = None
+_pinecone_service: Optional[PineconeService] = None
+_embedding_service: Optional[LocalEmbeddingService] = None
+# Il client Pinecone può essere creato da un thread (warm-up) e dall'event loop insieme
+_pinecone_lock = threading.Lock()
+
+
+def get_openai_service() -> OpenAIService:
+    """Restituisce il servizio OpenAI condiviso"""
+    global _openai_service
+    if _openai_service is None:
+        if settings.llm_provider == "openai":
+            _openai_service = OpenAIService()
+        elif settings.llm_provider == "standin":
+            _openai_service = StandInOpenAIService()
+        else:
+            raise ValueError(f"LLM_PROVIDER non valido: {settings.llm_provider} (openai, standin)")
+    return _openai_service
+
+
+def get_embedding_service() -> Union[OpenAIService, LocalEmbeddingService]:
+    """Servizio per gli embedding: locale su CPU per i modelli con provider local, altrimenti quello LLM"""
+    global _embedding_service
+    if settings.embedding_spec.provider != "local":
+        return get_openai_service()
+    if _embedding_service is None:
+        _embedding_service = LocalEmbeddingService()
+    return _embedding_service
+
+
+def get_pinecone_service() -> PineconeService:
+    """Restituisce il servizio Pinecone condiviso"""
+    global _pinecone_service
+    if _pinecone_service is None:
+        with _pinecone_lock:
+            if _pinecone_service is None:
+                if settings.vector_provider == "pinecone":
+                    _pinecone_service = PineconeService()
+                elif settings.vector_provider == "memory":
+                    _pinecone_service = MemoryPineconeService()
+                else:
+                    raise ValueError(f"VECTOR_PROVIDER non valido: {settings.vector_provider} (pinecone, memory)")
+    return _pinecone_service
+
+
+async def get_pinecone_service_async() -> PineconeService:
+    """
+    Come get_pinecone_service, per il codice async: la creazione del client fa chiamate
+    sincrone al control plane (describe_index / list_indexes) ed è eseguita in un thread
+    """
+    if _pinecone_service is not None:
+        return _pinecone_service
+    return await asyncio.to_thread(get_pinecone_service)
+
+
+async def close_providers():
+    """Chiude i pool di connessioni dei client creati"""
+    global _openai_service, _pinecone_service, _embedding_service
+    for service in (_openai_service, _pinecone_service, _embedding_service):
+        if service is None:
+            continue
+        try:
+            await service.close()
+        except Exception as e:
+            logger.warning(f"Errore chiusura client {service.__class__.__name__}: {e}")
+    _openai_service = None
+    _pinecone_service = None
+    _embedding_service = None
@@ -1,134 +1,323 @@
+import asyncio
 import logging
-from typing import List, Dict, Any
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
 from app.core.config import settings
-from app.services.openai_client import OpenAIService
-from app.services.pinecone_client import PineconeService
+from app.core.log_setup import log_payload
+from app.core.metrics import record_chunks
+from app.core.timing import request_stage
+from app.core.tracing import traced
+from app.services.document_service import document_service
+from app.services.pinecone_client import user_read_scope, user_write_namespaces
+from app.services.providers import get_embedding_service, get_openai_service, get_pinecone_service_async
+from app.services.rate_limiter import PRIORITY_BATCH, PRIORITY_INTERACTIVE
 
 logger = logging.getLogger(__name__)
 
-def upsert_chunks(user_id: str, item_id: str, title: str, chunks: List[str], 
+def chunk_vectors(user_id: str, item_id: str, title: str, chunks: List[str],
+                  embeddings: List[List[float]], additional_metadata: Dict = None,
+                  timestamp: str = None) -> List[Dict[str, Any]]:
+    """
+    Vettori Pinecone (id {item_id}_NNNN e metadati) per i chunk di un documento
+    """
+    # Timestamp per tutti i chunk del documento
+    timestamp = timestamp or datetime.now().isoformat()
+    upload_ts = int(datetime.fromisoformat(timestamp).timestamp())
+    
+    vectors = []
+    for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
+        # Prepara metadati base
+        metadata = {
+            "user_id": user_id,
+            "item_id": item_id,
+            "title": title,
+            "chunk_index": i,
+            "text": chunk,
+            "preview": chunk[:200] + "..." if len(chunk) > 200 else chunk,
+            "timestamp": timestamp,
+            "created_at": timestamp,
+            # Secondi epoch: i filtri per intervallo di Pinecone valgono solo su numeri
+            "upload_ts": upload_ts
+        }
+        
+        # Aggiungi metadati aggiuntivi se forniti
+        if additional_metadata:
+            metadata.update(additional_metadata)
+        
+        vectors.append({
+            "id": f"{item_id}_{i:04d}",
+            "values": embedding,
+            "metadata": metadata
+        })
+    return vectors
+
+async def upsert_user_vectors(user_id: str, vectors: List[Dict[str, Any]]):
+    """
+    Upsert nel namespace dell'utente (in entrambi durante la migrazione),
+    in blocchi da UPSERT_BATCH_SIZE vettori inviati in parallelo
+    """
+    pinecone_service = await get_pinecone_service_async()
+    size = settings.upsert_batch_size
+    with request_stage("upsert", vectors=len(vectors)):
+        results = await asyncio.gather(*[
+            pinecone_service.upsert_vectors(vectors[start:start + size], namespace=namespace)
+            for namespace in user_write_namespaces(user_id)
+            for start in range(0, len(vectors), size)
+        ])
+    if not all(results):
+        raise Exception("Errore durante upsert in Pinecone")
+    record_chunks(pinecone_service.backend, len(vectors))
+
+@traced("rag.upsert_chunks")
+async def upsert_chunks(user_id: str, item_id: str, title: str, chunks: List[str], 
                   additional_metadata: Dict = None) -> List[str]:
     """
     Crea embeddings per i chunks e li salva in Pinecone
     """
     try:
-        from datetime import datetime
-        openai_service = OpenAIService()
-        pinecone_service = PineconeService()
-        
-        vectors = []
-        chunk_ids = []
+        embedding_service = get_embedding_service()
         
-        # Timestamp per tutti i chunk del documento
-        timestamp = datetime.now().isoformat()
+        # Embedding dei chunk in blocchi entro i limiti del modello (priorità bassa: l'ingest cede il passo alla chat)
+        with request_stage("embed", chunks=len(chunks)):
+            embeddings = await embedding_service.create_embeddings(chunks, priority=PRIORITY_BATCH)
         
-        for i, chunk in enumerate(chunks):
-            # Crea ID univoco per il chunk
-            chunk_id = f"{item_id}_{i:04d}"
-            chunk_ids.append(chunk_id)
-            
-            # Crea embedding
-            embedding = openai_service.create_embedding(chunk)
-            
-            # Prepara metadati base
-            metadata = {
-                "user_id": user_id,
-                "item_id": item_id,
-                "title": title,
-                "chunk_index": i,
-                "text": chunk,
-                "preview": chunk[:200] + "..." if len(chunk) > 200 else chunk,
-                "timestamp": timestamp,
-                "created_at": timestamp
-            }
-            
-            # Aggiungi metadati aggiuntivi se forniti
-            if additional_metadata:
-                metadata.update(additional_metadata)
-            
-            # Prepara vettore per Pinecone
-            vector = {
-                "id": chunk_id,
-                "values": embedding,
-                "metadata": metadata
-            }
-            vectors.append(vector)
-        
-        # Upsert in Pinecone
-        success = pinecone_service.upsert_vectors(vectors)
-        
-        if success:
-            logger.info(f"Upsert completato per {len(chunks)} chunks")
-            return chunk_ids
-        else:
-            raise Exception("Errore durante upsert in Pinecone")
+        vectors = chunk_vectors(user_id, item_id, title, chunks, embeddings, additional_metadata)
+        await upsert_user_vectors(user_id, vectors)
+        logger.info("Upsert completato per %d chunks", len(chunks))
+        return [vector["id"] for vector in vectors]
             
     except Exception as e:
         logger.error(f"Errore upsert_chunks: {e}")
         raise
 
-def semantic_search(user_id: str, query: str, top_k: int = 5) -> List[Dict]:
+def metadata_filter(item_id: Optional[str] = None, file_type: Optional[str] = None,
+                    uploaded_after: Optional[datetime] = None, uploaded_before: Optional[datetime] = None,
+                    min_ocr_confidence: Optional[float] = None) -> Optional[Dict]:
+    """
+    Filtro Pinecone per i filtri di ricerca (None se nessuno è impostato).
+    Le date usano upload_ts: i chunk indicizzati prima del campo non hanno data e sono esclusi.
+    """
+    filter_dict: Dict[str, Any] = {}
+    if item_id is not None:
+        filter_dict["item_id"] = {"$eq": item_id}
+    if file_type is not None:
+        filter_dict["file_type"] = {"$eq": file_type}
+    upload_range = {}
+    if uploaded_after is not None:
+        upload_range["$gte"] = int(uploaded_after.timestamp())
+    if uploaded_before is not None:
+        upload_range["$lte"] = int(uploaded_before.timestamp())
+    if upload_range:
+        filter_dict["upload_ts"] = upload_range
+    if min_ocr_confidence is not None:
+        filter_dict["ocr_confidence"] = {"$gte": min_ocr_confidence}
+    return filter_dict or None
+
+@traced("rag.semantic_search")
+async def semantic_search(user_id: str, query: str, top_k: int = 5,
+                          filters: Optional[Dict] = None, window: int = 0) -> List[Dict]:
     """
-    Cerca chunks simili alla query
+    Cerca chunks simili alla query (filters: filtro metadati, vedi metadata_filter;
+    window: chunk adiacenti da aggiungere a ogni risultato, vedi expand_neighbors)
     """
     try:
-        openai_service = OpenAIService()
-        pinecone_service = PineconeService()
+        embedding_service = get_embedding_service()
+        pinecone_service = await get_pinecone_service_async()
         
         # Crea embedding della query
-        query_embedding = openai_service.create_embedding(query)
+        with request_stage("embed"):
+            query_embedding = await embedding_service.create_embedding(query)
         
         # Cerca in Pinecone
-        filter_dict = {"user_id": user_id}
-        matches = pinecone_service.query_vectors(
-            query_vector=query_embedding,
-            top_k=top_k,
-            filter_dict=filter_dict
-        )
+        namespace, filter_dict = _search_scope(user_id, filters)
+        if filter_dict is _NO_MATCHES:
+            return []
+        with request_stage("vector_query"):
+            matches = await pinecone_service.query_vectors(
+                query_vector=query_embedding,
+                top_k=top_k,
+                filter_dict=filter_dict,
+                namespace=namespace
+            )
         
-        logger.info(f"Trovati {len(matches)} matches per la query")
+        logger.debug("Trovati %d matches per la query", len(matches))
+        if window:
+            matches = (await expand_neighbors(user_id, [matches], window))[0]
         return matches
         
     except Exception as e:
         logger.error(f"Errore semantic_search: {e}")
         raise
 
-def answer_from_context(query: str, contexts: List[Dict]) -> str:
+@traced("rag.semantic_search_batch")
+async def semantic_search_batch(user_id: str, queries: List[str], top_k: int = 5,
+                                filters: Optional[Dict] = None, window: int = 0) -> List[List[Dict]]:
     """
-    Genera una risposta basata sui contesti trovati
+    Cerca i chunks per più query: un'unica chiamata di embedding e ricerche
+    in parallelo (un solo prodotto matriciale sull'indice locale)
     """
     try:
-        openai_service = OpenAIService()
+        namespace, filter_dict = _search_scope(user_id, filters)
+        if filter_dict is _NO_MATCHES:
+            return [[] for _ in queries]
+
+        embedding_service = get_embedding_service()
+        pinecone_service = await get_pinecone_service_async()
+
+        # Query ripetute: un solo embedding e una sola ricerca
+        unique = list(dict.fromkeys(queries))
+        with request_stage("embed"):
+            embeddings = await embedding_service.create_embeddings(unique, priority=PRIORITY_INTERACTIVE)
+
+        with request_stage("vector_query"):
+            results = await pinecone_service.query_vectors_batch(
+                query_vectors=embeddings,
+                top_k=top_k,
+                filter_dict=filter_dict,
+                namespace=namespace
+            )
+
+        if window:
+            results = await expand_neighbors(user_id, results, window)
+        by_query = dict(zip(unique, results))
+        logger.debug("Batch di %d query (%d distinte)", len(queries), len(unique))
+        return [by_query[query] for query in queries]
+
+    except Exception as e:
+        logger.error(f"Errore semantic_search_batch: {e}")
+        raise
+
+@traced("rag.expand_neighbors")
+async def expand_neighbors(user_id: str, results: List[List[Dict]], window: int) -> List[List[Dict]]:
+    """
+    Copie dei risultati con i chunk ±window dello stesso documento (campo neighbors);
+    i risultati originali possono essere condivisi dal single-flight e non vengono modificati.
+    Gli id dei chunk sono {item_id}_NNNN: i vicini di tutti i risultati si leggono
+    con un unico fetch per id, senza altre ricerche vettoriali.
+    """
+    wanted: Dict[str, List[str]] = {}
+    for matches in results:
+        for match in matches:
+            metadata = match.get("metadata") or {}
+            item_id, index = metadata.get("item_id"), metadata.get("chunk_index")
+            if item_id is None or index is None:
+                continue
+            wanted[match["id"]] = [
+                f"{item_id}_{i:04d}"
+                for i in range(max(0, index - window), index + window + 1)
+                if i != index
+            ]
+    ids = sorted({vector_id for neighbor_ids in wanted.values() for vector_id in neighbor_ids})
+    if not ids:
+        return results
+
+    namespace, _ = user_read_scope(user_id)
+    with request_stage("vector_fetch", ids=len(ids)):
+        fetched = await (await get_pinecone_service_async()).fetch_vectors(ids, namespace=namespace)
+
+    def neighbors(match_id: str) -> List[Dict]:
+        # Id oltre l'ultimo chunk non esistono; nel namespace condiviso si scartano chunk di altri utenti
+        return [
+            {"id": vector_id, "metadata": fetched[vector_id]}
+            for vector_id in wanted[match_id]
+            if vector_id in fetched and fetched[vector_id].get("user_id") == user_id
+        ]
+
+    return [
+        [{**match, "neighbors": neighbors(match["id"])} if match["id"] in wanted else match for match in matches]
+        for matches in results
+    ]
+
+# Filtro che nessun chunk può rispettare: la ricerca non viene eseguita
+_NO_MATCHES = object()
+
+def _search_scope(user_id: str, filters: Optional[Dict] = None):
+    """Namespace e filtro di lettura dell'utente con i filtri richiesti, esclusi i documenti in eliminazione"""
+    namespace, filter_dict = user_read_scope(user_id)
+    if filters:
+        filter_dict = {**(filter_dict or {}), **filters}
+    # Documenti eliminati la cui rimozione dall'indice è ancora in corso
+    deleted = document_service.deleted_item_ids(user_id)
+    if deleted:
+        requested = (filters or {}).get("item_id")
+        if isinstance(requested, dict):
+            requested = requested.get("$eq")
+        if requested is None:
+            filter_dict = {**(filter_dict or {}), "item_id": {"$nin": deleted}}
+        elif requested in deleted:
+            return namespace, _NO_MATCHES
+    return namespace, filter_dict
+
+def _context_text(ctx: Dict) -> str:
+    """Testo di un contesto: risultato di /query (metadata) o contesto già estratto dal client"""
+    metadata = ctx.get('metadata') or {}
+    return metadata.get('chunk_text') or metadata.get('text') or ctx.get('text', '')
+
+def _context_chunks(contexts: List[Dict]) -> List[Tuple[str, List[str]]]:
+    """
+    (titolo, testi) per ogni contesto, con i chunk vicini di expand_neighbors uniti
+    in ordine di chunk; un chunk già incluso da un altro contesto non viene ripetuto
+    """
+    seen = set()
+    blocks = []
+    for ctx in contexts:
+        metadata = ctx.get('metadata') or {}
+        title = metadata.get('title') or ctx.get('title') or 'Documento'
+        chunks = [ctx, *(ctx.get('neighbors') or [])]
+        own_index = metadata.get('chunk_index')
+        if own_index is not None:
+            chunks.sort(key=lambda c: (c.get('metadata') or {}).get('chunk_index', own_index))
+        texts = []
+        for chunk in chunks:
+            chunk_id = chunk.get('id')
+            if chunk_id is not None:
+                if chunk_id in seen:
+                    continue
+                seen.add(chunk_id)
+            text = _context_text(chunk)
+            if text:
+                texts.append(text)
+        if texts:
+            blocks.append((title, texts))
+    return blocks
+
+@traced("rag.answer_from_context")
+async def answer_from_context(query: str, contexts: List[Dict]) -> str:
+    """
+    Genera una risposta basata sui contesti trovati (con i chunk vicini, se presenti)
+    """
+    try:
+        openai_service = get_openai_service()
         
         # Pulisce e prepara il contesto
         cleaned_contexts = []
-        for ctx in contexts:
-            # Estrai il testo dal contesto
-            text = ctx.get('metadata', {}).get('chunk_text', '') or ctx.get('text', '')
-            title = ctx.get('metadata', {}).get('title', 'Documento')
-            
-            # Pulizia testo OCR
-            if text:
-                # Rimuovi caratteri di formattazione OCR
+        for title, texts in _context_chunks(contexts):
+            cleaned = []
+            for text in texts:
+                # Pulizia testo OCR: rimuovi caratteri di formattazione
                 text = text.replace('|', ' ')
                 text = text.replace('\\-', '-')
                 text = text.replace('  ', ' ')
                 text = ' '.join(text.split())  # Normalizza spazi
-                
-                cleaned_contexts.append(f"Documento '{title}':\n{text}")
+                if text:
+                    cleaned.append(text)
+            
+            if cleaned:
+                cleaned_contexts.append(f"Documento '{title}':\n" + "\n".join(cleaned))
         
         if not cleaned_contexts:
             return "Non sono riuscito a trovare contenuto leggibile nei documenti."
         
         context_text = "\n\n".join(cleaned_contexts)
         
-        # Log del contesto per debug
-        logger.info(f"Contesto preparato per AI (prime 200 caratteri): {context_text[:200]}...")
+        # Anteprima del contesto solo con debug della richiesta
+        log_payload(logger, "Contesto preparato per AI (prime 200 caratteri): %.200s...", context_text)
         
         # Genera risposta
-        answer = openai_service.generate_answer(query, context_text)
+        with request_stage("llm"):
+            answer = await openai_service.generate_answer(query, context_text)
         
-        logger.info("Risposta generata con successo")
+        logger.debug("Risposta generata con successo")
         return answer
         
     except Exception as e:
@@ -0,0 +1,265 @@
+"""
+Scheduler rate-limit per le chiamate OpenAI
+Token bucket RPM/TPM per modello, sincronizzato con gli header
+x-ratelimit-* e con retry a backoff esponenziale con jitter
+"""
+
+import asyncio
+import logging
+import random
+import re
+import time
+from typing import Any, Awaitable, Callable, Dict, Mapping, Optional
+
+from app.core.config import settings
+from app.core.metrics import register_queue
+
+logger = logging.getLogger(__name__)
+
+# Priorità: le richieste interattive (chat, query) passano prima dell'ingest
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+
+# Intervallo con cui l'ingest ricontrolla se ci sono richieste interattive in attesa
+_YIELD_INTERVAL = 0.01
+
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_reset_duration(value: Optional[str]) -> Optional[float]:
+    """Converte durate OpenAI ('20ms', '1s', '6m0s') in secondi"""
+    if not value:
+        return None
+    parts = _DURATION_RE.findall(value)
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def estimate_tokens(text: str) -> int:
+    """Stima grossolana dei token (~4 caratteri per token)"""
+    return len(text) // 4 + 1
+
+
+class TokenBucket:
+    """Bucket che si ricarica in modo continuo fino alla capacità per minuto"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.available = float(per_minute)
+        self.updated = time.monotonic()
+
+    @property
+    def rate(self) -> float:
+        return self.capacity / 60.0
+
+    def refill(self, now: float):
+        elapsed = max(0.0, now - self.updated)
+        self.available = min(self.capacity, self.available + elapsed * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, reserve: float = 0.0) -> float:
+        """Secondi di attesa perché amount sia disponibile lasciando intatta la riserva"""
+        # Una richiesta più grande della capacità passa quando il bucket è pieno
+        needed = min(amount, self.capacity) + reserve * self.capacity
+        needed = min(needed, self.capacity)
+        missing = needed - self.available
+        if missing <= 0:
+            return 0.0
+        return missing / self.rate if self.rate > 0 else 60.0
+
+    def consume(self, amount: float):
+        self.available -= amount
+
+    def sync(self, limit: Optional[int], remaining: Optional[int]):
+        """Allinea il bucket ai valori comunicati dal provider"""
+        if limit:
+            self.capacity = float(limit)
+        if remaining is not None:
+            self.available = min(self.available, float(remaining))
+
+
+class ModelLimits:
+    """Stato dei limiti per un singolo modello"""
+
+    def __init__(self, rpm: int, tpm: int):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.blocked_until = 0.0
+        self.interactive_waiting = 0
+
+
+class RateLimitScheduler:
+    """
+    Scheduler client-side: attende capacità, poi esegue con retry.
+    Va usato da un solo event loop: lo stato non è protetto da lock.
+    """
+
+    def __init__(self, default_rpm: int, default_tpm: int, interactive_reserve: float = 0.2,
+                 max_retries: int = 5, backoff_base: float = 0.5, backoff_max: float = 30.0):
+        self.default_rpm = default_rpm
+        self.default_tpm = default_tpm
+        self.interactive_reserve = interactive_reserve
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._models: Dict[str, ModelLimits] = {}
+        self._waiting = 0
+        self._retries = 0
+        self._throttled = 0
+
+    def _limits(self, model: str) -> ModelLimits:
+        limits = self._models.get(model)
+        if limits is None:
+            limits = ModelLimits(self.default_rpm, self.default_tpm)
+            self._models[model] = limits
+        return limits
+
+    async def acquire(self, model: str, tokens: int, priority: int = PRIORITY_INTERACTIVE):
+        """Attende finché il modello ha capacità per una richiesta da `tokens` token"""
+        interactive = priority == PRIORITY_INTERACTIVE
+        limits = self._limits(model)
+        self._waiting += 1
+        if interactive:
+            limits.interactive_waiting += 1
+        try:
+            while True:
+                now = time.monotonic()
+                limits.requests.refill(now)
+                limits.tokens.refill(now)
+
+                # L'ingest lascia una riserva e cede il passo alle richieste interattive
+                reserve = 0.0 if interactive else self.interactive_reserve
+                wait = max(
+                    limits.blocked_until - now,
+                    limits.requests.wait_time(1, reserve),
+                    limits.tokens.wait_time(tokens, reserve),
+                )
+                yielding = not interactive and limits.interactive_waiting > 0
+                if wait <= 0 and not yielding:
+                    limits.requests.consume(1)
+                    limits.tokens.consume(tokens)
+                    return
+                # Controllo e consumo avvengono senza await in mezzo: niente race nel loop
+                await asyncio.sleep(wait if wait > 0 else _YIELD_INTERVAL)
+        finally:
+            self._waiting -= 1
+            if interactive:
+                limits.interactive_waiting -= 1
+
+    def update_from_headers(self, model: str, headers: Mapping[str, str]):
+        """Aggiorna i bucket dagli header x-ratelimit-* della risposta"""
+        def _int(name: str) -> Optional[int]:
+            value = headers.get(name)
+            try:
+                return int(value) if value is not None else None
+            except ValueError:
+                return None
+
+        limits = self._limits(model)
+        limits.requests.sync(_int("x-ratelimit-limit-requests"), _int("x-ratelimit-remaining-requests"))
+        limits.tokens.sync(_int("x-ratelimit-limit-tokens"), _int("x-ratelimit-remaining-tokens"))
+
+    def _backoff(self, model: str, attempt: int, headers: Optional[Mapping[str, str]]) -> float:
+        """Full jitter, rispettando retry-after se presente; blocca il modello per tutti"""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if headers:
+            retry_after = None
+            if headers.get("retry-after-ms"):
+                retry_after = parse_reset_duration(headers.get("retry-after-ms") + "ms")
+            elif headers.get("retry-after"):
+                retry_after = parse_reset_duration(headers.get("retry-after"))
+            reset = max(
+                parse_reset_duration(headers.get("x-ratelimit-reset-requests")) or 0.0,
+                parse_reset_duration(headers.get("x-ratelimit-reset-tokens")) or 0.0,
+            )
+            delay = max(delay, retry_after or 0.0, reset if retry_after is None else 0.0)
+        limits = self._limits(model)
+        limits.blocked_until = max(limits.blocked_until, time.monotonic() + delay)
+        return delay
+
+    async def call(self, model: str, tokens: int, fn: Callable[[], Awaitable[Any]],
+                   priority: int = PRIORITY_INTERACTIVE) -> Any:
+        """Esegue fn rispettando i limiti, con retry sugli errori transitori"""
+        attempt = 0
+        while True:
+            await self.acquire(model, tokens, priority)
+            try:
+                return await fn()
+            except Exception as e:
+                if not is_retryable(e) or attempt >= self.max_retries:
+                    raise
+                response = getattr(e, "response", None)
+                delay = self._backoff(model, attempt, getattr(response, "headers", None))
+                attempt += 1
+                self._retries += 1
+                if getattr(e, "status_code", None) == 429:
+                    self._throttled += 1
+                logger.warning(f"⏳ {model}: errore transitorio ({e.__class__.__name__}), retry {attempt} tra {delay:.2f}s")
+
+    @property
+    def waiting(self) -> int:
+        """Richieste in attesa di capacità"""
+        return self._waiting
+
+    def stats(self) -> Dict[str, Any]:
+        """Stato corrente dello scheduler"""
+        return {
+            "waiting": self._waiting,
+            "retries": self._retries,
+            "throttled": self._throttled,
+            "models": {
+                model: {
+                    "rpm_limit": int(limits.requests.capacity),
+                    "tpm_limit": int(limits.tokens.capacity),
+                    "requests_available": int(limits.requests.available),
+                    "tokens_available": int(limits.tokens.available),
+                }
+                for model, limits in self._models.items()
+            },
+        }
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    429, errori 5xx, timeout e problemi di connessione sono transitori; gli altri
+    errori (400 per dimensione o filtro non validi, 401, 404...) no.
+    Usata dai retry di OpenAI e dal circuit breaker delle query vettoriali.
+    """
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    try:
+        import openai
+        if isinstance(error, (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)):
+            return True
+    except ImportError:
+        pass
+    try:
+        import aiohttp
+        if isinstance(error, aiohttp.ClientConnectionError):
+            return True
+    except ImportError:
+        pass
+    # status_code (OpenAI, stand-in) o status (eccezioni del client Pinecone)
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(error, "status", None)
+    if not isinstance(status, int):
+        return False
+    return status == 429 or status >= 500
+
+
+# Istanza globale, condivisa da tutte le istanze di OpenAIService
+rate_limiter = RateLimitScheduler(
+    default_rpm=settings.openai_rpm_limit,
+    default_tpm=settings.openai_tpm_limit,
+    interactive_reserve=settings.openai_interactive_reserve,
+    max_retries=settings.openai_max_retries,
+    backoff_base=settings.openai_backoff_base,
+    backoff_max=settings.openai_backoff_max,
+)
+register_queue("openai_rate_limiter", lambda: rate_limiter.waiting)
@@ -0,0 +1,200 @@
+"""
+Resilienza per le query vettoriali
+Hedging delle richieste lente e circuit breaker per backend degradati
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+from app.services.rate_limiter import is_retryable
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Backend degradato: la chiamata viene rifiutata subito"""
+
+
+class LatencyTracker:
+    """Finestra mobile delle latenze recenti, per calcolare i percentili"""
+
+    def __init__(self, window: int = 500):
+        self._samples: Deque[float] = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))
+        return ordered[index]
+
+
+class CircuitBreaker:
+    """
+    Closed → open dopo N errori consecutivi; dopo reset_timeout lascia
+    passare una sola chiamata di prova (half-open) prima di richiudersi
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        """True se la chiamata può partire"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        if self.state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            logger.info(f"✅ Circuit breaker {self.name} richiuso")
+        self.state = self.CLOSED
+        self._failures = 0
+        self._probe_in_flight = False
+
+    def release_probe(self):
+        """La chiamata di prova è stata cancellata: ne permette un'altra"""
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self._failures += 1
+        if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning(f"⚠️ Circuit breaker {self.name} aperto dopo {self._failures} errori")
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {"state": self.state, "consecutive_failures": self._failures}
+
+
+class HedgedCaller:
+    """
+    Esegue una chiamata e, se non risponde entro il percentile configurato
+    delle latenze recenti, ne lancia un duplicato: vince la prima risposta
+    e la chiamata perdente viene cancellata.
+    """
+
+    def __init__(self, name: str, enabled: bool = True, percentile: float = 95.0,
+                 min_delay: float = 0.05, max_delay: float = 2.0, min_samples: int = 20,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.name = name
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.min_samples = min_samples
+        self.breaker = breaker
+        self.latencies = LatencyTracker()
+        self._hedged = 0
+        self._hedge_wins = 0
+        self._rejected = 0
+
+    def hedge_delay(self) -> float:
+        """Ritardo prima del duplicato; prudente finché non ci sono abbastanza campioni"""
+        if len(self.latencies) < self.min_samples:
+            return self.max_delay
+        delay = self.latencies.percentile(self.percentile) or self.max_delay
+        return min(self.max_delay, max(self.min_delay, delay))
+
+    async def _timed(self, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        start = time.perf_counter()
+        result = await fn(*args, **kwargs)
+        self.latencies.record(time.perf_counter() - start)
+        return result
+
+    async def _hedged_call(self, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        primary = asyncio.ensure_future(self._timed(fn, *args, **kwargs))
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=self.hedge_delay())
+        except asyncio.CancelledError:
+            primary.cancel()
+            raise
+        if done:
+            return primary.result()
+
+        self._hedged += 1
+        hedge = asyncio.ensure_future(self._timed(fn, *args, **kwargs))
+        pending = {primary, hedge}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self._hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def call(self, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """Esegue fn con circuit breaker e hedging; a circuito aperto solleva subito CircuitOpenError"""
+        if self.breaker and not self.breaker.allow():
+            self._rejected += 1
+            raise CircuitOpenError(f"{self.name} temporaneamente non disponibile")
+
+        try:
+            if self.enabled:
+                result = await self._hedged_call(fn, *args, **kwargs)
+            else:
+                result = await self._timed(fn, *args, **kwargs)
+        except asyncio.CancelledError:
+            if self.breaker:
+                self.breaker.release_probe()
+            raise
+        except Exception as e:
+            if self.breaker:
+                # Solo timeout, connessione, 429 e 5xx indicano un backend degradato:
+                # un 400 (dimensione, filtro) non apre il circuito
+                if is_retryable(e):
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.release_probe()
+            raise
+
+        if self.breaker:
+            self.breaker.record_success()
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        p50 = self.latencies.percentile(50)
+        p99 = self.latencies.percentile(99)
+        return {
+            "hedging_enabled": self.enabled,
+            "hedge_delay_ms": round(self.hedge_delay() * 1000, 1),
+            "hedged": self._hedged,
+            "hedge_wins": self._hedge_wins,
+            "rejected": self._rejected,
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p99_ms": round(p99 * 1000, 1) if p99 is not None else None,
+            "breaker": self.breaker.stats() if self.breaker else None,
+        }
@@ -0,0 +1,74 @@
+"""
+Single-flight per le chiamate ai provider (OpenAI / Pinecone / embedding locali)
+Chiamate identiche concorrenti condividono un'unica richiesta in volo
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from app.core.metrics import record_cache_hit
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    Raggruppa chiamate identiche in corso: la prima avvia la richiesta,
+    le successive con la stessa chiave attendono lo stesso task.
+    Il risultato è condiviso tra i chiamanti: non va modificato.
+    """
+
+    def __init__(self, name: str, backend: str):
+        self.name = name
+        self.backend = backend
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self._calls = 0
+        self._coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """Esegue fn una sola volta per tutte le chiamate concorrenti con la stessa chiave"""
+        self._calls += 1
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn(*args, **kwargs))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._release(key, t))
+        else:
+            self._coalesced += 1
+            record_cache_hit(f"singleflight_{self.name}", self.backend)
+            logger.debug(f"[{self.name}] chiamata accodata a richiesta già in volo")
+
+        # shield: la cancellazione di un chiamante non interrompe gli altri
+        return await asyncio.shield(task)
+
+    def _release(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Evita warning "exception never retrieved" se tutti i chiamanti sono stati cancellati
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, int]:
+        """Statistiche: chiamate totali, accodate e in volo"""
+        return {
+            "calls": self._calls,
+            "coalesced": self._coalesced,
+            "in_flight": len(self._inflight),
+        }
+
+
+# Gruppi globali, condivisi da tutte le istanze dei servizi
+embedding_flight = SingleFlight("embedding", backend="openai")
+# Embedding su CPU: gruppo a parte, così metriche e risultati non si mescolano con OpenAI
+local_embedding_flight = SingleFlight("local_embedding", backend="local")
+chat_flight = SingleFlight("chat", backend="openai")
+vector_query_flight = SingleFlight("vector_query", backend="pinecone")
+
+
+def coalescing_stats() -> Dict[str, Dict[str, int]]:
+    """Restituisce le statistiche di tutti i gruppi single-flight"""
+    return {
+        group.name: group.stats()
+        for group in (embedding_flight, local_embedding_flight, chat_flight, vector_query_flight)
+    }
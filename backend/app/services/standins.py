@@ -0,0 +1,559 @@
+"""
+Stand-in locali e deterministici per OpenAI e Pinecone
+Selezionati da Settings (LLM_PROVIDER=standin, VECTOR_PROVIDER=memory):
+embedding a hashing, risposte chat da template e indice vettoriale in memoria,
+con latenza, jitter, 429 ed errori iniettabili per misure riproducibili senza chiavi.
+
+Sostituiscono solo il client di rete: single-flight, rate limiter, hedging,
+circuit breaker e metriche dei servizi reali restano attivi.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import operator
+import random
+import re
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.metrics import observe_stage, record_provider_error
+from app.services.openai_client import OpenAIService
+from app.services.pinecone_client import PineconeService, vector_query_caller
+from app.services.rate_limiter import estimate_tokens
+from app.services.singleflight import vector_query_flight
+
+logger = logging.getLogger(__name__)
+
+# numpy opzionale: accelera la scansione dell'indice in memoria (richiesto per la quantizzazione)
+try:
+    import numpy as np
+    from app.services.vector_store import QuantizedVectorStore
+except ImportError:
+    np = None
+    QuantizedVectorStore = None
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def hash_embedding(text: str, dimension: int) -> List[float]:
+    """
+    Embedding deterministico a feature hashing delle parole, normalizzato L2.
+    Testi con parole in comune hanno similarità coseno positiva.
+    """
+    vector = [0.0] * dimension
+    for token in _TOKEN_RE.findall(text.lower()):
+        h = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "big")
+        vector[h % dimension] += 1.0 if (h >> 63) & 1 else -1.0
+
+    norm = math.sqrt(sum(v * v for v in vector))
+    if norm == 0:
+        vector[0] = 1.0
+        return vector
+    return [v / norm for v in vector]
+
+
+class StandInAPIError(Exception):
+    """Errore simulato con status HTTP, riconosciuto come transitorio da is_retryable"""
+
+    def __init__(self, status_code: int, message: str, headers: Optional[Dict[str, str]] = None):
+        super().__init__(f"{status_code} {message}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers=headers or {})
+
+
+class FaultInjector:
+    """Latenza (base + jitter uniforme), 429 ed errori 5xx con RNG a seed fisso"""
+
+    def __init__(self, name: str, latency_ms: float = 0.0, jitter_ms: float = 0.0,
+                 rate_limit_rate: float = 0.0, error_rate: float = 0.0, seed: int = 0):
+        self.name = name
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.rate_limit_rate = rate_limit_rate
+        self.error_rate = error_rate
+        self.random = random.Random(f"{name}:{seed}")
+
+    async def call(self):
+        """Da chiamare all'inizio di ogni richiesta simulata"""
+        delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        roll = self.random.random()
+        if roll < self.rate_limit_rate:
+            raise StandInAPIError(429, f"{self.name}: rate limit simulato", {"retry-after-ms": "100"})
+        if roll < self.rate_limit_rate + self.error_rate:
+            raise StandInAPIError(503, f"{self.name}: errore simulato")
+
+
+# ========================
+# OpenAI
+# ========================
+
+class _RawResponse:
+    """Come le risposte with_raw_response dell'SDK: header + parse()"""
+
+    def __init__(self, parsed: Any, headers: Optional[Dict[str, str]] = None):
+        self.headers = headers or {}
+        self._parsed = parsed
+
+    def parse(self) -> Any:
+        return self._parsed
+
+
+class StandInOpenAIClient:
+    """Sottoinsieme di AsyncOpenAI usato da OpenAIService"""
+
+    def __init__(self, dimension: int, faults: FaultInjector):
+        self.dimension = dimension
+        self.faults = faults
+        self.embeddings = SimpleNamespace(with_raw_response=SimpleNamespace(create=self._create_embedding))
+        self.chat = SimpleNamespace(completions=SimpleNamespace(
+            with_raw_response=SimpleNamespace(create=self._create_completion)
+        ))
+        self.models = SimpleNamespace(retrieve=self._retrieve_model)
+
+    async def _retrieve_model(self, model: str):
+        await self.faults.call()
+        return SimpleNamespace(id=model, object="model")
+
+    async def _create_embedding(self, model: str, input, dimensions: Optional[int] = None):
+        await self.faults.call()
+        texts = [input] if isinstance(input, str) else list(input)
+        data = [
+            SimpleNamespace(index=i, embedding=hash_embedding(text, dimensions or self.dimension))
+            for i, text in enumerate(texts)
+        ]
+        usage = SimpleNamespace(total_tokens=sum(estimate_tokens(text) for text in texts))
+        return _RawResponse(SimpleNamespace(data=data, usage=usage))
+
+    async def _create_completion(self, model: str, messages: List[Dict[str, str]], **kwargs):
+        await self.faults.call()
+        prompt = messages[-1]["content"]
+        query = prompt.rsplit("DOMANDA:", 1)[-1].split("RISPOSTA:", 1)[0].strip()
+        context = prompt.split("CONTENUTO DEI DOCUMENTI:", 1)[-1].split("DOMANDA:", 1)[0].strip()
+        answer = (
+            f"[stand-in] Risposta alla domanda \"{query}\" basata su "
+            f"{len(context)} caratteri di contesto: {context[:200]}"
+        )
+        usage = SimpleNamespace(
+            prompt_tokens=sum(estimate_tokens(m["content"]) for m in messages),
+            completion_tokens=estimate_tokens(answer),
+        )
+        message = SimpleNamespace(role="assistant", content=answer)
+        return _RawResponse(SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage))
+
+    async def close(self):
+        pass
+
+
+class StandInOpenAIService(OpenAIService):
+    """OpenAIService con client locale: nessuna chiave, nessuna rete"""
+
+    backend = "standin"
+
+    def __init__(self):
+        self.api_key = None
+        self.client = StandInOpenAIClient(
+            settings.embedding_dimension,
+            FaultInjector(
+                "openai",
+                latency_ms=settings.standin_llm_latency_ms,
+                jitter_ms=settings.standin_llm_jitter_ms,
+                rate_limit_rate=settings.standin_llm_rate_limit_rate,
+                error_rate=settings.standin_llm_error_rate,
+                seed=settings.standin_seed,
+            ),
+        )
+        logger.info("🧪 OpenAI stand-in locale inizializzato")
+
+
+# ========================
+# Pinecone
+# ========================
+
+def matches_filter(metadata: Dict[str, Any], filter_dict: Optional[Dict[str, Any]]) -> bool:
+    """Valuta un filtro metadata in sintassi Pinecone ($eq, $ne, $in, $nin, $gt/$gte/$lt/$lte, $exists, $and, $or)"""
+    if not filter_dict:
+        return True
+    for key, condition in filter_dict.items():
+        if key == "$and":
+            if not all(matches_filter(metadata, sub) for sub in condition):
+                return False
+            continue
+        if key == "$or":
+            if not any(matches_filter(metadata, sub) for sub in condition):
+                return False
+            continue
+
+        value = metadata.get(key)
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for op, expected in condition.items():
+            if op == "$exists":
+                ok = (key in metadata) == bool(expected)
+            elif key not in metadata:
+                ok = op in ("$ne", "$nin")
+            elif op == "$eq":
+                ok = value == expected
+            elif op == "$ne":
+                ok = value != expected
+            elif op == "$in":
+                ok = value in expected
+            elif op == "$nin":
+                ok = value not in expected
+            elif op in ("$gt", "$gte", "$lt", "$lte"):
+                try:
+                    ok = {
+                        "$gt": value > expected, "$gte": value >= expected,
+                        "$lt": value < expected, "$lte": value <= expected,
+                    }[op]
+                except TypeError:
+                    ok = False
+            else:
+                raise StandInAPIError(400, f"Operatore di filtro non supportato: {op}")
+            if not ok:
+                return False
+    return True
+
+
+class InMemoryIndex:
+    """
+    Indice vettoriale in memoria con l'interfaccia async di IndexAsyncio
+    usata dal backend (upsert, query, fetch, list, delete, describe_index_stats).
+    Similarità coseno con scansione lineare (vettorizzata se numpy è installato):
+    pensato per test e benchmark locali.
+
+    Con storage int8 o float16 i vettori stanno in un QuantizedVectorStore per namespace
+    (codici quantizzati in RAM, float32 su file memory-mapped per il re-scoring).
+    """
+
+    def __init__(self, dimension: int, faults: FaultInjector, storage: str = "float32",
+                 directory: Optional[str] = None, rescore_factor: int = 4):
+        if storage != "float32" and QuantizedVectorStore is None:
+            raise ValueError(f"LOCAL_INDEX_STORAGE={storage} richiede numpy")
+        self.dimension = dimension
+        self.faults = faults
+        self.storage = storage
+        self.directory = directory
+        self.rescore_factor = rescore_factor
+        # namespace → id → (valori normalizzati, valori originali, metadata);
+        # con quantizzazione i valori stanno nello store e qui restano (None, None, metadata)
+        self._namespaces: Dict[str, Dict[str, tuple]] = {}
+        # namespace → (ids, matrice normalizzata), ricostruita dopo ogni modifica
+        self._matrices: Dict[str, tuple] = {}
+        # namespace → store quantizzato (solo storage int8/float16)
+        self._stores: Dict[str, "QuantizedVectorStore"] = {}
+
+    @property
+    def quantized(self) -> bool:
+        return self.storage != "float32"
+
+    def _store(self, namespace: str) -> "QuantizedVectorStore":
+        if namespace not in self._stores:
+            self._stores[namespace] = QuantizedVectorStore(
+                self.dimension, self.storage, self.directory, self.rescore_factor
+            )
+        return self._stores[namespace]
+
+    def _values(self, namespace: str, vector_id: str) -> List[float]:
+        """Valori originali di un vettore presente nel namespace"""
+        if self.quantized:
+            return self._stores[namespace].get(vector_id)
+        return list(self._namespaces[namespace][vector_id][1])
+
+    def _rank(self, namespace: str, vector: List[float], top_k: int, filter: Optional[Dict]) -> List[tuple]:
+        """(score, id) dei top_k vettori che rispettano il filtro, per coseno decrescente"""
+        records = self._namespaces.get(namespace, {})
+        if self.quantized:
+            store = self._stores.get(namespace)
+            if store is None:
+                return []
+            return store.search(vector, top_k, self._allowed(records, store.ids, filter))
+
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        query = [v / norm for v in vector]
+        if np is None:
+            # Filtro prima del prodotto scalare: i vettori esclusi non vengono valutati
+            scored = [
+                (sum(map(operator.mul, query, normalized)), vector_id)
+                for vector_id, (normalized, _, metadata) in records.items()
+                if matches_filter(metadata, filter)
+            ]
+        else:
+            ids, matrix = self._candidates(namespace, filter)
+            scored = list(zip((matrix @ np.asarray(query, dtype=np.float32)).tolist(), ids))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return scored[:top_k]
+
+    def _allowed(self, records: Dict[str, tuple], ids: List[str], filter: Optional[Dict]):
+        """Maschera per riga dei vettori che rispettano il filtro (None senza filtro)"""
+        if not filter:
+            return None
+        return np.fromiter(
+            (vector_id in records and matches_filter(records[vector_id][2], filter) for vector_id in ids),
+            dtype=bool, count=len(ids),
+        )
+
+    def _matrix(self, namespace: str) -> tuple:
+        """(ids, matrice dei vettori normalizzati) del namespace, ricostruita dopo ogni modifica"""
+        if namespace not in self._matrices:
+            records = self._namespaces.get(namespace, {})
+            ids = list(records)
+            matrix = np.array([records[i][0] for i in ids], dtype=np.float32).reshape(len(ids), self.dimension)
+            self._matrices[namespace] = (ids, matrix)
+        return self._matrices[namespace]
+
+    def _candidates(self, namespace: str, filter: Optional[Dict]) -> tuple:
+        """(ids, matrice) ristrette ai vettori che rispettano il filtro, prima del calcolo dei punteggi"""
+        ids, matrix = self._matrix(namespace)
+        allowed = self._allowed(self._namespaces.get(namespace, {}), ids, filter)
+        if allowed is None:
+            return ids, matrix
+        rows = np.flatnonzero(allowed)
+        return [ids[row] for row in rows], matrix[rows]
+
+    def _rank_batch(self, namespace: str, vectors: List[List[float]], top_k: int,
+                    filter: Optional[Dict]) -> List[List[tuple]]:
+        """_rank per più query: con numpy e float32 un unico prodotto matrice × query"""
+        if self.quantized or np is None or not self._namespaces.get(namespace):
+            return [self._rank(namespace, vector, top_k, filter) for vector in vectors]
+
+        ids, matrix = self._candidates(namespace, filter)
+        if not ids:
+            return [[] for _ in vectors]
+
+        queries = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), self.dimension)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        scores = matrix @ (queries / norms).T
+
+        ranked = []
+        wanted = min(top_k, len(ids))
+        for column in scores.T:
+            if wanted < len(ids):
+                # Anche le righe a pari punteggio con la k-esima: a parità vince l'id, come in _rank
+                kth = column[np.argpartition(-column, wanted - 1)[wanted - 1]]
+                top = np.flatnonzero(column >= kth)
+            else:
+                top = np.arange(len(ids))
+            scored = sorted(((float(column[row]), ids[row]) for row in top), key=lambda item: (-item[0], item[1]))
+            ranked.append(scored[:wanted])
+        return ranked
+
+    def _check_dimension(self, values: List[float]):
+        if len(values) != self.dimension:
+            raise StandInAPIError(
+                400, f"Dimensione vettore {len(values)} diversa da quella dell'indice ({self.dimension})"
+            )
+
+    async def upsert(self, vectors: List[Dict[str, Any]], namespace: str = "", **kwargs):
+        await self.faults.call()
+        records = self._namespaces.setdefault(namespace, {})
+        if self.quantized:
+            for vector in vectors:
+                self._check_dimension(vector["values"])
+            self._store(namespace).add([v["id"] for v in vectors], [v["values"] for v in vectors])
+            for vector in vectors:
+                records[vector["id"]] = (None, None, dict(vector.get("metadata") or {}))
+            return {"upserted_count": len(vectors)}
+        for vector in vectors:
+            values = list(vector["values"])
+            self._check_dimension(values)
+            norm = math.sqrt(sum(v * v for v in values)) or 1.0
+            records[vector["id"]] = ([v / norm for v in values], values, dict(vector.get("metadata") or {}))
+        self._matrices.pop(namespace, None)
+        return {"upserted_count": len(vectors)}
+
+    async def query(self, vector: List[float], top_k: int = 10, filter: Optional[Dict] = None,
+                    include_metadata: bool = False, include_values: bool = False,
+                    namespace: str = "", **kwargs):
+        await self.faults.call()
+        self._check_dimension(vector)
+
+        records = self._namespaces.get(namespace, {})
+        matches = [
+            SimpleNamespace(
+                id=vector_id,
+                score=score,
+                metadata=dict(records[vector_id][2]) if include_metadata else None,
+                values=self._values(namespace, vector_id) if include_values else [],
+            )
+            for score, vector_id in self._rank(namespace, vector, top_k, filter)
+        ]
+        return SimpleNamespace(matches=matches, namespace=namespace)
+
+    async def query_batch(self, vectors: List[List[float]], top_k: int = 10, filter: Optional[Dict] = None,
+                          include_metadata: bool = False, namespace: str = ""):
+        """Più query con una sola chiamata (non esiste in Pinecone: solo indice locale)"""
+        await self.faults.call()
+        for vector in vectors:
+            self._check_dimension(vector)
+
+        records = self._namespaces.get(namespace, {})
+        return [
+            SimpleNamespace(matches=[
+                SimpleNamespace(id=vector_id, score=score,
+                                metadata=dict(records[vector_id][2]) if include_metadata else None, values=[])
+                for score, vector_id in ranked
+            ], namespace=namespace)
+            for ranked in self._rank_batch(namespace, vectors, top_k, filter)
+        ]
+
+    async def fetch(self, ids: List[str], namespace: str = "", **kwargs):
+        await self.faults.call()
+        records = self._namespaces.get(namespace, {})
+        vectors = {
+            vector_id: SimpleNamespace(id=vector_id, values=self._values(namespace, vector_id),
+                                       metadata=dict(records[vector_id][2]))
+            for vector_id in ids if vector_id in records
+        }
+        return SimpleNamespace(vectors=vectors, namespace=namespace)
+
+    async def list(self, prefix: Optional[str] = None, limit: int = 100, namespace: str = "", **kwargs):
+        """Id ordinati, a pagine di al massimo limit elementi"""
+        await self.faults.call()
+        ids = sorted(
+            vector_id for vector_id in self._namespaces.get(namespace, {})
+            if prefix is None or vector_id.startswith(prefix)
+        )
+        for start in range(0, len(ids), limit):
+            yield ids[start:start + limit]
+
+    async def list_paginated(self, prefix: Optional[str] = None, limit: int = 100,
+                             pagination_token: Optional[str] = None, namespace: str = "", **kwargs):
+        """Una pagina di id ordinati; il token è l'ultimo id restituito (stabile se altri id spariscono)"""
+        await self.faults.call()
+        ids = sorted(
+            vector_id for vector_id in self._namespaces.get(namespace, {})
+            if (prefix is None or vector_id.startswith(prefix))
+            and (pagination_token is None or vector_id > pagination_token)
+        )
+        page = ids[:limit]
+        return SimpleNamespace(
+            vectors=[SimpleNamespace(id=vector_id) for vector_id in page],
+            pagination=SimpleNamespace(next=page[-1]) if len(ids) > limit else None,
+            namespace=namespace,
+        )
+
+    async def delete(self, ids: Optional[List[str]] = None, delete_all: bool = False,
+                     namespace: str = "", filter: Optional[Dict] = None, **kwargs):
+        await self.faults.call()
+        records = self._namespaces.get(namespace, {})
+        removed = list(records) if delete_all else []
+        if delete_all:
+            records.clear()
+        elif filter:
+            for vector_id in [i for i, (_, _, metadata) in records.items() if matches_filter(metadata, filter)]:
+                del records[vector_id]
+                removed.append(vector_id)
+        for vector_id in ids or []:
+            if records.pop(vector_id, None) is not None:
+                removed.append(vector_id)
+        self._matrices.pop(namespace, None)
+        if namespace in self._stores:
+            if records:
+                self._stores[namespace].remove(removed)
+            else:
+                self._stores[namespace].clear()
+        return {}
+
+    async def describe_index_stats(self, **kwargs):
+        await self.faults.call()
+        namespaces = {name: {"vector_count": len(records)} for name, records in self._namespaces.items()}
+        return {
+            "dimension": self.dimension,
+            "namespaces": namespaces,
+            "total_vector_count": sum(ns["vector_count"] for ns in namespaces.values()),
+        }
+
+    def memory_bytes(self) -> Dict[str, int]:
+        """Byte dei vettori in RAM e su disco (solo storage quantizzato)"""
+        sizes = [store.memory_bytes() for store in self._stores.values()]
+        return {"ram": sum(s["ram"] for s in sizes), "disk": sum(s["disk"] for s in sizes)}
+
+    async def close(self):
+        for store in self._stores.values():
+            store.close()
+        self._stores.clear()
+
+
+class MemoryPineconeService(PineconeService):
+    """PineconeService con indice in memoria: nessuna chiave, nessuna rete"""
+
+    backend = "memory"
+
+    def __init__(self):
+        self.pc = None
+        self.index_name = settings.pinecone_index_name
+        self.host = None
+        self._index = InMemoryIndex(
+            settings.embedding_dimension,
+            FaultInjector(
+                "pinecone",
+                latency_ms=settings.standin_vector_latency_ms,
+                jitter_ms=settings.standin_vector_jitter_ms,
+                error_rate=settings.standin_vector_error_rate,
+                seed=settings.standin_seed,
+            ),
+            storage=settings.local_index_storage,
+            directory=settings.local_index_dir,
+            rescore_factor=settings.local_index_rescore_factor,
+        )
+        logger.info("🧪 Indice vettoriale in memoria inizializzato (%s)", settings.local_index_storage)
+
+    async def query_vectors_batch(self, query_vectors: List[List[float]], top_k: int = 5,
+                                  filter_dict: Dict = None, include_metadata: bool = True,
+                                  namespace: str = "") -> List[List[Dict]]:
+        """
+        Tutte le query in un unico prodotto matriciale sull'indice in memoria, con
+        single-flight, hedging e circuit breaker come query_vectors
+        """
+        if settings.coalesce_provider_calls:
+            key = (
+                "batch",
+                self.index_name,
+                namespace,
+                tuple(tuple(vector) for vector in query_vectors),
+                top_k,
+                json.dumps(filter_dict, sort_keys=True, default=str),
+                include_metadata,
+            )
+            return await vector_query_flight.do(
+                key, self._query_vectors_batch, query_vectors, top_k, filter_dict, include_metadata, namespace
+            )
+        return await self._query_vectors_batch(query_vectors, top_k, filter_dict, include_metadata, namespace)
+
+    async def _query_vectors_batch(self, query_vectors: List[List[float]], top_k: int,
+                                   filter_dict: Dict, include_metadata: bool, namespace: str) -> List[List[Dict]]:
+        try:
+            with observe_stage("vector_query", self.backend):
+                return await vector_query_caller.call(
+                    self._query_index_batch, query_vectors, top_k, filter_dict, include_metadata, namespace
+                )
+        except Exception as e:
+            record_provider_error(self.backend, e)
+            raise
+
+    async def _query_index_batch(self, query_vectors: List[List[float]], top_k: int,
+                                 filter_dict: Dict, include_metadata: bool, namespace: str) -> List[List[Dict]]:
+        responses = await self._index.query_batch(
+            query_vectors, top_k=top_k, filter=filter_dict, include_metadata=include_metadata,
+            namespace=namespace,
+        )
+        return [
+            [
+                {"id": match.id, "score": float(match.score), "metadata": match.metadata}
+                if include_metadata else {"id": match.id, "score": float(match.score)}
+                for match in response.matches
+            ]
+            for response in responses
+        ]
+
+    async def close(self):
+        """I dati restano in memoria fino alla fine del processo"""
+        pass
@@ -0,0 +1,67 @@
+"""
+Conteggio e troncamento dei token per i modelli di embedding
+Usa tiktoken con l'encoding del modello (registro EMBEDDING_MODELS) se installato,
+altrimenti la stima di ~4 caratteri per token del rate limiter (anche per i modelli
+locali, che troncano comunque con il proprio tokenizer)
+"""
+
+import logging
+from functools import lru_cache
+from typing import List
+
+from app.services.rate_limiter import estimate_tokens
+
+# tiktoken opzionale: senza, conteggi stimati e troncamento per caratteri
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+_CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=8)
+def _encoding(name: str):
+    if tiktoken is None or not name:
+        return None
+    try:
+        return tiktoken.get_encoding(name)
+    except Exception as e:
+        # Encoding non disponibile (es. file BPE non scaricabile offline): stima
+        logger.warning("⚠️ Encoding %s non disponibile, conteggio stimato: %s", name, e)
+        return None
+
+
+def count_tokens(text: str, tokenizer: str) -> int:
+    encoding = _encoding(tokenizer)
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, tokenizer: str) -> str:
+    """Testo ridotto ai primi max_tokens token (invariato se già entro il limite)"""
+    encoding = _encoding(tokenizer)
+    if encoding is None:
+        return text if estimate_tokens(text) <= max_tokens else text[:(max_tokens - 1) * _CHARS_PER_TOKEN]
+    tokens = encoding.encode(text, disallowed_special=())
+    return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
+
+
+def batch_by_limits(texts: List[str], max_inputs: int, max_tokens: int, tokenizer: str) -> List[List[int]]:
+    """Indici dei testi raggruppati in richieste entro input e token massimi per richiesta"""
+    batches: List[List[int]] = []
+    current: List[int] = []
+    current_tokens = 0
+    for i, text in enumerate(texts):
+        tokens = count_tokens(text, tokenizer)
+        if current and (len(current) >= max_inputs or current_tokens + tokens > max_tokens):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
@@ -0,0 +1,207 @@
+"""
+Archivio vettoriale quantizzato per l'indice locale
+In memoria solo i codici int8 (con fattore di scala per vettore) o float16 dei vettori
+normalizzati; i valori float32 originali stanno in un file memory-mapped letto solo
+per il re-scoring esatto dei candidati migliori e per fetch/include_values.
+Richiede numpy (in requirements.txt); importato da standins solo se disponibile.
+"""
+
+import os
+import tempfile
+import weakref
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+STORAGE_TYPES = ("int8", "float16")
+
+# Righe convertite in float32 per blocco durante la scansione (blocco in cache)
+_SCAN_BLOCK_ROWS = 1024
+
+
+def _remove_file(path: str):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+class QuantizedVectorStore:
+    """
+    Ricerca in due fasi: punteggi approssimati sui codici quantizzati per tutte le righe,
+    poi coseno esatto dal file float32 per top_k * rescore_factor candidati
+    """
+
+    def __init__(self, dimension: int, storage: str = "int8", directory: Optional[str] = None,
+                 rescore_factor: int = 4):
+        if storage not in STORAGE_TYPES:
+            raise ValueError(f"Formato non supportato: {storage} (ammessi: {', '.join(STORAGE_TYPES)})")
+        self.dimension = dimension
+        self.storage = storage
+        self.rescore_factor = rescore_factor
+        self._code_dtype = np.int8 if storage == "int8" else np.float16
+
+        fd, self.path = tempfile.mkstemp(prefix="vectors-", suffix=".f32", dir=directory)
+        os.close(fd)
+        self._reset_arrays(0)
+        self._mmap: Optional[np.memmap] = None
+        # Il file temporaneo sparisce anche se close() non viene chiamato
+        self._finalizer = weakref.finalize(self, _remove_file, self.path)
+
+    def _reset_arrays(self, capacity: int):
+        self.codes = np.zeros((capacity, self.dimension), dtype=self._code_dtype)
+        self.scales = np.zeros(capacity, dtype=np.float32)
+        self.inv_norms = np.zeros(capacity, dtype=np.float32)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.ids: List[str] = []
+        self.rows: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def _ensure_capacity(self, rows: int):
+        capacity = len(self.scales)
+        if rows <= capacity:
+            return
+        capacity = max(rows, capacity * 2, 64)
+        for name in ("codes", "scales", "inv_norms", "alive"):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def _quantize(self, normalized: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        if self.storage == "float16":
+            return normalized.astype(np.float16), np.ones(len(normalized), dtype=np.float32)
+        scales = np.abs(normalized).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.clip(np.rint(normalized / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    def _full_precision(self) -> np.memmap:
+        """Valori float32 su file, riaperti dopo ogni scrittura"""
+        if self._mmap is None:
+            self._mmap = np.memmap(self.path, dtype=np.float32, mode="r", shape=(len(self.ids), self.dimension))
+        return self._mmap
+
+    def add(self, ids: Sequence[str], vectors: Sequence[Sequence[float]]):
+        """Inserisce o sostituisce vettori (valori originali, non normalizzati)"""
+        values = np.asarray(vectors, dtype=np.float32).reshape(len(ids), self.dimension)
+        norms = np.linalg.norm(values, axis=1)
+        norms[norms == 0] = 1.0
+        codes, scales = self._quantize(values / norms[:, None])
+
+        rows = []
+        appended = []
+        updated = set()
+        for i, vector_id in enumerate(ids):
+            row = self.rows.get(vector_id)
+            if row is None:
+                row = len(self.ids)
+                self.ids.append(vector_id)
+                self.rows[vector_id] = row
+                appended.append(i)
+            else:
+                updated.add(i)
+            rows.append(row)
+        self._ensure_capacity(len(self.ids))
+
+        rows = np.asarray(rows)
+        self.codes[rows] = codes
+        self.scales[rows] = scales
+        self.inv_norms[rows] = 1.0 / norms
+        self.alive[rows] = True
+
+        self._mmap = None
+        with open(self.path, "r+b") as f:
+            # Nuove righe in coda al file, righe esistenti sovrascritte al loro offset
+            f.seek(0, os.SEEK_END)
+            f.write(values[appended].tobytes())
+            for i in updated:
+                row = rows[i]
+                f.seek(int(row) * self.dimension * 4)
+                f.write(values[i].tobytes())
+
+    def get(self, vector_id: str) -> Optional[List[float]]:
+        """Valori originali float32 letti dal file"""
+        row = self.rows.get(vector_id)
+        if row is None:
+            return None
+        return self._full_precision()[row].tolist()
+
+    def remove(self, ids: Sequence[str]):
+        """Marca le righe come eliminate; il file viene compattato quando sono la maggioranza"""
+        for vector_id in ids:
+            row = self.rows.pop(vector_id, None)
+            if row is not None:
+                self.alive[row] = False
+        if len(self.ids) > 64 and len(self.rows) < len(self.ids) // 2:
+            self.compact()
+
+    def clear(self):
+        self._reset_arrays(0)
+        self._mmap = None
+        open(self.path, "wb").close()
+
+    def compact(self):
+        """Riscrive file e array con le sole righe vive"""
+        keep = np.flatnonzero(self.alive[:len(self.ids)])
+        ids = [self.ids[row] for row in keep]
+        values = np.array(self._full_precision()[keep]) if len(keep) else np.zeros((0, self.dimension), np.float32)
+        codes, scales, inv_norms = self.codes[keep], self.scales[keep], self.inv_norms[keep]
+
+        self._reset_arrays(len(ids))
+        self.codes[:], self.scales[:], self.inv_norms[:], self.alive[:] = codes, scales, inv_norms, True
+        self.ids = ids
+        self.rows = {vector_id: row for row, vector_id in enumerate(ids)}
+        self._mmap = None
+        with open(self.path, "wb") as f:
+            f.write(values.astype(np.float32).tobytes())
+
+    def approximate_scores(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Coseno approssimato con i codici quantizzati, per le righe indicate (default: tutte, anche eliminate)"""
+        if rows is None:
+            rows = np.arange(len(self.ids))
+        scores = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), _SCAN_BLOCK_ROWS):
+            block = rows[start:start + _SCAN_BLOCK_ROWS]
+            if len(block) == block[-1] - block[0] + 1:
+                codes = self.codes[block[0]:block[-1] + 1]
+            else:
+                codes = self.codes[block]
+            scores[start:start + len(block)] = codes.astype(np.float32) @ query
+        return scores * self.scales[rows]
+
+    def search(self, query: Sequence[float], top_k: int,
+               allowed: Optional[np.ndarray] = None) -> List[Tuple[float, str]]:
+        """(score, id) dei top_k per coseno esatto; allowed è una maschera per riga (filtri)"""
+        count = len(self.ids)
+        if count == 0 or top_k <= 0:
+            return []
+        query = np.asarray(query, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+
+        mask = self.alive[:count] if allowed is None else self.alive[:count] & allowed
+        candidates = np.flatnonzero(mask)
+        if len(candidates) == 0:
+            return []
+
+        wanted = min(len(candidates), top_k * self.rescore_factor)
+        if wanted < len(candidates):
+            # Solo le righe ammesse dal filtro: con filtri selettivi la scansione si riduce
+            approximate = self.approximate_scores(query, candidates)
+            candidates = np.sort(candidates[np.argpartition(-approximate, wanted - 1)[:wanted]])
+
+        exact = (np.asarray(self._full_precision()[candidates]) @ query) * self.inv_norms[candidates]
+        scored = sorted(zip(exact.tolist(), (self.ids[row] for row in candidates)), key=lambda s: (-s[0], s[1]))
+        return scored[:top_k]
+
+    def memory_bytes(self) -> Dict[str, int]:
+        """Byte in RAM (codici, scale, norme) e su disco (float32)"""
+        count = len(self.ids)
+        return {
+            "ram": int(self.codes[:count].nbytes + self.scales[:count].nbytes + self.inv_norms[:count].nbytes),
+            "disk": count * self.dimension * 4,
+        }
+
+    def close(self):
+        self._mmap = None
+        self._finalizer()
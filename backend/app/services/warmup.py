@@ -0,0 +1,117 @@
+"""
+Warm-up all'avvio e stato di readiness
+I client dei provider e l'OCR vengono inizializzati in background dopo l'avvio:
+/health risponde subito, /ready solo quando le connessioni sono aperte
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app.core.config import settings
+from app.services.ocr_service import ocr_service
+from app.services.providers import get_embedding_service, get_openai_service, get_pinecone_service_async
+
+logger = logging.getLogger(__name__)
+
+# Attesa massima tra due tentativi di un componente fallito
+_MAX_RETRY_INTERVAL = 30.0
+
+
+class Readiness:
+    """Stato dei componenti inizializzati nel warm-up e tempi del cold start"""
+
+    COMPONENTS = ("vector_index", "llm", "ocr")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.import_seconds: Optional[float] = None
+        self.ready_at: Optional[float] = None
+        self.skipped = False
+        self.components: Dict[str, Dict[str, Any]] = {
+            name: {"status": "pending"} for name in self.COMPONENTS
+        }
+
+    def mark_imported(self, started: float):
+        """Registra l'inizio dell'import dell'app e la sua durata"""
+        self.started = started
+        self.import_seconds = time.perf_counter() - started
+
+    def set(self, name: str, status: str, seconds: float, detail: Optional[str] = None):
+        self.components[name] = {"status": status, "seconds": round(seconds, 3)}
+        if detail:
+            self.components[name]["detail"] = detail
+        if self.ready_at is None and self.ready:
+            self.ready_at = time.perf_counter()
+            cold_start = self.ready_at - self.started
+            if cold_start > settings.cold_start_budget_seconds:
+                logger.warning(f"⚠️ Cold start {cold_start:.2f}s oltre il budget di {settings.cold_start_budget_seconds}s")
+            else:
+                logger.info(f"✅ Pronto in {cold_start:.2f}s (budget {settings.cold_start_budget_seconds}s)")
+
+    @property
+    def ready(self) -> bool:
+        return self.skipped or all(c["status"] == "ok" for c in self.components.values())
+
+    def snapshot(self) -> Dict[str, Any]:
+        cold_start = self.ready_at - self.started if self.ready_at is not None else None
+        return {
+            "ready": self.ready,
+            "warmup": "skipped" if self.skipped else "enabled",
+            "components": self.components,
+            "import_seconds": round(self.import_seconds, 3) if self.import_seconds is not None else None,
+            "cold_start_seconds": round(cold_start, 3) if cold_start is not None else None,
+            "cold_start_budget_seconds": settings.cold_start_budget_seconds,
+            "within_budget": cold_start <= settings.cold_start_budget_seconds if cold_start is not None else None,
+        }
+
+
+readiness = Readiness()
+
+
+async def _warm_vector_index() -> Optional[str]:
+    # Il costruttore fa chiamate sincrone al control plane: fuori dall'event loop
+    service = await get_pinecone_service_async()
+    await service.warm_up()
+    return service.backend
+
+
+async def _warm_llm() -> Optional[str]:
+    service = get_openai_service()
+    await service.warm_up()
+    # Modello di embedding locale: caricamento dei pesi fuori dall'event loop
+    embedding_service = await asyncio.to_thread(get_embedding_service)
+    if embedding_service is not service:
+        await embedding_service.warm_up()
+        return f"{service.backend}+{embedding_service.backend}"
+    return service.backend
+
+
+async def _warm_ocr() -> Optional[str]:
+    return await asyncio.to_thread(ocr_service.warm_up, settings.ocr_warmup_language)
+
+
+async def _warm_component(name: str, step: Callable[[], Awaitable[Optional[str]]]):
+    """Esegue lo step finché non riesce, con attesa crescente tra i tentativi"""
+    interval = 1.0
+    while True:
+        start = time.perf_counter()
+        try:
+            detail = await step()
+            readiness.set(name, "ok", time.perf_counter() - start, detail)
+            return
+        except Exception as e:
+            readiness.set(name, "failed", time.perf_counter() - start, f"{e.__class__.__name__}: {e}")
+            logger.warning(f"⚠️ Warm-up {name} fallito, nuovo tentativo tra {interval:.0f}s: {e}")
+            await asyncio.sleep(interval)
+            interval = min(_MAX_RETRY_INTERVAL, interval * 2)
+
+
+async def warm_up():
+    """Inizializza in parallelo indice vettoriale, client LLM e OCR"""
+    await asyncio.gather(
+        _warm_component("vector_index", _warm_vector_index),
+        _warm_component("llm", _warm_llm),
+        _warm_component("ocr", _warm_ocr),
+    )
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Benchmark hedging query vettoriali
+Confronta p50/p95/p99 di PineconeService.query_vectors con hedging on/off
+contro un indice simulato con coda lenta (nessuna chiave richiesta)
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from app.services import pinecone_client
+from app.services.pinecone_client import PineconeService
+from app.services.resilience import HedgedCaller, CircuitBreaker
+
+class SlowTailIndex:
+    """Indice finto: latenza bassa con una piccola frazione di richieste molto lente"""
+
+    def __init__(self, fast_ms, slow_ms, slow_ratio, seed):
+        self.fast_ms = fast_ms
+        self.slow_ms = slow_ms
+        self.slow_ratio = slow_ratio
+        self.random = random.Random(seed)
+
+    async def query(self, vector, top_k, filter, include_metadata, include_values, namespace=""):
+        if self.random.random() < self.slow_ratio:
+            delay = self.slow_ms * self.random.uniform(0.8, 1.2)
+        else:
+            delay = self.fast_ms * self.random.uniform(0.7, 1.5)
+        await asyncio.sleep(delay / 1000)
+        return type("Response", (), {"matches": []})()
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+async def run(hedging, args):
+    """Esegue il carico e restituisce le latenze end-to-end in ms"""
+    pinecone_client.vector_query_caller = HedgedCaller(
+        "vector_query",
+        enabled=hedging,
+        percentile=args.percentile,
+        breaker=CircuitBreaker("bench"),
+    )
+    service = PineconeService.__new__(PineconeService)
+    service.index_name = "bench"
+    service._index = SlowTailIndex(args.fast_ms, args.slow_ms, args.slow_ratio, args.seed)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one(i):
+        async with semaphore:
+            start = time.perf_counter()
+            await service.query_vectors([float(i)] * 8, top_k=5, filter_dict={"user_id": "bench"})
+            return (time.perf_counter() - start) * 1000
+
+    latencies = await asyncio.gather(*[one(i) for i in range(args.requests)])
+
+    stats = pinecone_client.vector_query_caller.stats()
+    return {
+        "hedging": hedging,
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "p99_ms": round(percentile(latencies, 99), 1),
+        "hedged": stats["hedged"],
+        "hedge_wins": stats["hedge_wins"],
+        "extra_load_pct": round(100 * stats["hedged"] / args.requests, 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark hedging query vettoriali")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--fast-ms", type=float, default=20)
+    parser.add_argument("--slow-ms", type=float, default=600)
+    parser.add_argument("--slow-ratio", type=float, default=0.03)
+    parser.add_argument("--percentile", type=float, default=95)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", action="store_true", help="Output JSON")
+    args = parser.parse_args()
+
+    results = [asyncio.run(run(False, args)), asyncio.run(run(True, args))]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print("📊 Benchmark hedging query vettoriali")
+    print("=" * 50)
+    for r in results:
+        label = "ON " if r["hedging"] else "OFF"
+        print(f"Hedging {label}: p50={r['p50_ms']}ms p95={r['p95_ms']}ms p99={r['p99_ms']}ms "
+              f"(duplicati: {r['hedged']}, vinti: {r['hedge_wins']}, carico extra: {r['extra_load_pct']}%)")
+
+if __name__ == "__main__":
+    main()
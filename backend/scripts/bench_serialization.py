@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Benchmark serializzazione e compressione delle risposte di /v1/query
+Confronta CPU per richiesta e byte trasmessi tra JSON della libreria standard
+(JSONResponse di Starlette), orjson, MessagePack e compressione gzip/brotli,
+su match realistici (chunk da ~1000 caratteri come nel chunking dell'upload)
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import argparse
+import json
+import random
+import time
+import zlib
+
+from starlette.responses import JSONResponse
+
+from app.core import responses
+from app.core.config import settings
+from app.schemas import QueryOut
+
+WORDS = (
+    "esame voto crediti corso laurea algoritmi database reti sistemi programmazione "
+    "media certificazione studente università semestre appello relazione progetto"
+).split()
+
+
+def build_payload(top_k, chunk_chars, seed=0):
+    """Contenuto come lo produce FastAPI per QueryOut (dopo la serializzazione del modello)"""
+    rng = random.Random(seed)
+    matches = []
+    for i in range(top_k):
+        text = ""
+        while len(text) < chunk_chars:
+            text += rng.choice(WORDS) + " "
+        matches.append({
+            "id": f"doc_u1_{i}_0000",
+            "score": rng.random(),
+            "metadata": {
+                "user_id": "u1", "item_id": f"doc_u1_{i}", "title": f"Scansione {i}",
+                "chunk_index": 0, "text": text, "preview": text[:200] + "...",
+                "timestamp": "2024-06-18T10:00:00", "created_at": "2024-06-18T10:00:00",
+                "file_type": "image_with_ocr", "ocr_confidence": 0.91,
+            },
+        })
+    return QueryOut(matches=matches).model_dump(mode="json", exclude_unset=True)
+
+
+def time_per_call(fn, iterations):
+    """Microsecondi per chiamata (migliore di 3 ripetizioni)"""
+    best = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        best = min(best, (time.perf_counter() - start) / iterations)
+    return best * 1e6
+
+
+def gzip_compress(body):
+    compressor = zlib.compressobj(settings.compression_gzip_level, zlib.DEFLATED, 31)
+    return compressor.compress(body) + compressor.flush()
+
+
+def run(top_k, chunk_chars, iterations):
+    content = build_payload(top_k, chunk_chars)
+    encoders = {"json_stdlib": lambda: JSONResponse.render(None, content)}
+    if responses.orjson is not None:
+        encoders["orjson"] = lambda: responses.orjson.dumps(content, option=responses.orjson.OPT_NON_STR_KEYS)
+    if responses.msgpack is not None:
+        encoders["msgpack"] = lambda: responses.msgpack.packb(content, use_bin_type=True)
+
+    results = {}
+    for name, encode in encoders.items():
+        body = encode()
+        results[name] = {"encode_us": round(time_per_call(encode, iterations), 1), "bytes": len(body)}
+        compressors = {"gzip": gzip_compress}
+        if responses.brotli is not None:
+            compressors["br"] = lambda b: responses.brotli.compress(b, quality=settings.compression_brotli_quality)
+        for encoding, compress in compressors.items():
+            compressed = compress(body)
+            results[name][encoding] = {
+                "bytes": len(compressed),
+                "compress_us": round(time_per_call(lambda: compress(body), max(1, iterations // 10)), 1),
+            }
+
+    baseline = results["json_stdlib"]
+    best_name = min(results, key=lambda n: results[n]["encode_us"])
+    smallest = min(
+        (entry[encoding]["bytes"], f"{name}+{encoding}")
+        for name, entry in results.items() for encoding in ("gzip", "br") if encoding in entry
+    )
+    return {
+        "top_k": top_k,
+        "chunk_chars": chunk_chars,
+        "optional_libraries": {
+            "orjson": responses.orjson is not None,
+            "msgpack": responses.msgpack is not None,
+            "brotli": responses.brotli is not None,
+        },
+        "encoders": results,
+        "summary": {
+            "fastest_encoder": best_name,
+            "encode_speedup": round(baseline["encode_us"] / results[best_name]["encode_us"], 2),
+            "smallest_wire": smallest[1],
+            "wire_bytes_reduction": round(1 - smallest[0] / baseline["bytes"], 3),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark serializzazione e compressione risposte")
+    parser.add_argument("--top-k", type=int, default=8)
+    parser.add_argument("--chunk-chars", type=int, default=1000)
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--json", action="store_true", help="Output JSON")
+    args = parser.parse_args()
+
+    report = run(args.top_k, args.chunk_chars, args.iterations)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"📊 Serializzazione /v1/query ({args.top_k} match, chunk da {args.chunk_chars} caratteri)")
+    print("=" * 70)
+    for name, entry in report["encoders"].items():
+        line = f"{name:<12} {entry['encode_us']:>8.1f} µs  {entry['bytes']:>7} B"
+        for encoding in ("gzip", "br"):
+            if encoding in entry:
+                line += f"  | {encoding} {entry[encoding]['bytes']:>6} B ({entry[encoding]['compress_us']:.0f} µs)"
+        print(line)
+    summary = report["summary"]
+    print(f"\n✅ {summary['fastest_encoder']} {summary['encode_speedup']}x più veloce di json_stdlib; "
+          f"{summary['smallest_wire']} riduce i byte del {summary['wire_bytes_reduction']:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Benchmark throughput API (singolo worker, in-process)
+Misura le richieste/secondo di /v1/query, /v1/answer e /v1/embed-upsert
+con provider sostituiti da stand-in a latenza iniettata (nessuna chiave richiesta)
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+API_KEY = os.getenv('DEV_API_KEY', 'super-secret-for-local')
+
+# Limite di default del threadpool di Starlette/anyio per gli handler sync
+THREADPOOL_SIZE = 40
+
+def use_standins(openai_ms, pinecone_ms):
+    """
+    Seleziona gli stand-in locali con la latenza indicata. Va chiamata prima di
+    importare l'app; i limiti dello scheduler OpenAI vengono alzati perché
+    il benchmark misuri il server e non il rate limit configurato.
+    """
+    from app.core.config import settings
+    settings.llm_provider = "standin"
+    settings.vector_provider = "memory"
+    settings.standin_llm_latency_ms = openai_ms
+    settings.standin_vector_latency_ms = pinecone_ms
+    settings.openai_rpm_limit = 10 ** 9
+    settings.openai_tpm_limit = 10 ** 12
+
+def build_request(endpoint, i):
+    """Payload per endpoint; testi diversi per evitare il single-flight"""
+    if endpoint == "query":
+        return "/v1/query", {"user_id": "bench", "query": f"domanda {i}", "top_k": 5}
+    if endpoint == "answer":
+        return "/v1/answer", {"query": f"domanda {i}", "contexts": [{"text": "contesto", "metadata": {"title": "Doc"}}]}
+    return "/v1/embed-upsert", {"user_id": "bench", "item_id": f"doc_{i}", "title": "Bench", "text": f"documento {i} " * 150}
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+async def run_endpoint(client, endpoint, requests, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(i):
+        nonlocal errors
+        path, payload = build_request(endpoint, i)
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post(path, json=payload, headers={"X-API-Key": API_KEY})
+            latencies.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one(i) for i in range(requests)])
+    elapsed = time.perf_counter() - start
+
+    return {
+        "endpoint": endpoint,
+        "requests": requests,
+        "concurrency": concurrency,
+        "rps": round(requests / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p99_ms": round(percentile(latencies, 99), 1),
+        "errors": errors,
+    }
+
+async def main_async(args):
+    # Stand-in selezionati prima dell'import dell'app (document_service li usa all'import)
+    use_standins(args.openai_ms, args.pinecone_ms)
+
+    from app.main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        return [
+            await run_endpoint(client, endpoint, args.requests, args.concurrency)
+            for endpoint in args.endpoints
+        ]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark throughput API")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--openai-ms", type=float, default=150)
+    parser.add_argument("--pinecone-ms", type=float, default=50)
+    parser.add_argument("--endpoints", nargs="+", default=["query", "answer", "embed-upsert"])
+    parser.add_argument("--json", action="store_true", help="Output JSON")
+    args = parser.parse_args()
+
+    results = asyncio.run(main_async(args))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print("📊 Benchmark throughput (1 worker, stand-in a latenza iniettata)")
+    print("=" * 60)
+    query_latency = (args.openai_ms + args.pinecone_ms) / 1000
+    print(f"Riferimento handler sync: ~{THREADPOOL_SIZE / query_latency:.0f} req/s su /v1/query "
+          f"({THREADPOOL_SIZE} thread / {query_latency * 1000:.0f}ms)")
+    for r in results:
+        print(f"/v1/{r['endpoint']}: {r['rps']} req/s, p50={r['p50_ms']}ms p99={r['p99_ms']}ms "
+              f"(concorrenza {r['concurrency']}, errori {r['errors']})")
+
+if __name__ == "__main__":
+    main()
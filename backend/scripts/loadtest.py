@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Load test dell'API guidato da file di scenario
+Mix di upload, query, answer e listing su molti utenti sintetici,
+in-process (provider stand-in, nessuna chiave) o contro un server locale.
+Output JSON con throughput, p50/p95/p99 ed error rate per confrontare build.
+
+Uso:
+    python scripts/loadtest.py scripts/scenarios/mixed.json
+    python scripts/loadtest.py scripts/scenarios/chat_heavy.json --url http://localhost:8000 --output run.json
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import argparse
+import asyncio
+import io
+import json
+import platform
+import random
+import subprocess
+import time
+from collections import Counter, defaultdict
+
+import httpx
+
+API_KEY = os.getenv('DEV_API_KEY', 'super-secret-for-local')
+
+OPERATIONS = ("query", "answer", "list", "upload", "embed_upsert")
+
+WORDS = (
+    "esame voto crediti corso laurea algoritmi database reti sistemi programmazione "
+    "media certificazione studente università semestre appello relazione progetto"
+).split()
+
+
+def load_scenario(path):
+    """Legge e valida un file di scenario JSON"""
+    with open(path, encoding="utf-8") as f:
+        scenario = json.load(f)
+
+    unknown = set(scenario.get("mix", {})) - set(OPERATIONS)
+    if unknown:
+        raise ValueError(f"Operazioni sconosciute nello scenario: {sorted(unknown)}")
+    if not scenario.get("mix"):
+        raise ValueError("Lo scenario deve definire 'mix'")
+    if "requests" not in scenario and "duration_s" not in scenario:
+        raise ValueError("Lo scenario deve definire 'requests' o 'duration_s'")
+
+    scenario.setdefault("name", os.path.splitext(os.path.basename(path))[0])
+    scenario.setdefault("users", 10)
+    scenario.setdefault("concurrency", 10)
+    scenario.setdefault("think_time_ms", 0)
+    scenario.setdefault("text_words", 300)
+    return scenario
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def sample_png():
+    """PNG minimale per gli upload (il contenuto non conta con OCR mock)"""
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), "white").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class LoadGenerator:
+    """Esegue lo scenario con N worker concorrenti e raccoglie latenze per operazione"""
+
+    def __init__(self, client, scenario, seed):
+        self.client = client
+        self.scenario = scenario
+        self.random = random.Random(seed)
+        self.users = [f"load_user_{i:04d}" for i in range(scenario["users"])]
+        self.operations = list(scenario["mix"])
+        self.weights = [scenario["mix"][op] for op in self.operations]
+        self.png = sample_png() if "upload" in scenario["mix"] else None
+        self.latencies = defaultdict(list)
+        self.errors = Counter()
+        self.status_codes = defaultdict(Counter)
+        self.issued = 0
+        self.sequence = 0
+
+    def text(self, words):
+        return " ".join(self.random.choice(WORDS) for _ in range(words))
+
+    def build(self, operation, user_id):
+        """Richiesta (metodo, path, kwargs httpx) per l'operazione"""
+        self.sequence += 1
+        if operation == "query":
+            return "POST", "/v1/query", {"json": {"user_id": user_id, "query": self.text(8), "top_k": 5}}
+        if operation == "answer":
+            contexts = [{"text": self.text(80), "metadata": {"title": f"Doc {i}"}} for i in range(3)]
+            return "POST", "/v1/answer", {"json": {"query": self.text(8), "contexts": contexts}}
+        if operation == "list":
+            return "GET", f"/v1/documents/{user_id}", {}
+        if operation == "upload":
+            return "POST", "/v1/upload-document", {
+                "files": {"file": (f"scan_{self.sequence}.png", self.png, "image/png")},
+                "data": {"user_id": user_id, "title": f"Scansione {self.sequence}"},
+            }
+        return "POST", "/v1/embed-upsert", {"json": {
+            "user_id": user_id,
+            "item_id": f"load_{self.sequence}",
+            "title": f"Documento {self.sequence}",
+            "text": self.text(self.scenario["text_words"]),
+        }}
+
+    async def one(self):
+        operation = self.random.choices(self.operations, self.weights)[0]
+        method, path, kwargs = self.build(operation, self.random.choice(self.users))
+
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, path, headers={"X-API-Key": API_KEY}, **kwargs)
+            status = response.status_code
+            # Gli errori applicativi dell'upload tornano con 200 e success=false
+            failed = status >= 400 or (operation == "upload" and not response.json().get("success", False))
+        except Exception as e:
+            status = e.__class__.__name__
+            failed = True
+        self.latencies[operation].append((time.perf_counter() - start) * 1000)
+        self.status_codes[operation][str(status)] += 1
+        if failed:
+            self.errors[operation] += 1
+
+    async def worker(self, deadline):
+        think = self.scenario["think_time_ms"] / 1000
+        limit = self.scenario.get("requests")
+        while time.perf_counter() < deadline:
+            if limit is not None:
+                if self.issued >= limit:
+                    return
+                self.issued += 1
+            await self.one()
+            if think:
+                await asyncio.sleep(think)
+
+    async def run(self):
+        duration = self.scenario.get("duration_s")
+        deadline = time.perf_counter() + duration if duration else float("inf")
+        start = time.perf_counter()
+        await asyncio.gather(*[self.worker(deadline) for _ in range(self.scenario["concurrency"])])
+        return time.perf_counter() - start
+
+    def report(self, elapsed):
+        def summary(latencies, errors):
+            return {
+                "requests": len(latencies),
+                "errors": errors,
+                "error_rate": round(errors / len(latencies), 4) if latencies else 0.0,
+                "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+                "p50_ms": round(percentile(latencies, 50), 2),
+                "p95_ms": round(percentile(latencies, 95), 2),
+                "p99_ms": round(percentile(latencies, 99), 2),
+                "max_ms": round(max(latencies), 2) if latencies else 0.0,
+            }
+
+        all_latencies = [value for values in self.latencies.values() for value in values]
+        operations = {}
+        for operation in self.operations:
+            operations[operation] = summary(self.latencies[operation], self.errors[operation])
+            operations[operation]["status_codes"] = dict(self.status_codes[operation])
+        return {
+            "overall": summary(all_latencies, sum(self.errors.values())),
+            "operations": operations,
+        }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except Exception:
+        return None
+
+
+async def run_scenario(scenario, url=None, seed=0, openai_ms=150, pinecone_ms=50):
+    """Esegue lo scenario e restituisce il report (dict serializzabile in JSON)"""
+    if url:
+        transport = None
+        base_url = url
+        target = url
+    else:
+        # In-process: stand-in locali selezionati prima dell'import dell'app
+        from bench_throughput import use_standins
+        use_standins(openai_ms, pinecone_ms)
+
+        from app.main import app
+        transport = httpx.ASGITransport(app=app)
+        base_url = "http://loadtest"
+        target = "in-process"
+
+    limits = httpx.Limits(max_connections=scenario["concurrency"], max_keepalive_connections=scenario["concurrency"])
+    async with httpx.AsyncClient(transport=transport, base_url=base_url, limits=limits, timeout=120) as client:
+        generator = LoadGenerator(client, scenario, seed)
+        elapsed = await generator.run()
+
+    report = {
+        "scenario": scenario["name"],
+        "target": target,
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "seed": seed,
+        "users": scenario["users"],
+        "concurrency": scenario["concurrency"],
+        "duration_s": round(elapsed, 3),
+    }
+    if not url:
+        report["stand_in_latency_ms"] = {"openai": openai_ms, "pinecone": pinecone_ms}
+    report.update(generator.report(elapsed))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test API da file di scenario")
+    parser.add_argument("scenario", help="File di scenario JSON (es. scripts/scenarios/mixed.json)")
+    parser.add_argument("--url", help="Server da testare (es. http://localhost:8000); default in-process")
+    parser.add_argument("--requests", type=int, help="Sovrascrive il numero di richieste dello scenario")
+    parser.add_argument("--duration", type=float, help="Sovrascrive la durata (secondi) dello scenario")
+    parser.add_argument("--concurrency", type=int, help="Sovrascrive la concorrenza dello scenario")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--openai-ms", type=float, default=150, help="Latenza stand-in OpenAI (in-process)")
+    parser.add_argument("--pinecone-ms", type=float, default=50, help="Latenza stand-in Pinecone (in-process)")
+    parser.add_argument("--output", help="Scrive il report JSON su file invece che su stdout")
+    args = parser.parse_args()
+
+    scenario = load_scenario(args.scenario)
+    if args.requests is not None:
+        scenario["requests"] = args.requests
+        scenario.pop("duration_s", None)
+    if args.duration is not None:
+        scenario["duration_s"] = args.duration
+        scenario.pop("requests", None)
+    if args.concurrency is not None:
+        scenario["concurrency"] = args.concurrency
+
+    # I log applicativi per richiesta coprirebbero il report
+    import logging
+    logging.disable(logging.INFO)
+
+    report = asyncio.run(run_scenario(scenario, args.url, args.seed, args.openai_ms, args.pinecone_ms))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+        overall = report["overall"]
+        print(f"📊 {report['scenario']}: {overall['throughput_rps']} req/s, p95={overall['p95_ms']}ms, "
+              f"errori {overall['error_rate']:.2%} → {args.output}")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
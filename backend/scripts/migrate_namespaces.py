@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Migrazione dell'indice ai namespace per utente
+Copia i vettori del namespace condiviso nel namespace di ciascun utente, in blocchi
+paralleli, riprendibile (stato su file) e con verifica dei conteggi.
+
+Procedura online:
+    1. VECTOR_NAMESPACE_MODE=dual sul server (scrive in entrambi, legge dal condiviso)
+    2. python scripts/migrate_namespaces.py          # rilanciabile dopo un'interruzione
+    3. a verifica superata, VECTOR_NAMESPACE_MODE=per_user
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import argparse
+import asyncio
+import json
+
+from app.core.config import settings
+from app.services.namespace_migration import NamespaceMigration
+from app.services.providers import close_providers, get_pinecone_service
+
+
+async def migrate(args):
+    service = get_pinecone_service()
+    try:
+        migration = NamespaceMigration(
+            service, args.state,
+            source_namespace=args.source_namespace,
+            page_size=args.page_size,
+            batch_size=args.batch_size,
+            concurrency=args.concurrency,
+        )
+        if args.verify_only:
+            return await migration.verify(attempts=args.verify_attempts)
+        return await migration.run(verify_attempts=args.verify_attempts)
+    finally:
+        await close_providers()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrazione ai namespace per utente")
+    parser.add_argument("--state", default="namespace_migration.json", help="File di avanzamento")
+    parser.add_argument("--source-namespace", default="", help="Namespace sorgente (default condiviso)")
+    parser.add_argument("--page-size", type=int, default=100, help="Id letti per pagina")
+    parser.add_argument("--batch-size", type=int, default=100, help="Vettori per upsert")
+    parser.add_argument("--concurrency", type=int, default=4, help="Upsert in parallelo")
+    parser.add_argument("--verify-attempts", type=int, default=5)
+    parser.add_argument("--verify-only", action="store_true", help="Solo verifica dei conteggi")
+    parser.add_argument("--restart", action="store_true", help="Ignora lo stato salvato e riparte da zero")
+    parser.add_argument("--json", action="store_true", help="Output JSON")
+    args = parser.parse_args()
+
+    if settings.vector_namespace_mode == "shared":
+        print("⚠️ VECTOR_NAMESPACE_MODE=shared: le scritture durante la copia non arrivano nei "
+              "namespace per utente. Per una migrazione online usa dual sul server.", file=sys.stderr)
+    if args.restart and os.path.exists(args.state):
+        os.remove(args.state)
+
+    report = asyncio.run(migrate(args))
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print("📦 Migrazione namespace per utente")
+        print("=" * 50)
+        print(f"Pagine copiate: {report['pages_done']}, vettori: {report['copied']} "
+              f"in {report['namespaces']} namespace, senza user_id: {report['orphans']}")
+        print(f"Vettori nel namespace sorgente: {report['source_count']}")
+        for namespace, counts in report["mismatches"].items():
+            print(f"❌ {namespace}: attesi {counts['expected']}, presenti {counts['actual']}")
+        if report["verified"]:
+            print("✅ Conteggi verificati: si può passare a VECTOR_NAMESPACE_MODE=per_user")
+
+    sys.exit(0 if report["verified"] else 1)
+
+
+if __name__ == "__main__":
+    main()
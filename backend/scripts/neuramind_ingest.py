@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+neuramind-ingest: ingestione in blocco di una cartella di scansioni e file di testo
+Stessa pipeline di /v1/upload-document (OCR → chunking → embedding → upsert) senza
+una richiesta HTTP per file: OCR in parallelo su più processi, embedding e upsert
+a blocchi, avanzamento salvato per riprendere dopo un'interruzione.
+
+Uso:
+    python scripts/neuramind_ingest.py ./scansioni --user-id u1
+    python scripts/neuramind_ingest.py ./scansioni --user-id u1   # riprende da dove si era fermato
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import argparse
+import asyncio
+import json
+
+from app.services.bulk_ingest import BulkIngest
+from app.services.document_service import document_service
+from app.services.providers import close_providers
+
+
+async def ingest(args):
+    try:
+        job = BulkIngest(
+            args.directory, args.user_id, args.state or f"ingest_{args.user_id}.json",
+            language=args.language,
+            workers=args.workers,
+            batch_chunks=args.batch_chunks,
+            enforce_quota=not args.ignore_quota,
+        )
+        return await job.run()
+    finally:
+        await close_providers()
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="neuramind-ingest", description="Ingestione in blocco di una cartella")
+    parser.add_argument("directory", help="Cartella con immagini (jpg, png, tiff, ...) e file .txt/.md")
+    parser.add_argument("--user-id", required=True)
+    parser.add_argument("--state", help="File di avanzamento (default ingest_<user_id>.json)")
+    parser.add_argument("--language", default="ita+eng", help="Lingue Tesseract")
+    parser.add_argument("--workers", type=int, default=None, help="Processi OCR (default CPU; 0 = nel processo)")
+    parser.add_argument("--batch-chunks", type=int, default=256, help="Chunk per blocco di embedding e upsert")
+    parser.add_argument("--restart", action="store_true", help="Ignora lo stato salvato e riparte da zero")
+    parser.add_argument("--ignore-quota", action="store_true",
+                        help="Indicizza anche oltre il limite documenti dell'utente (il server eliminerà "
+                             "i più vecchi al prossimo upload)")
+    parser.add_argument("--json", action="store_true", help="Output JSON")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.directory):
+        parser.error(f"{args.directory} non è una cartella")
+    state = args.state or f"ingest_{args.user_id}.json"
+    if args.restart and os.path.exists(state):
+        os.remove(state)
+
+    report = asyncio.run(ingest(args))
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"📥 Ingestione {report['directory']} per {report['user_id']}")
+        print("=" * 60)
+        print(f"Indicizzati {report['ingested']} di {report['pending']} file in attesa "
+              f"({report['total_done']} in totale) in {report['seconds']:.1f}s: "
+              f"{report['docs_per_second']:.2f} documenti/s")
+        print(f"OCR: {report['ocr_cpu_seconds']:.1f}s di CPU su {report['workers']} processi")
+        for stage, seconds in report["stages"].items():
+            print(f"  {stage:<11} {seconds:>8.2f}s")
+        for relative, reason in report["failed"].items():
+            print(f"❌ {relative}: {reason}")
+
+    if not report["quota_enforced"]:
+        print(f"⚠️ QUOTA IGNORATA (--ignore-quota): limite di {document_service.max_documents} documenti non "
+              f"applicato; il server eliminerà i più vecchi al prossimo upload dell'utente", file=sys.stderr)
+    sys.exit(1 if report["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Visualizza una trace scritta dall'exporter JSON locale
+Stampa l'albero degli span con durate e offset dall'inizio della richiesta
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import argparse
+import glob
+import json
+
+def load_spans(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def print_tree(spans):
+    by_id = {s["span_id"]: s for s in spans}
+    children = {}
+    roots = []
+    for s in spans:
+        if s["parent_id"] in by_id:
+            children.setdefault(s["parent_id"], []).append(s)
+        else:
+            roots.append(s)
+
+    origin = min(s["start"] for s in spans)
+
+    def walk(s, depth):
+        offset = (s["start"] - origin) * 1000
+        status = "" if s["status"] == "ok" else f"  ❌ {s['attributes'].get('error', '')}"
+        where = f"pid={s['pid']}" if s["pid"] != spans[0]["pid"] else ""
+        print(f"{'  ' * depth}{s['name']:<{50 - 2 * depth}} {s['duration_ms'] or 0:>10.1f}ms  +{offset:>8.1f}ms  {where}{status}")
+        for child in sorted(children.get(s["span_id"], []), key=lambda c: c["start"]):
+            walk(child, depth + 1)
+
+    for root in sorted(roots, key=lambda r: r["start"]):
+        walk(root, 0)
+
+def main():
+    parser = argparse.ArgumentParser(description="Visualizza una trace JSON locale")
+    parser.add_argument("trace", nargs="?", help="trace_id o percorso del file .jsonl (default: la più recente)")
+    parser.add_argument("--dir", default=os.getenv("TRACE_DIR", "traces"))
+    args = parser.parse_args()
+
+    if args.trace and os.path.exists(args.trace):
+        path = args.trace
+    elif args.trace:
+        path = os.path.join(args.dir, f"{args.trace}.jsonl")
+    else:
+        files = glob.glob(os.path.join(args.dir, "*.jsonl"))
+        if not files:
+            print(f"❌ Nessuna trace in {args.dir}")
+            return
+        path = max(files, key=os.path.getmtime)
+
+    print(f"🔎 Trace: {path}")
+    print_tree(load_spans(path))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Helper condivisi dei test locali
+Stand-in locali (LLM e indice in memoria) al posto dei provider reali, ripristinati
+a fine test; usabili sia con pytest sia dal main() dei singoli file
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import functools
+from contextlib import contextmanager
+
+from app.core.config import settings
+from app.services import providers
+
+def reset_providers():
+    providers._openai_service = None
+    providers._pinecone_service = None
+    providers._embedding_service = None
+
+@contextmanager
+def standin_providers():
+    """LLM_PROVIDER=standin e VECTOR_PROVIDER=memory con client nuovi, poi i provider di prima"""
+    saved = (settings.llm_provider, settings.vector_provider)
+    settings.llm_provider = "standin"
+    settings.vector_provider = "memory"
+    reset_providers()
+    try:
+        yield
+    finally:
+        settings.llm_provider, settings.vector_provider = saved
+        reset_providers()
+
+def uses_standins(test):
+    """Decoratore: il test gira dentro standin_providers()"""
+    @functools.wraps(test)
+    def wrapper():
+        with standin_providers():
+            return test()
+    return wrapper
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Test locale dell'embed-upsert NDJSON
+Blocchi di embedding condivisi tra documenti, risultati per riga in streaming,
+righe non valide o troppo lunghe, lettura limitata dai documenti in attesa
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import asyncio
+import json
+
+import httpx
+
+from app.core.config import settings
+from app.services import providers
+from app.services.batch_upsert import BatchUpsert
+from conftest import uses_standins
+
+def document(i, user_id="nd1"):
+    return {"user_id": user_id, "item_id": f"note_{i}", "title": f"Nota {i}", "text": f"Appunti numero {i} " * 20}
+
+@uses_standins
+def test_shared_batches_and_errors():
+    """Test blocchi condivisi, errori per riga e righe spezzate tra i blocchi del corpo"""
+    print("🔍 Test blocchi condivisi...")
+
+    lines = [json.dumps(document(i)) for i in range(10)]
+    lines.insert(3, "{non json")
+    lines.insert(5, json.dumps({"user_id": "nd1", "item_id": "x"}))
+    lines.insert(7, json.dumps(document(99)) + " " * 600)
+    payload = ("\n".join(lines) + "\n\n").encode()
+
+    async def body():
+        # Blocchi di 7 byte: le righe arrivano spezzate
+        for start in range(0, len(payload), 7):
+            yield payload[start:start + 7]
+
+    async def run():
+        service = providers.get_embedding_service()
+        calls = []
+        create = service.create_embeddings
+
+        async def counting(texts, priority=None):
+            calls.append(len(texts))
+            return await create(texts, priority=priority)
+
+        service.create_embeddings = counting
+        job = BatchUpsert(batch_chunks=4, max_pending=2, max_line_bytes=500)
+        results = [result async for result in job.run(body())]
+        counts = await providers.get_pinecone_service().namespace_counts()
+        return calls, results, counts
+
+    calls, results, counts = asyncio.run(run())
+    ok = [r for r in results if r["ok"]]
+    errors = {r["line"]: r["error"] for r in results if not r["ok"]}
+    assert len(ok) == 10 and counts.get("", 0) == 10
+    assert sorted(errors) == [4, 6, 8] and "500 byte" in errors[8]
+    assert all(r["ids"] == [f"{r['item_id']}_0000"] for r in ok)
+    # 10 documenti da un chunk in blocchi da al massimo 4
+    assert sum(calls) == 10 and max(calls) <= 4 and len(calls) < 10
+    print(f"✅ 10 documenti in {len(calls)} chiamate di embedding {calls}, 3 righe rifiutate")
+
+@uses_standins
+def test_bounded_reading():
+    """Test lettura del corpo ferma finché i documenti in attesa non vengono indicizzati"""
+    print("\n🔍 Test lettura limitata...")
+
+    read = []
+    release = asyncio.Event
+
+    async def run():
+        gate = release()
+
+        async def body():
+            for i in range(50):
+                read.append(i)
+                yield (json.dumps(document(i, "nd2")) + "\n").encode()
+
+        service = providers.get_embedding_service()
+        create = service.create_embeddings
+
+        async def slow(texts, priority=None):
+            await gate.wait()
+            return await create(texts, priority=priority)
+
+        service.create_embeddings = slow
+        job = BatchUpsert(batch_chunks=2, max_pending=3)
+        results = job.run(body())
+        first = asyncio.ensure_future(results.__anext__())
+        await asyncio.sleep(0.05)
+        read_while_blocked = len(read)
+        gate.set()
+        rest = [await first] + [r async for r in results]
+        return read_while_blocked, rest
+
+    read_while_blocked, results = asyncio.run(run())
+    # Un blocco in indicizzazione (2) + 3 in coda + uno in attesa di entrare in coda
+    assert read_while_blocked <= 7, read_while_blocked
+    assert len(results) == 50 and all(r["ok"] for r in results)
+    print(f"✅ {read_while_blocked} righe lette su 50 con l'embedding bloccato")
+
+@uses_standins
+def test_streaming_endpoint():
+    """Test endpoint con corpo e risposta NDJSON"""
+    print("\n🔍 Test endpoint /v1/embed-upsert/batch...")
+
+    from app.main import app
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://t") as client:
+            payload = "".join(json.dumps(document(i, "nd3")) + "\n" for i in range(5))
+            response = await client.post("/v1/embed-upsert/batch", content=payload.encode(),
+                                         headers={"X-API-Key": settings.dev_api_key,
+                                                  "Content-Type": "application/x-ndjson"})
+            return response
+
+    response = asyncio.run(run())
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    results = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(r["line"] for r in results) == [1, 2, 3, 4, 5] and all(r["ok"] for r in results)
+    print(f"✅ {len(results)} righe di risultato")
+
+def main():
+    """Test completo locale"""
+    print("🧪 TEST LOCALE EMBED-UPSERT NDJSON")
+    print("=" * 40)
+
+    test_shared_batches_and_errors()
+    test_bounded_reading()
+    test_streaming_endpoint()
+
+    print("\n🎉 Tutti i test dell'embed-upsert NDJSON passati!")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Test locale dell'ingestione in blocco
+Cartella di file di testo e scansioni, blocchi di embedding condivisi,
+ripresa dopo un'interruzione senza rifare il lavoro già salvato,
+OCR simulato come file fallito e quota documenti per utente
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import asyncio
+import json
+import tempfile
+
+from app.services import bulk_ingest, providers
+from app.services.bulk_ingest import BulkIngest
+from app.services.document_service import document_service
+from app.services.ocr_service import ocr_service
+from conftest import uses_standins
+
+def make_directory():
+    directory = tempfile.mkdtemp()
+    os.makedirs(os.path.join(directory, "sub"))
+    for i in range(6):
+        with open(os.path.join(directory, f"nota_{i}.txt"), "w", encoding="utf-8") as f:
+            f.write(f"Appunti del corso {i}: esame di basi di dati, voto e crediti. " * 30)
+    with open(os.path.join(directory, "sub", "vuoto.md"), "w", encoding="utf-8") as f:
+        f.write("  ")
+    with open(os.path.join(directory, "ignorato.pdf"), "wb") as f:
+        f.write(b"%PDF-1.4")
+    return directory
+
+@uses_standins
+def test_resume_after_interruption():
+    """Test interruzione durante il secondo blocco e ripresa"""
+    print("🔍 Test ingestione riprendibile...")
+
+    directory = make_directory()
+    state_path = os.path.join(tempfile.mkdtemp(), "ingest.json")
+    upsert = bulk_ingest.upsert_user_vectors
+    flushed = []
+
+    async def failing_upsert(user_id, vectors):
+        if len(flushed) == 1:
+            raise RuntimeError("connessione persa")
+        flushed.append(len(vectors))
+        await upsert(user_id, vectors)
+
+    async def run():
+        bulk_ingest.upsert_user_vectors = failing_upsert
+        try:
+            await BulkIngest(directory, "bulk1", state_path, workers=0, batch_chunks=6).run()
+            raise AssertionError("Interruzione non propagata")
+        except RuntimeError:
+            pass
+        finally:
+            bulk_ingest.upsert_user_vectors = upsert
+
+        first = BulkIngest(directory, "bulk1", state_path, workers=0, batch_chunks=6)
+        done_before = len(first.state["done"])
+        report = await first.run()
+        again = await BulkIngest(directory, "bulk1", state_path, workers=0, batch_chunks=6).run()
+        counts = await providers.get_pinecone_service().namespace_counts()
+        return done_before, report, again, counts, await document_service.count_user_documents("bulk1")
+
+    done_before, report, again, counts, documents = asyncio.run(run())
+    assert done_before == 3 and flushed[0] == 6
+    assert report["pending"] == 4 and report["ingested"] == 3
+    assert report["total_done"] == 6 and list(report["failed"]) == [os.path.join("sub", "vuoto.md")]
+    assert set(report["stages"]) == {"scan", "ocr", "chunk", "embed", "upsert", "checkpoint"}
+    # Seconda esecuzione completa: nulla da rifare tranne il file senza testo
+    assert again["pending"] == 1 and again["ingested"] == 0
+    # 6 documenti da 2 chunk, nessun duplicato dal blocco ripetuto
+    assert counts.get("", 0) == 12 and documents == 6
+    print(f"✅ Ripresa da {done_before} documenti, {report['docs_per_second']} documenti/s, 12 vettori")
+
+@uses_standins
+def test_modified_file_replaced():
+    """Test file modificato: nuova versione indicizzata, vecchia eliminata"""
+    print("\n🔍 Test file modificato...")
+
+    directory = make_directory()
+    state_path = os.path.join(tempfile.mkdtemp(), "ingest.json")
+
+    async def run():
+        await BulkIngest(directory, "bulk2", state_path, workers=0).run()
+        path = os.path.join(directory, "nota_0.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("Versione corretta degli appunti del corso zero.")
+        os.utime(path, ns=(1, 1))
+        report = await BulkIngest(directory, "bulk2", state_path, workers=0).run()
+        return report, await providers.get_pinecone_service().namespace_counts()
+
+    report, counts = asyncio.run(run())
+    assert report["ingested"] == 1
+    assert counts.get("", 0) == 5 * 2 + 1
+    print("✅ Vecchi chunk sostituiti dalla nuova versione")
+
+@uses_standins
+def test_process_pool():
+    """Test OCR nel pool di processi"""
+    print("\n🔍 Test pool di processi...")
+
+    directory = make_directory()
+    state_path = os.path.join(tempfile.mkdtemp(), "ingest.json")
+    report = asyncio.run(BulkIngest(directory, "bulk3", state_path, workers=2).run())
+    assert report["ingested"] == 6 and report["workers"] == 2
+    print(f"✅ {report['ingested']} documenti con 2 processi")
+
+@uses_standins
+def test_mock_ocr_and_quota():
+    """Test immagini senza OCR reale come file falliti e quota documenti per utente"""
+    print("\n🔍 Test OCR simulato e quota...")
+
+    directory = tempfile.mkdtemp()
+    for i in range(12):
+        with open(os.path.join(directory, f"nota_{i:02d}.txt"), "w", encoding="utf-8") as f:
+            f.write(f"Appunti numero {i} sul corso di analisi matematica.")
+    with open(os.path.join(directory, "scansione.png"), "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n" + b"\0" * 64)
+    state_path = os.path.join(tempfile.mkdtemp(), "ingest.json")
+    bypass_path = os.path.join(tempfile.mkdtemp(), "ingest.json")
+
+    async def run():
+        report = await BulkIngest(directory, "bulk4", state_path, workers=0).run()
+        bypass = await BulkIngest(directory, "bulk5", bypass_path, workers=0, enforce_quota=False).run()
+        return report, bypass
+
+    available = ocr_service._tesseract_available
+    ocr_service._tesseract_available = False
+    try:
+        report, bypass = asyncio.run(run())
+    finally:
+        ocr_service._tesseract_available = available
+
+    assert report["ingested"] == 10 and report["quota_enforced"]
+    assert report["failed"]["scansione.png"].startswith("OCRUnavailableError")
+    assert sorted(r for r, reason in report["failed"].items() if reason.startswith("QUOTA_EXCEEDED")) == [
+        "nota_10.txt", "nota_11.txt"]
+    # Né l'immagine né i file oltre quota risultano completati: riprovati alla prossima esecuzione
+    with open(state_path, encoding="utf-8") as f:
+        done = json.load(f)["done"]
+    assert len(done) == 10 and "scansione.png" not in done
+    assert bypass["ingested"] == 12 and not bypass["quota_enforced"]
+    assert list(bypass["failed"]) == ["scansione.png"]
+    print("✅ Immagine con OCR simulato fallita, 2 file oltre quota non indicizzati")
+
+def main():
+    """Test completo locale"""
+    print("🧪 TEST LOCALE INGESTIONE IN BLOCCO")
+    print("=" * 40)
+
+    test_resume_after_interruption()
+    test_modified_file_replaced()
+    test_process_pool()
+    test_mock_ocr_and_quota()
+
+    print("\n🎉 Tutti i test dell'ingestione in blocco passati!")
+
+if __name__ == "__main__":
+    main()
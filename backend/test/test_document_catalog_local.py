@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Test locale del catalogo documenti per la quota di upload
+Caricamento unico dall'indice, conteggio e più vecchio senza scansioni,
+eliminazione in background oltre il limite
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import asyncio
+
+from app.services.document_catalog import DocumentCatalog
+from app.services.document_service import DocumentService
+
+def test_catalog_loads_once():
+    """Test caricamento dall'indice una sola volta, poi aggiornamenti in memoria"""
+    print("🔍 Test catalogo in memoria...")
+
+    scans = []
+
+    async def loader(user_id):
+        scans.append(user_id)
+        # Come _scan_user_documents: dal più recente
+        return [
+            {"item_id": "doc_b", "created_at": "2024-02-01", "chunks_count": 2},
+            {"item_id": "doc_a", "created_at": "2024-01-01", "chunks_count": 1},
+        ]
+
+    async def run():
+        catalog = DocumentCatalog(loader, ttl=300)
+        results = await asyncio.gather(*[catalog.count("u1") for _ in range(10)])
+        assert results == [2] * 10
+        assert await catalog.oldest("u1") == "doc_a"
+
+        await catalog.add("u1", "doc_c", 3, "2024-03-01")
+        await catalog.remove("u1", "doc_a")
+        assert await catalog.count("u1") == 2
+        assert await catalog.oldest("u1") == "doc_b"
+        assert (await catalog.get("u1", "doc_c"))["chunks"] == 3
+
+        catalog.invalidate("u1")
+        assert await catalog.count("u1") == 2
+        return catalog.stats()
+
+    stats = asyncio.run(run())
+    assert scans == ["u1", "u1"]
+    assert stats["loads"] == 2
+    print(f"✅ {len(scans)} scansioni dell'indice per 10 conteggi concorrenti e un invalidate")
+
+def test_eviction_over_quota():
+    """Test eliminazione in ordine dei documenti più vecchi oltre il limite"""
+    print("\n🔍 Test eliminazione oltre il limite...")
+
+    async def run():
+        service = DocumentService()
+        service.max_documents = 3
+        deleted = []
+
+        async def empty_index(user_id):
+            return []
+
+        async def delete_document(user_id, item_id):
+            deleted.append(item_id)
+            await service.catalog.remove(user_id, item_id)
+            return True
+
+        service.catalog.loader = empty_index
+        service.delete_document = delete_document
+
+        for i in range(5):
+            await service.register_document("u1", f"doc_{i}", 1)
+        assert not await service.can_upload_document("u1")
+
+        # Due giri concorrenti non eliminano più del necessario
+        evicted = await asyncio.gather(service.evict_over_quota("u1"), service.evict_over_quota("u1"))
+        # Lock per utente rimosso quando nessun giro lo usa più
+        assert service._eviction_locks == {} and service._eviction_users == {}
+        return sum(evicted), deleted, await service.count_user_documents("u1")
+
+    evicted, deleted, count = asyncio.run(run())
+    assert evicted == 2
+    assert deleted == ["doc_0", "doc_1"]
+    assert count == 3
+    print(f"✅ Eliminati {deleted}, restano {count} documenti")
+
+def test_catalog_bounded():
+    """Test utenti limitati a max_users e utente tolto quando non ha più documenti"""
+    print("\n🔍 Test catalogo limitato...")
+
+    scans = []
+
+    async def loader(user_id):
+        scans.append(user_id)
+        return [{"item_id": "doc_a", "created_at": "2024-01-01", "chunks_count": 1}]
+
+    async def run():
+        catalog = DocumentCatalog(loader, ttl=300, max_users=2)
+        for user_id in ("u1", "u2", "u1", "u3"):
+            await catalog.count(user_id)
+        # u2 è il meno recente: uscito dal catalogo e ricaricato al prossimo accesso
+        users = set(catalog._users)
+        assert await catalog.count("u2") == 1
+        await catalog.remove("u2", "doc_a")
+        return users, catalog.stats()
+
+    users, stats = asyncio.run(run())
+    assert users == {"u1", "u3"}
+    assert scans == ["u1", "u2", "u3", "u2"]
+    assert stats["users"] == 1 and stats["documents"] == 1
+    print(f"✅ Al più 2 utenti in memoria, {len(scans)} caricamenti")
+
+def test_paginated_listing():
+    """Test pagine con cursore, ordinamento e proiezione dei campi"""
+    print("\n🔍 Test lista a pagine...")
+
+    async def run():
+        async def empty_index(user_id):
+            return []
+
+        fetched = []
+
+        async def fetch_vectors(ids, namespace=""):
+            fetched.extend(ids)
+            return {i: {"text": "abc", "file_type": "image_with_ocr"} for i in ids}
+
+        class ListingService(DocumentService):
+            async def _pinecone(self):
+                return self
+
+        service = ListingService()
+        service.fetch_vectors = fetch_vectors
+        service.catalog.loader = empty_index
+
+        for i in range(7):
+            await service.catalog.add("u1", f"doc_{i}", 2, f"2024-01-0{i + 1}", f"Titolo {6 - i}")
+
+        # Vista predefinita: nessuna lettura dall'indice
+        ids, cursor = [], None
+        while True:
+            page = await service.list_documents("u1", limit=3, cursor=cursor)
+            ids += [d["item_id"] for d in page["documents"]]
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+        assert ids == [f"doc_{i}" for i in range(6, -1, -1)]
+        assert set(page["documents"][0]) == {"item_id", "title", "created_at", "chunks_count"}
+        assert fetched == [] and page["total_count"] == 7
+
+        page = await service.list_documents("u1", limit=2, sort="title_asc", fields=["item_id", "text_length"])
+        assert [d["item_id"] for d in page["documents"]] == ["doc_6", "doc_5"]
+        assert page["documents"][0] == {"item_id": "doc_6", "text_length": 6}
+        assert fetched == ["doc_6_0000", "doc_6_0001", "doc_5_0000", "doc_5_0001"]
+
+        for bad in ({"sort": "size"}, {"fields": ["secret"]}, {"cursor": page["next_cursor"]}):
+            try:
+                await service.list_documents("u1", **bad)
+                raise AssertionError(f"Parametri accettati: {bad}")
+            except ValueError:
+                pass
+
+    asyncio.run(run())
+    print("✅ 7 documenti in 3 pagine, campi extra letti solo per la pagina")
+
+def main():
+    """Test completo locale"""
+    print("🧪 TEST LOCALE CATALOGO DOCUMENTI")
+    print("=" * 40)
+
+    test_catalog_loads_once()
+    test_eviction_over_quota()
+    test_catalog_bounded()
+    test_paginated_listing()
+
+    print("\n🎉 Tutti i test del catalogo passati!")
+
+if __name__ == "__main__":
+    main()
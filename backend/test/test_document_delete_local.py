@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Test locale dell'eliminazione documenti
+Id dei chunk da listing per prefisso, delete a blocchi, più documenti per chiamata,
+documenti nascosti dalle ricerche prima della rimozione dall'indice
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import asyncio
+
+from app.core.config import settings
+from app.services import providers
+from app.services.document_service import DocumentService, document_service
+from app.services.rag import semantic_search, upsert_chunks
+from conftest import uses_standins
+
+async def ingest(service, user_id, item_id, chunks):
+    await upsert_chunks(user_id, item_id, f"Titolo {item_id}", chunks)
+    await service.register_document(user_id, item_id, len(chunks))
+
+@uses_standins
+def test_batched_delete():
+    """Test delete a blocchi e prefisso che non cattura altri documenti"""
+    print("🔍 Test eliminazione a blocchi...")
+
+    async def run():
+        service = DocumentService()
+        index = providers.get_pinecone_service()
+        calls = []
+        delete = index.index.delete
+
+        async def counting_delete(ids=None, **kwargs):
+            calls.append(len(ids))
+            return await delete(ids=ids, **kwargs)
+
+        index.index.delete = counting_delete
+        original_batch = settings.delete_batch_size
+        settings.delete_batch_size = 4
+        try:
+            await ingest(service, "u1", "doc", [f"esame {i}" for i in range(10)])
+            await ingest(service, "u1", "doc_2", ["media voti"])
+            assert await service.delete_document("u1", "doc")
+        finally:
+            settings.delete_batch_size = original_batch
+
+        remaining = [i async for page in index.index.list(prefix="doc") for i in page]
+        return calls, remaining
+
+    calls, remaining = asyncio.run(run())
+
+    assert sorted(calls) == [2, 4, 4]
+    assert remaining == ["doc_2_0000"]
+    print(f"✅ 10 chunk eliminati in {len(calls)} chiamate, doc_2 intatto")
+
+@uses_standins
+def test_multi_delete_with_tombstones():
+    """Test eliminazione di più documenti e ricerca che li esclude subito"""
+    print("\n🔍 Test eliminazione multipla e tombstone...")
+
+    async def run():
+        index = providers.get_pinecone_service()
+        for item_id in ("a", "b", "c"):
+            await ingest(document_service, "u1", item_id, [f"esame di database documento {item_id}"])
+        await ingest(document_service, "u2", "d", ["esame di database"])
+
+        # L'utente non può eliminare documenti altrui
+        found = await document_service.mark_deleted("u1", ["a", "b", "d", "x"])
+        assert found == ["a", "b"]
+
+        # Prima della rimozione dall'indice: già esclusi da ricerca, lista e conteggio
+        matches = await semantic_search("u1", "esame di database", top_k=10)
+        hidden = sorted(m["metadata"]["item_id"] for m in matches)
+        listed = [d["item_id"] for d in await document_service.get_user_documents("u1")]
+        assert await document_service.count_user_documents("u1") == 1
+        assert len(await index.list_ids(prefix="a_")) == 1
+
+        assert await document_service.purge_documents("u1", found)
+        assert document_service.deleted_item_ids("u1") == []
+        ids = [i async for page in index.index.list() for i in page]
+        return hidden, listed, ids
+
+    try:
+        hidden, listed, ids = asyncio.run(run())
+    finally:
+        document_service.catalog = type(document_service.catalog)(
+            document_service._scan_user_documents, ttl=settings.document_catalog_ttl
+        )
+
+    assert hidden == ["c"] and listed == ["c"]
+    assert ids == ["c_0000", "d_0000"]
+    print(f"✅ Ricerca e lista escludono i documenti eliminati, restano {ids}")
+
+@uses_standins
+def test_delete_without_prefix_listing():
+    """Test id dal tombstone quando il listing fallisce; tombstone tenuto se nessun id è risolto"""
+    print("\n🔍 Test eliminazione senza listing per prefisso...")
+
+    async def run():
+        service = document_service
+        index = providers.get_pinecone_service()
+
+        async def no_listing(*args, **kwargs):
+            raise RuntimeError("list non supportato")
+
+        index.list_ids = no_listing
+        await ingest(service, "u3", "doc", [f"appunti di fisica parte {i}" for i in range(3)])
+        deleted = await service.delete_document("u3", "doc")
+        matches = await semantic_search("u3", "appunti di fisica", top_k=10)
+        remaining = [i async for page in index.index.list(prefix="doc") for i in page]
+        cleared = service.deleted_item_ids("u3")
+
+        # Nessun id risolvibile: eliminazione non confermata, documento ancora nascosto
+        await service.catalog.add("u3", "vuoto", 0, "2026-01-01T00:00:00")
+        await upsert_chunks("u3", "vuoto", "Vuoto", ["appunti di fisica senza catalogo"])
+        unresolved = await service.delete_document("u3", "vuoto")
+        hidden = await semantic_search("u3", "appunti di fisica", top_k=10)
+        return deleted, matches, remaining, cleared, unresolved, service.deleted_item_ids("u3"), hidden
+
+    try:
+        deleted, matches, remaining, cleared, unresolved, pending, hidden = asyncio.run(run())
+    finally:
+        document_service.tombstones.clear()
+        document_service.catalog = type(document_service.catalog)(
+            document_service._scan_user_documents, ttl=settings.document_catalog_ttl
+        )
+
+    assert deleted and matches == [] and remaining == [] and cleared == []
+    assert not unresolved and pending == ["vuoto"] and hidden == []
+    print("✅ 3 chunk eliminati dal conteggio nel tombstone; senza id il tombstone resta")
+
+@uses_standins
+def test_delete_with_empty_listing():
+    """Test listing riuscito ma vuoto (indice non ancora consistente): id dal conteggio del catalogo"""
+    print("\n🔍 Test eliminazione con listing vuoto...")
+
+    async def run():
+        service = document_service
+        index = providers.get_pinecone_service()
+
+        async def empty_listing(*args, **kwargs):
+            return []
+
+        index.list_ids = empty_listing
+        await ingest(service, "u4", "doc", [f"appunti di chimica parte {i}" for i in range(3)])
+        deleted = await service.delete_document("u4", "doc")
+        remaining = [i async for page in index.index.list(prefix="doc") for i in page]
+        return deleted, remaining, service.deleted_item_ids("u4")
+
+    try:
+        deleted, remaining, pending = asyncio.run(run())
+    finally:
+        document_service.tombstones.clear()
+        document_service.catalog = type(document_service.catalog)(
+            document_service._scan_user_documents, ttl=settings.document_catalog_ttl
+        )
+
+    assert deleted and remaining == [] and pending == []
+    print("✅ 3 chunk eliminati nonostante il listing vuoto, nessun tombstone residuo")
+
+def main():
+    """Test completo locale"""
+    print("🧪 TEST LOCALE ELIMINAZIONE DOCUMENTI")
+    print("=" * 40)
+
+    test_batched_delete()
+    test_multi_delete_with_tombstones()
+    test_delete_without_prefix_listing()
+    test_delete_with_empty_listing()
+
+    print("\n🎉 Tutti i test di eliminazione passati!")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Test locale del registro dei modelli di embedding
+Dimensione e limiti da EMBEDDING_MODEL, varianti ridotte, richieste a blocchi
+entro i limiti del modello e troncamento degli input troppo lunghi
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import asyncio
+
+from app.core.config import EMBEDDING_MODELS, Settings, settings
+from app.services.standins import StandInOpenAIService
+from app.services.tokenizer import batch_by_limits, count_tokens
+
+def test_registry_settings():
+    """Test dimensione predefinita dal modello e validazione delle varianti ridotte"""
+    print("🔍 Test registro modelli...")
+
+    assert Settings(EMBEDDING_MODEL="text-embedding-3-large").embedding_dimension == 3072
+    small = Settings(EMBEDDING_MODEL="text-embedding-3-small", EMBEDDING_DIMENSION=512, EMBEDDING_BATCH_SIZE=10**6)
+    assert small.embedding_dimension == 512
+    assert small.embedding_batch_size == EMBEDDING_MODELS["text-embedding-3-small"].max_batch_inputs
+
+    for bad in ({"EMBEDDING_MODEL": "text-embedding-ada-002", "EMBEDDING_DIMENSION": 512},
+                {"EMBEDDING_MODEL": "text-embedding-3-small", "EMBEDDING_DIMENSION": 4096},
+                {"EMBEDDING_MODEL": "sconosciuto"}):
+        try:
+            Settings(**bad)
+            raise AssertionError(f"Configurazione accettata: {bad}")
+        except ValueError:
+            pass
+    print("✅ Dimensioni dal registro, configurazioni non supportate rifiutate")
+
+def test_batched_embeddings():
+    """Test richieste a blocchi, ordine preservato e parametro dimensions"""
+    print("\n🔍 Test embedding a blocchi...")
+
+    saved = (settings.embedding_model, settings.embedding_dimension, settings.embedding_batch_size)
+    settings.embedding_model, settings.embedding_dimension, settings.embedding_batch_size = (
+        "text-embedding-3-small", 256, 4
+    )
+    try:
+        service = StandInOpenAIService()
+        calls = []
+        create = service.client.embeddings.with_raw_response.create
+
+        async def counting_create(**kwargs):
+            calls.append(kwargs)
+            return await create(**kwargs)
+
+        service.client.embeddings.with_raw_response.create = counting_create
+        texts = [f"chunk numero {i}" for i in range(10)] + ["parola " * 50_000]
+
+        async def run():
+            batch = await service.create_embeddings(texts)
+            single = await service.create_embedding(texts[3])
+            return batch, single
+
+        batch, single = asyncio.run(run())
+    finally:
+        settings.embedding_model, settings.embedding_dimension, settings.embedding_batch_size = saved
+
+    assert len(batch) == 11 and all(len(e) == 256 for e in batch)
+    assert batch[3] == single
+    assert [len(c["input"]) if isinstance(c["input"], list) else 1 for c in calls] == [4, 4, 3, 1]
+    assert all(c["dimensions"] == 256 and c["model"] == "text-embedding-3-small" for c in calls)
+    # L'input oltre 8191 token è troncato prima della richiesta
+    assert count_tokens(calls[2]["input"][-1], "cl100k_base") <= 8191
+    print(f"✅ 11 testi in {len(calls) - 1} richieste, dimensione 256")
+
+def test_batch_token_budget():
+    """Test blocchi chiusi anche al raggiungimento dei token per richiesta"""
+    print("\n🔍 Test budget token...")
+
+    texts = ["parola " * 100] * 5
+    budget = 2 * count_tokens(texts[0], "cl100k_base") + 1
+    assert batch_by_limits(texts, 100, budget, "cl100k_base") == [[0, 1], [2, 3], [4]]
+    assert batch_by_limits(texts, 3, 10**6, "cl100k_base") == [[0, 1, 2], [3, 4]]
+    print("✅ Blocchi entro il budget di token")
+
+def main():
+    """Test completo locale"""
+    print("🧪 TEST LOCALE REGISTRO EMBEDDING")
+    print("=" * 40)
+
+    test_registry_settings()
+    test_batched_embeddings()
+    test_batch_token_budget()
+
+    print("\n🎉 Tutti i test del registro embedding passati!")
+
+if __name__ == "__main__":
+    main()
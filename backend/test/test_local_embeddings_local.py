@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Test locale degli embedding su CPU
+Selezione dal registro, batch dinamico delle richieste concorrenti,
+ordine dei risultati e latenza della query con l'encoder a hashing
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import asyncio
+import time
+
+from app.core.config import settings
+from app.services import providers
+from app.services.local_embeddings import HashEncoder, LocalEmbeddingService
+from app.services.rate_limiter import PRIORITY_BATCH
+from app.services.singleflight import coalescing_stats, embedding_flight, local_embedding_flight
+from app.services.standins import hash_embedding
+
+class RecordingEncoder(HashEncoder):
+    """Encoder a hashing che registra la dimensione di ogni batch"""
+
+    def __init__(self, dimension):
+        super().__init__(dimension)
+        self.batches = []
+
+    def encode(self, texts):
+        self.batches.append(len(texts))
+        return super().encode(texts)
+
+def use_hashing(dimension=384):
+    saved = (settings.embedding_model, settings.embedding_dimension, settings.embedding_batch_size)
+    settings.embedding_model, settings.embedding_dimension, settings.embedding_batch_size = "hashing", dimension, 16
+    return saved
+
+def restore(saved):
+    settings.embedding_model, settings.embedding_dimension, settings.embedding_batch_size = saved
+
+def test_provider_selection():
+    """Test servizio locale per i modelli locali, servizio LLM per gli altri"""
+    print("🔍 Test selezione provider...")
+
+    settings.llm_provider = "standin"
+    providers._openai_service = None
+    providers._embedding_service = None
+    assert providers.get_embedding_service() is providers.get_openai_service()
+
+    saved = use_hashing()
+    try:
+        service = providers.get_embedding_service()
+        assert isinstance(service, LocalEmbeddingService)
+        assert providers.get_embedding_service() is service
+        vector = asyncio.run(service.create_embedding("media voti esami"))
+        assert vector == hash_embedding("media voti esami", 384)
+        asyncio.run(providers.close_providers())
+    finally:
+        restore(saved)
+    print("✅ hashing → servizio locale, ada-002 → servizio LLM")
+
+def test_dynamic_batching():
+    """Test richieste concorrenti raccolte in batch, ordine preservato"""
+    print("\n🔍 Test batch dinamico...")
+
+    saved = use_hashing()
+    try:
+        encoder = RecordingEncoder(384)
+        service = LocalEmbeddingService(encoder)
+        texts = [f"domanda numero {i}" for i in range(40)]
+
+        async def run():
+            single = await asyncio.gather(*[service.create_embedding(text) for text in texts])
+            batch = await service.create_embeddings(texts)
+            return single, batch
+
+        single, batch = asyncio.run(run())
+        asyncio.run(service.close())
+    finally:
+        restore(saved)
+
+    expected = [hash_embedding(text, 384) for text in texts]
+    assert single == expected and batch == expected
+    # 40 richieste concorrenti: batch da 16 invece di 40 chiamate al modello
+    assert encoder.batches == [16, 16, 8, 16, 16, 8], encoder.batches
+    print(f"✅ 40 richieste concorrenti in {encoder.batches[:3]} batch")
+
+def test_interactive_priority():
+    """Test query interattiva servita prima dei blocchi di ingest in coda, task dei batch tracciati"""
+    print("\n🔍 Test priorità sul thread di inferenza...")
+
+    class SlowEncoder(RecordingEncoder):
+        def encode(self, texts):
+            if texts[0] == "rotto":
+                raise RuntimeError("modello non disponibile")
+            time.sleep(0.02)
+            self.batches.append(texts[0])
+            return HashEncoder.encode(self, texts)
+
+    saved = use_hashing()
+    try:
+        encoder = SlowEncoder(384)
+        service = LocalEmbeddingService(encoder)
+        chunks = [f"blocco {i // 16} chunk {i}" for i in range(64)]
+
+        async def run():
+            ingests = asyncio.gather(*[service.create_embeddings(chunks, priority=PRIORITY_BATCH) for _ in range(2)])
+            await asyncio.sleep(0.005)
+            await service.create_embedding("domanda urgente")
+            done_before_query = len(encoder.batches)
+            await ingests
+            try:
+                await service.create_embedding("rotto")
+                raise AssertionError("Errore dell'encoder non propagato")
+            except RuntimeError:
+                pass
+            return done_before_query, set(service._tasks)
+
+        done_before_query, tasks = asyncio.run(run())
+        asyncio.run(service.close())
+    finally:
+        restore(saved)
+    # La query passa davanti ai blocchi dei due ingest già in coda: servita subito dopo il primo
+    assert encoder.batches.index("domanda urgente") == done_before_query - 1 == 1, encoder.batches
+    assert len(encoder.batches) == 9 and tasks == set()
+    print("✅ Query servita dopo 1 blocco su 8 dei due ingest")
+
+def test_local_single_flight():
+    """Test richieste identiche coalescenti nel gruppo locale, separato da quello OpenAI"""
+    print("\n🔍 Test single-flight locale...")
+
+    saved = use_hashing()
+    try:
+        service = LocalEmbeddingService(RecordingEncoder(384))
+        openai_before = embedding_flight.stats()["calls"]
+        local_before = local_embedding_flight.stats()["coalesced"]
+
+        async def run():
+            return await asyncio.gather(*[service.create_embedding("stesso testo") for _ in range(5)])
+
+        vectors = asyncio.run(run())
+        asyncio.run(service.close())
+    finally:
+        restore(saved)
+    assert all(vector == vectors[0] for vector in vectors)
+    assert service.encoder.batches == [1]
+    assert local_embedding_flight.stats()["coalesced"] - local_before == 4
+    assert embedding_flight.stats()["calls"] == openai_before
+    assert local_embedding_flight.backend == "local" and "local_embedding" in coalescing_stats()
+    print("✅ 5 richieste identiche, 1 encode, nessuna chiamata nel gruppo OpenAI")
+
+def test_query_latency():
+    """Test latenza della singola query senza rete"""
+    print("\n🔍 Test latenza query...")
+
+    saved = use_hashing()
+    try:
+        service = LocalEmbeddingService()
+
+        async def run():
+            await service.warm_up()
+            timings = []
+            for i in range(50):
+                start = time.perf_counter()
+                await service.create_embedding(f"qual è la media dei voti del semestre {i}?")
+                timings.append((time.perf_counter() - start) * 1000)
+            return sorted(timings)[len(timings) // 2]
+
+        p50 = asyncio.run(run())
+        asyncio.run(service.close())
+    finally:
+        restore(saved)
+    assert p50 < 10, p50
+    print(f"✅ p50 {p50:.2f} ms per query")
+
+def main():
+    """Test completo locale"""
+    print("🧪 TEST LOCALE EMBEDDING SU CPU")
+    print("=" * 40)
+
+    test_provider_selection()
+    test_dynamic_batching()
+    test_interactive_priority()
+    test_local_single_flight()
+    test_query_latency()
+
+    print("\n🎉 Tutti i test degli embedding locali passati!")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Test locale del logging
+Rate limit e campionamento per logger, log dei payload e scrittura in background
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import asyncio
+import io
+import json
+import logging
+import logging.handlers
+import queue
+
+from app.core import log_setup
+from app.core.config import settings
+
+def make_record(name, level=logging.INFO, msg="messaggio %s", args=("x",), **extra):
+    record = logging.LogRecord(name, level, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+def test_rate_limit_per_logger():
+    """Test token bucket per logger: WARNING e payload non vengono scartati"""
+    print("🔍 Test rate limit per logger...")
+
+    rate_filter = log_setup.RateLimitFilter(rate=0.001, burst=5, sample_rate=1.0)
+    passed = sum(rate_filter.filter(make_record("app.rumoroso")) for _ in range(50))
+    assert passed == 5
+    assert rate_filter.filter(make_record("app.altro"))
+    assert rate_filter.filter(make_record("app.rumoroso", level=logging.WARNING))
+    assert rate_filter.filter(make_record("app.rumoroso", payload=True))
+    assert rate_filter.dropped == {"app.rumoroso": 45}
+    print(f"✅ {passed}/50 passati, scartati: {rate_filter.dropped}")
+
+def test_sampling_by_prefix():
+    """Test campionamento con regola per prefisso di logger"""
+    print("\n🔍 Test campionamento...")
+
+    rate_filter = log_setup.RateLimitFilter(
+        rate=0, burst=0, sample_rate=1.0,
+        logger_sample_rates=log_setup.parse_logger_rates("app.services=0.1, app.services.rag=0")
+    )
+    sampled = sum(rate_filter.filter(make_record("app.services.document_service")) for _ in range(2000))
+    assert 100 < sampled < 300
+    assert not any(rate_filter.filter(make_record("app.services.rag")) for _ in range(100))
+    assert all(rate_filter.filter(make_record("app.api.routes")) for _ in range(100))
+    print(f"✅ {sampled}/2000 campionati al 10%")
+
+def test_payload_only_with_request_debug():
+    """Test log dei payload emessi solo con debug della richiesta"""
+    print("\n🔍 Test log payload...")
+
+    logger = logging.getLogger("test.payload")
+    logger.setLevel(logging.INFO)
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    logger.addHandler(handler)
+
+    log_setup.log_payload(logger, "contesto: %s", "segreto")
+    assert records == []
+
+    token = log_setup._request_debug.set(True)
+    try:
+        log_setup.log_payload(logger, "contesto: %s", "visibile")
+    finally:
+        log_setup._request_debug.reset(token)
+    assert len(records) == 1 and records[0].payload and records[0].getMessage() == "contesto: visibile"
+    print("✅ Payload emesso solo con debug attivo")
+
+def test_request_debug_requires_admin_key():
+    """Test debug della richiesta solo con chiave admin valida, anche non ASCII"""
+    print("\n🔍 Test middleware di debug...")
+
+    seen = []
+
+    async def app(scope, receive, send):
+        seen.append(log_setup._request_debug.get())
+
+    def call(admin_key):
+        scope = {
+            "type": "http", "path": "/v1/query",
+            "headers": [(b"x-debug-log", b"1"), (b"x-admin-key", admin_key.encode())],
+        }
+        asyncio.run(log_setup.RequestDebugMiddleware(app)(scope, None, None))
+
+    previous = settings.admin_api_key
+    settings.admin_api_key = "admin-secret"
+    try:
+        call("admin-secret")
+        call("sbagliata")
+        # Chiave non ASCII: confronto tra byte, nessuna eccezione
+        call("chiave-è")
+    finally:
+        settings.admin_api_key = previous
+    assert seen == [True, False, False]
+    print("✅ Debug attivo solo con la chiave corretta")
+
+def test_queue_handler_writes_json():
+    """Test record strutturati scritti dal thread del listener"""
+    print("\n🔍 Test scrittura in background...")
+
+    stream = io.StringIO()
+    output = logging.StreamHandler(stream)
+    output.setFormatter(log_setup.JsonFormatter())
+    handler = log_setup.DroppingQueueHandler(queue.Queue(maxsize=100))
+    handler.addFilter(log_setup.ContextFilter())
+    listener = logging.handlers.QueueListener(handler.queue, output)
+
+    logger = logging.getLogger("test.queue")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    logger.addHandler(handler)
+    listener.start()
+    try:
+        logger.info("documento %s salvato", "doc_1", extra={"chunks": 3})
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            logger.exception("errore upsert")
+    finally:
+        listener.stop()
+        logger.removeHandler(handler)
+
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert lines[0]["message"] == "documento doc_1 salvato" and lines[0]["chunks"] == 3
+    assert lines[0]["logger"] == "test.queue" and lines[0]["route"] == "none"
+    assert lines[1]["level"] == "ERROR" and "ValueError: boom" in lines[1]["exception"]
+    print(f"✅ {len(lines)} record JSON scritti")
+
+def main():
+    """Test completo locale"""
+    print("🧪 TEST LOCALE LOGGING")
+    print("=" * 40)
+
+    test_rate_limit_per_logger()
+    test_sampling_by_prefix()
+    test_payload_only_with_request_debug()
+    test_request_debug_requires_admin_key()
+    test_queue_handler_writes_json()
+
+    print("\n🎉 Tutti i test di logging passati!")
+
+if __name__ == "__main__":
+    main()
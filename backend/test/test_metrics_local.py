@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Test locale delle metriche Prometheus
+Middleware (durata, richieste in corso) ed esposizione su /metrics,
+con etichette dal template della route e non dal percorso
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from fastapi.testclient import TestClient
+from prometheus_client.parser import text_string_to_metric_families
+
+from app.core.config import settings
+from conftest import uses_standins
+
+def scrape(client):
+    """Campioni di /metrics per nome: lista di (etichette, valore)"""
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    samples = {}
+    for family in text_string_to_metric_families(response.text):
+        for sample in family.samples:
+            samples.setdefault(sample.name, []).append((sample.labels, sample.value))
+    return response.text, samples
+
+@uses_standins
+def test_request_metrics():
+    """Test istogramma delle richieste, contatori e gauge con il template della route"""
+    print("🔍 Test metriche delle richieste...")
+
+    from app.main import app
+
+    client = TestClient(app)
+    headers = {"X-API-Key": settings.dev_api_key}
+    response = client.post("/v1/embed-upsert", headers=headers, json={
+        "user_id": "metrics_user_7", "item_id": "metrics_doc", "title": "Metriche", "text": "Appunti di statistica " * 20,
+    })
+    assert response.status_code == 200, response.text
+    for _ in range(2):
+        assert client.get("/v1/documents/metrics_user_7", headers=headers).status_code == 200
+    assert client.get("/v1/nessuna-route").status_code == 404
+
+    text, samples = scrape(client)
+
+    durations = {
+        (labels["route"], labels["method"], labels["status"]): value
+        for labels, value in samples["neuramind_request_duration_seconds_count"]
+    }
+    assert durations[("/v1/documents/{user_id}", "GET", "200")] >= 2
+    assert durations[("/v1/embed-upsert", "POST", "200")] >= 1
+    assert ("unmatched", "GET", "404") in durations
+    assert any(labels["le"] == "+Inf" for labels, _ in samples["neuramind_request_duration_seconds_bucket"])
+
+    # Contatore con etichetta route: template, mai il percorso con l'id dell'utente
+    chunks = {labels["route"]: value for labels, value in samples["neuramind_chunks_total"]}
+    assert chunks["/v1/embed-upsert"] >= 1
+    assert "metrics_user_7" not in text
+
+    in_flight = {labels["route"]: value for labels, value in samples["neuramind_requests_in_flight"]}
+    assert in_flight["/v1/documents/{user_id}"] == 0 and in_flight["/v1/embed-upsert"] == 0
+    # Lo scrape stesso è in corso mentre le metriche vengono generate
+    assert in_flight["/metrics"] == 1
+    print(f"✅ {len(durations)} serie di durata, etichette per template, gauge delle richieste in corso")
+
+def main():
+    """Test completo locale"""
+    print("🧪 TEST LOCALE METRICHE")
+    print("=" * 40)
+
+    test_request_metrics()
+
+    print("\n🎉 Tutti i test delle metriche passati!")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Test locale dei namespace per utente
+Instradamento di letture e scritture per modalità, migrazione riprendibile con verifica
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import asyncio
+import tempfile
+
+from app.core.config import settings
+from app.services import providers
+from app.services.document_service import DocumentService
+from app.services.namespace_migration import NamespaceMigration
+from app.services.pinecone_client import user_namespace, user_read_scope, user_write_namespaces
+from app.services.rag import semantic_search, upsert_chunks
+
+def test_scopes():
+    """Test namespace e filtri per modalità"""
+    print("🔍 Test instradamento per modalità...")
+
+    assert user_namespace("mario_rossi") == "user-mario_rossi"
+    assert user_namespace("mario rossi/ø").startswith("user-h-")
+    try:
+        for mode, read, write in (
+            ("shared", ("", {"user_id": "u1"}), [""]),
+            ("dual", ("", {"user_id": "u1"}), ["", "user-u1"]),
+            ("per_user", ("user-u1", None), ["user-u1"]),
+        ):
+            settings.vector_namespace_mode = mode
+            assert user_read_scope("u1") == read
+            assert user_write_namespaces("u1") == write
+
+        settings.vector_namespace_mode = "sharded"
+        try:
+            user_read_scope("u1")
+            raise AssertionError("Modalità non valida accettata")
+        except ValueError:
+            pass
+    finally:
+        settings.vector_namespace_mode = "shared"
+    print("✅ Letture e scritture instradate correttamente")
+
+def test_resumable_migration():
+    """Test migrazione interrotta e ripresa dal token, verifica conteggi e letture per utente"""
+    print("\n🔍 Test migrazione riprendibile...")
+
+    settings.llm_provider = "standin"
+    settings.vector_provider = "memory"
+    providers._openai_service = None
+    providers._pinecone_service = None
+    state_path = os.path.join(tempfile.mkdtemp(), "migration.json")
+
+    async def run():
+        service = providers.get_pinecone_service()
+        for user_id, item_id, text in (("u1", "a", "esame di database"), ("u1", "b", "voto di reti"),
+                                       ("u2", "c", "esame di database")):
+            await upsert_chunks(user_id, item_id, item_id, [text, text + " seconda parte"])
+        await service.upsert_vectors([{"id": "orphan", "values": [1.0] * settings.embedding_dimension, "metadata": {}}])
+
+        # Interruzione alla terza pagina
+        fetch_records = service.fetch_records
+        calls = 0
+
+        async def failing_fetch(ids, namespace=""):
+            nonlocal calls
+            calls += 1
+            if calls == 3:
+                raise RuntimeError("connessione persa")
+            return await fetch_records(ids, namespace=namespace)
+
+        service.fetch_records = failing_fetch
+        try:
+            await NamespaceMigration(service, state_path, page_size=2).run(verify_attempts=1)
+            raise AssertionError("Interruzione non propagata")
+        except RuntimeError:
+            pass
+        service.fetch_records = fetch_records
+
+        resumed = NamespaceMigration(service, state_path, page_size=2)
+        assert resumed.state["pages_done"] == 2 and resumed.state["last_id"] == "b_0001"
+        # Id già copiati eliminati dal sorgente (scritture dual): le pagine non devono spostarsi
+        await service.delete_vectors(["a_0000", "a_0001"])
+        report = await resumed.run(verify_attempts=1)
+
+        settings.vector_namespace_mode = "per_user"
+        matches = await semantic_search("u1", "esame di database", top_k=10)
+        documents = await DocumentService().get_user_documents("u2")
+        return report, matches, documents
+
+    try:
+        report, matches, documents = asyncio.run(run())
+    finally:
+        settings.vector_namespace_mode = "shared"
+        settings.llm_provider = "openai"
+        settings.vector_provider = "pinecone"
+        providers._openai_service = None
+        providers._pinecone_service = None
+
+    assert report["verified"], report
+    assert report["copied"] == 6 and report["orphans"] == 1 and report["namespaces"] == 2
+    assert {m["metadata"]["user_id"] for m in matches} == {"u1"} and len(matches) == 4
+    assert [d["item_id"] for d in documents] == ["c"]
+    print(f"✅ {report['copied']} vettori in {report['namespaces']} namespace dopo la ripresa, "
+          f"{report['orphans']} senza user_id")
+
+def main():
+    """Test completo locale"""
+    print("🧪 TEST LOCALE NAMESPACE PER UTENTE")
+    print("=" * 40)
+
+    test_scopes()
+    test_resumable_migration()
+
+    print("\n🎉 Tutti i test dei namespace passati!")
+
+if __name__ == "__main__":
+    main()
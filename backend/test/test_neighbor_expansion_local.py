@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Test locale dell'espansione ai chunk vicini
+Vicini ±window per id ({item_id}_NNNN) con un solo fetch, bordi del documento,
+risultati originali non modificati ed endpoint /v1/query e /v1/query/batch
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import asyncio
+
+import httpx
+
+from app.core.config import settings
+from app.services import providers
+from app.services.rag import expand_neighbors, semantic_search, semantic_search_batch, upsert_chunks
+from conftest import uses_standins
+
+SECTIONS = ["introduzione storica", "teorema di pitagora", "dimostrazione geometrica",
+            "esercizi svolti", "applicazioni in fisica", "bibliografia essenziale"]
+
+async def index_sections(user_id):
+    await upsert_chunks(user_id, "geometria", "Geometria", [f"Capitolo: {section}" for section in SECTIONS])
+    await upsert_chunks(user_id, "altro", "Altro", ["Ricetta della pasta al forno"])
+
+def count_fetches():
+    service = providers.get_pinecone_service()
+    calls = []
+    fetch = service.fetch_vectors
+
+    async def counting(ids, namespace=""):
+        calls.append(list(ids))
+        return await fetch(ids, namespace=namespace)
+
+    service.fetch_vectors = counting
+    return calls
+
+@uses_standins
+def test_window_expansion():
+    """Test vicini nell'ordine dei chunk, bordi del documento e un solo fetch"""
+    print("🔍 Test espansione ±window...")
+
+
+    async def run():
+        await index_sections("nb1")
+        calls = count_fetches()
+        middle = await semantic_search("nb1", "esercizi svolti", top_k=1, window=2)
+        edge = await semantic_search("nb1", "introduzione storica", top_k=1, window=1)
+        batch = await semantic_search_batch("nb1", ["applicazioni in fisica", "teorema di pitagora"],
+                                            top_k=1, window=1)
+        plain = await semantic_search("nb1", "esercizi svolti", top_k=1)
+        return calls, middle, edge, batch, plain
+
+    calls, middle, edge, batch, plain = asyncio.run(run())
+    neighbors = lambda match: [n["id"] for n in match["neighbors"]]
+    assert middle[0]["id"] == "geometria_0003"
+    assert neighbors(middle[0]) == ["geometria_0001", "geometria_0002", "geometria_0004", "geometria_0005"]
+    assert middle[0]["neighbors"][1]["metadata"]["text"] == "Capitolo: dimostrazione geometrica"
+    assert edge[0]["id"] == "geometria_0000" and neighbors(edge[0]) == ["geometria_0001"]
+    assert [neighbors(r[0]) for r in batch] == [["geometria_0003", "geometria_0005"],
+                                                ["geometria_0000", "geometria_0002"]]
+    assert "neighbors" not in plain[0]
+    # Un fetch per ricerca, anche per il batch con più risultati
+    assert len(calls) == 3 and sorted(calls[2]) == calls[2] and len(calls[2]) == 4
+    print(f"✅ Vicini corretti con {len(calls)} fetch per 3 ricerche")
+
+@uses_standins
+def test_results_not_modified():
+    """Test risultati originali (condivisi dal single-flight) non modificati"""
+    print("\n🔍 Test risultati originali intatti...")
+
+
+    async def run():
+        await index_sections("nb2")
+        matches = await semantic_search("nb2", "dimostrazione geometrica", top_k=1)
+        expanded = await expand_neighbors("nb2", [matches], 1)
+        other_user = await expand_neighbors("nb3", [matches], 1)
+        return matches, expanded[0], other_user[0]
+
+    matches, expanded, other_user = asyncio.run(run())
+    assert all("neighbors" not in match for match in matches)
+    assert all(match["neighbors"] for match in expanded)
+    # Un altro utente non legge i chunk di nb2
+    assert all(match["neighbors"] == [] for match in other_user)
+    print("✅ Copie con neighbors, originali invariati")
+
+@uses_standins
+def test_endpoints():
+    """Test window negli endpoint e validazione"""
+    print("\n🔍 Test endpoint con window...")
+
+    from app.main import app
+
+    async def run():
+        await index_sections("nb4")
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://t") as client:
+            headers = {"X-API-Key": settings.dev_api_key}
+            single = await client.post("/v1/query", headers=headers, json={
+                "user_id": "nb4", "query": "esercizi svolti", "top_k": 1, "window": 1,
+            })
+            plain = await client.post("/v1/query", headers=headers, json={
+                "user_id": "nb4", "query": "esercizi svolti", "top_k": 1,
+            })
+            batch = await client.post("/v1/query/batch", headers=headers, json={
+                "user_id": "nb4", "queries": ["bibliografia essenziale"], "top_k": 1, "window": 1,
+            })
+            invalid = await client.post("/v1/query", headers=headers, json={
+                "user_id": "nb4", "query": "x", "window": 10,
+            })
+            return single, plain, batch, invalid
+
+    single, plain, batch, invalid = asyncio.run(run())
+    assert single.status_code == 200, single.text
+    match = single.json()["matches"][0]
+    assert [n["id"] for n in match["neighbors"]] == ["geometria_0002", "geometria_0004"]
+    assert match["neighbors"][0]["metadata"]["chunk_index"] == 2
+    assert "neighbors" not in plain.json()["matches"][0]
+    assert [n["id"] for n in batch.json()["results"][0]["matches"][0]["neighbors"]] == ["geometria_0004"]
+    assert invalid.status_code == 422
+    print("✅ neighbors presenti solo con window > 0")
+
+@uses_standins
+def test_answer_includes_neighbors():
+    """Test /v1/answer: chunk vicini nel contesto del prompt, in ordine e senza duplicati"""
+    print("\n🔍 Test vicini nel contesto della risposta...")
+
+    from app.main import app
+
+    async def run():
+        await index_sections("nb5")
+        service = providers.get_openai_service()
+        prompts = []
+        generate = service.generate_answer
+
+        async def capturing(query, context):
+            prompts.append(context)
+            return await generate(query, context)
+
+        service.generate_answer = capturing
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://t") as client:
+            headers = {"X-API-Key": settings.dev_api_key}
+            query = await client.post("/v1/query", headers=headers, json={
+                "user_id": "nb5", "query": "esercizi svolti", "top_k": 1, "window": 1,
+            })
+            matches = query.json()["matches"]
+            # Il vicino successivo compare anche come secondo risultato: incluso una sola volta
+            second = dict(matches[0]["neighbors"][1], neighbors=[])
+            answer = await client.post("/v1/answer", headers=headers, json={
+                "query": "esercizi svolti", "contexts": matches + [second],
+            })
+        return answer, prompts
+
+    answer, prompts = asyncio.run(run())
+    assert answer.status_code == 200, answer.text
+    assert len(prompts) == 1
+    expected = ["dimostrazione geometrica", "esercizi svolti", "applicazioni in fisica"]
+    positions = [prompts[0].index(f"Capitolo: {section}") for section in expected]
+    assert positions == sorted(positions)
+    assert prompts[0].count("Capitolo: applicazioni in fisica") == 1
+    assert prompts[0].startswith("Documento 'Geometria':")
+    print("✅ Risultato e vicini nel prompt, in ordine di chunk")
+
+def main():
+    """Test completo locale"""
+    print("🧪 TEST LOCALE ESPANSIONE AI CHUNK VICINI")
+    print("=" * 40)
+
+    test_window_expansion()
+    test_results_not_modified()
+    test_endpoints()
+    test_answer_includes_neighbors()
+
+    print("\n🎉 Tutti i test dell'espansione ai chunk vicini passati!")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Test locale del profiling su richiesta
+Profilo scritto solo con chiave admin, in formato folded o cProfile
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import asyncio
+import json
+import pstats
+import tempfile
+import time
+
+from app.core.config import settings
+from app.core.profiling import ProfilingMiddleware
+
+def busy_work():
+    """Lavoro CPU da ritrovare nel profilo"""
+    deadline = time.perf_counter() + 0.05
+    total = 0
+    while time.perf_counter() < deadline:
+        total += sum(range(100))
+    return total
+
+async def app(scope, receive, send):
+    busy_work()
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+def call(headers, query_string=b""):
+    """Esegue una richiesta sul middleware e restituisce gli header della risposta"""
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http", "method": "GET", "path": "/v1/query",
+        "headers": [(k.encode(), v.encode()) for k, v in headers.items()],
+        "query_string": query_string,
+    }
+    asyncio.run(ProfilingMiddleware(app)(scope, None, send))
+    return dict(messages[0]["headers"])
+
+def test_requires_admin_key():
+    """Test flag ignorato senza chiave admin valida"""
+    print("🔍 Test autorizzazione...")
+
+    settings.profile_dir = tempfile.mkdtemp()
+    settings.admin_api_key = "admin-secret"
+
+    assert b"x-profile-id" not in call({})
+    assert b"x-profile-id" not in call({"x-profile": "sample", "x-admin-key": "sbagliata"})
+    # Chiave non ASCII: confronto tra byte, nessuna eccezione
+    assert b"x-profile-id" not in call({"x-profile": "sample", "x-admin-key": "chiave-è"})
+    assert os.listdir(settings.profile_dir) == []
+    print("✅ Nessun profilo senza chiave admin")
+
+def test_sampling_profile():
+    """Test profilo folded con request id"""
+    print("\n🔍 Test profilo a campionamento...")
+
+    settings.profile_dir = tempfile.mkdtemp()
+    headers = call({"x-profile": "sample", "x-admin-key": "admin-secret", "x-request-id": "req-42"})
+    assert headers[b"x-profile-id"] == b"req-42"
+
+    with open(os.path.join(settings.profile_dir, "req-42.folded"), encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    assert lines and all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+    assert any("busy_work" in line for line in lines)
+    assert headers[b"x-profile-scope"] == b"process"
+    with open(os.path.join(settings.profile_dir, "req-42.json"), encoding="utf-8") as f:
+        info = json.load(f)
+    assert info["concurrent_requests"] == 0 and not info["contaminated"]
+    print(f"✅ {len(lines)} stack nel profilo folded")
+
+def test_concurrent_requests_mark_profile():
+    """Test profilo marcato come contaminato se altre richieste sono in corso nella finestra"""
+    print("\n🔍 Test profilo con richieste concorrenti...")
+
+    settings.profile_dir = tempfile.mkdtemp()
+
+    async def slow_app(scope, receive, send):
+        await asyncio.sleep(0.05)
+        await app(scope, receive, send)
+
+    middleware = ProfilingMiddleware(slow_app)
+
+    async def request(headers):
+        async def send(message):
+            pass
+        scope = {
+            "type": "http", "method": "GET", "path": "/v1/query", "query_string": b"",
+            "headers": [(k.encode(), v.encode()) for k, v in headers.items()],
+        }
+        await middleware(scope, None, send)
+
+    async def run():
+        profiled = asyncio.ensure_future(request({"x-profile": "sample", "x-admin-key": "admin-secret",
+                                                  "x-request-id": "req-mix"}))
+        await asyncio.sleep(0.01)
+        await asyncio.gather(request({}), request({}))
+        await profiled
+
+    asyncio.run(run())
+    with open(os.path.join(settings.profile_dir, "req-mix.json"), encoding="utf-8") as f:
+        info = json.load(f)
+    assert info["contaminated"] and info["concurrent_requests"] == 2, info
+    assert middleware._in_flight == 0
+    print(f"✅ Profilo marcato: {info['concurrent_requests']} richieste concorrenti")
+
+def test_cprofile_via_query():
+    """Test profilo deterministico richiesto via query string"""
+    print("\n🔍 Test cProfile...")
+
+    settings.profile_dir = tempfile.mkdtemp()
+    headers = call({"x-admin-key": "admin-secret"}, query_string=b"top_k=5&profile=cprofile")
+    profile_id = headers[b"x-profile-id"].decode()
+
+    stats = pstats.Stats(os.path.join(settings.profile_dir, f"{profile_id}.prof"))
+    assert any(func[2] == "busy_work" for func in stats.stats)
+    settings.admin_api_key = None
+    print(f"✅ Profilo {profile_id}.prof con {len(stats.stats)} funzioni")
+
+def main():
+    """Test completo locale"""
+    print("🧪 TEST LOCALE PROFILING")
+    print("=" * 40)
+
+    test_requires_admin_key()
+    test_sampling_profile()
+    test_concurrent_requests_mark_profile()
+    test_cprofile_via_query()
+
+    print("\n🎉 Tutti i test di profiling passati!")
+
+if __name__ == "__main__":
+    main()
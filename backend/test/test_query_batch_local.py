@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Test locale delle query in batch
+Un embedding per tutte le query, stessi risultati delle query singole,
+query ripetute, filtri e endpoint /v1/query/batch
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import asyncio
+import time
+
+import httpx
+
+from app.core.config import settings
+from app.services import providers
+from app.services.rag import semantic_search, semantic_search_batch, upsert_chunks
+from app.services.pinecone_client import vector_query_caller
+from app.services.resilience import CircuitOpenError
+from app.services.standins import FaultInjector, InMemoryIndex, hash_embedding
+from conftest import uses_standins
+
+TOPICS = ["derivate e integrali", "fotosintesi clorofilliana", "rivoluzione francese", "legge di ohm"]
+
+async def index_topics(user_id):
+    for i, topic in enumerate(TOPICS):
+        chunks = [f"Appunti su {topic}, parte {part}" for part in range(3)]
+        await upsert_chunks(user_id, f"doc_{i}", f"Appunti {i}", chunks)
+
+@uses_standins
+def test_batch_matches_single_queries():
+    """Test risultati uguali alle query singole con una sola chiamata di embedding"""
+    print("🔍 Test batch contro query singole...")
+
+    queries = ["integrali", "clorofilla e fotosintesi", "integrali", "ohm resistenza"]
+
+    async def run():
+        await index_topics("qb1")
+        service = providers.get_embedding_service()
+        calls = []
+        create = service.create_embeddings
+
+        async def counting(texts, priority=None):
+            calls.append(list(texts))
+            return await create(texts, priority=priority)
+
+        service.create_embeddings = counting
+        batch = await semantic_search_batch("qb1", queries, top_k=3)
+        single = [await semantic_search("qb1", query, top_k=3) for query in queries]
+        return calls, batch, single
+
+    calls, batch, single = asyncio.run(run())
+    assert len(calls) == 1 and calls[0] == ["integrali", "clorofilla e fotosintesi", "ohm resistenza"]
+    assert len(batch) == len(queries) and batch[0] == batch[2]
+    for got, expected in zip(batch, single):
+        assert [m["id"] for m in got] == [m["id"] for m in expected]
+        assert all(abs(a["score"] - b["score"]) < 1e-5 for a, b in zip(got, expected))
+    assert batch[1][0]["metadata"]["item_id"] == "doc_1"
+    print(f"✅ {len(queries)} query, 1 chiamata di embedding con {len(calls[0])} testi")
+
+def test_index_batch_filters_and_quantized():
+    """Test query_batch dell'indice: filtri, namespace vuoto, float32 e int8 concordi"""
+    print("\n🔍 Test query_batch dell'indice...")
+
+    vectors = [[float((i * 7 + j) % 11) - 5 for j in range(16)] for i in range(40)]
+    queries = [vectors[3], vectors[17], [1.0] * 16]
+
+    async def run(storage):
+        index = InMemoryIndex(16, FaultInjector("test"), storage=storage)
+        await index.upsert([
+            {"id": f"v{i:02d}", "values": v, "metadata": {"group": "a" if i % 2 else "b"}}
+            for i, v in enumerate(vectors)
+        ], namespace="ns")
+        filtered = await index.query_batch(queries, top_k=5, filter={"group": "a"}, namespace="ns")
+        empty = await index.query_batch(queries, top_k=5, namespace="altro")
+        single = [await index.query(q, top_k=5, filter={"group": "a"}, namespace="ns") for q in queries]
+        await index.close()
+        return filtered, empty, single
+
+    for storage in ("float32", "int8"):
+        filtered, empty, single = asyncio.run(run(storage))
+        assert [[m.id for m in r.matches] for r in filtered] == [[m.id for m in r.matches] for r in single]
+        assert all(int(m.id[1:]) % 2 == 1 for r in filtered for m in r.matches)
+        assert all(len(r.matches) == 5 for r in filtered) and all(r.matches == [] for r in empty)
+    print("✅ Stessi risultati delle query singole (float32 e int8)")
+
+@uses_standins
+def test_batch_uses_breaker_and_single_flight():
+    """Test query_vectors_batch dello stand-in attraverso single-flight e circuit breaker"""
+    print("\n🔍 Test batch con single-flight e circuit breaker...")
+
+    breaker = vector_query_caller.breaker
+
+    async def run():
+        await index_topics("qb3")
+        service = providers.get_pinecone_service()
+        calls = []
+        query_batch = service._index.query_batch
+
+        async def counting(*args, **kwargs):
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return await query_batch(*args, **kwargs)
+
+        service._index.query_batch = counting
+        vectors = [hash_embedding(topic, settings.embedding_dimension) for topic in TOPICS[:2]]
+        first, second = await asyncio.gather(*[service.query_vectors_batch(vectors, top_k=2) for _ in range(2)])
+
+        breaker.state, breaker._opened_at = breaker.OPEN, time.monotonic()
+        try:
+            await service.query_vectors_batch(vectors, top_k=2)
+            rejected = False
+        except CircuitOpenError:
+            rejected = True
+        return calls, first, second, rejected
+
+    try:
+        calls, first, second, rejected = asyncio.run(run())
+    finally:
+        breaker.record_success()
+    assert len(calls) == 1 and first == second and len(first) == 2
+    assert rejected
+    print("✅ Batch identici coalescenti, rifiutato a circuito aperto")
+
+@uses_standins
+def test_batch_endpoint():
+    """Test endpoint /v1/query/batch"""
+    print("\n🔍 Test endpoint /v1/query/batch...")
+
+    from app.main import app
+
+    async def run():
+        await index_topics("qb2")
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://t") as client:
+            headers = {"X-API-Key": settings.dev_api_key}
+            ok = await client.post("/v1/query/batch", headers=headers, json={
+                "user_id": "qb2", "queries": ["rivoluzione", "legge di ohm"], "top_k": 2,
+            })
+            empty = await client.post("/v1/query/batch", headers=headers, json={"user_id": "qb2", "queries": []})
+            return ok, empty
+
+    ok, empty = asyncio.run(run())
+    assert ok.status_code == 200, ok.text
+    results = ok.json()["results"]
+    assert [len(r["matches"]) for r in results] == [2, 2]
+    assert results[0]["matches"][0]["metadata"]["item_id"] == "doc_2"
+    assert results[1]["matches"][0]["metadata"]["item_id"] == "doc_3"
+    assert empty.status_code == 422
+    print("✅ Risultati per query nello stesso ordine")
+
+def main():
+    """Test completo locale"""
+    print("🧪 TEST LOCALE QUERY IN BATCH")
+    print("=" * 40)
+
+    test_batch_matches_single_queries()
+    test_index_batch_filters_and_quantized()
+    test_batch_uses_breaker_and_single_flight()
+    test_batch_endpoint()
+
+    print("\n🎉 Tutti i test delle query in batch passati!")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Test locale dei filtri sui metadati nella ricerca
+Filtro Pinecone da item_id, file_type, intervallo di date e confidenza OCR,
+prefiltro dell'indice locale (float32 e int8) ed endpoint /v1/query
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import asyncio
+from datetime import datetime
+
+import httpx
+
+from app.core.config import settings
+from app.services.document_service import document_service
+from app.services.rag import chunk_vectors, metadata_filter, semantic_search, upsert_user_vectors
+from app.services.standins import FaultInjector, InMemoryIndex, hash_embedding
+from conftest import uses_standins
+
+DOCUMENTS = [
+    # item_id, file_type, ocr_confidence, data di caricamento
+    ("doc_a", "text", 1.0, "2026-01-10T09:00:00"),
+    ("doc_b", "image_with_ocr", 0.9, "2026-03-05T12:00:00"),
+    ("doc_c", "image_with_ocr", 0.4, "2026-03-20T18:30:00"),
+    ("doc_d", "text", 1.0, "2026-06-01T08:00:00"),
+]
+
+async def index_documents(user_id):
+    for item_id, file_type, confidence, uploaded in DOCUMENTS:
+        chunks = [f"Appunti di chimica organica {item_id} parte {part}" for part in range(3)]
+        embeddings = [hash_embedding(chunk, settings.embedding_dimension) for chunk in chunks]
+        vectors = chunk_vectors(user_id, item_id, item_id.upper(), chunks, embeddings,
+                                {"file_type": file_type, "ocr_confidence": confidence}, timestamp=uploaded)
+        await upsert_user_vectors(user_id, vectors)
+
+def test_metadata_filter():
+    """Test traduzione dei filtri in sintassi Pinecone"""
+    print("🔍 Test metadata_filter...")
+
+    assert metadata_filter() is None
+    after, before = datetime(2026, 3, 1), datetime(2026, 3, 31)
+    assert metadata_filter(item_id="doc_b", file_type="text", uploaded_after=after, uploaded_before=before,
+                           min_ocr_confidence=0.8) == {
+        "item_id": {"$eq": "doc_b"},
+        "file_type": {"$eq": "text"},
+        "upload_ts": {"$gte": int(after.timestamp()), "$lte": int(before.timestamp())},
+        "ocr_confidence": {"$gte": 0.8},
+    }
+    vector = chunk_vectors("u", "doc", "T", ["x"], [[0.0]], timestamp="2026-03-05T12:00:00")[0]
+    assert vector["metadata"]["upload_ts"] == int(datetime(2026, 3, 5, 12).timestamp())
+    print("✅ Filtro con operatori $eq, $gte e $lte")
+
+@uses_standins
+def test_filtered_search():
+    """Test ricerca filtrata: solo i chunk ammessi, documenti in eliminazione esclusi"""
+    print("\n🔍 Test ricerca filtrata...")
+
+    query = "chimica organica"
+
+    async def run():
+        await index_documents("qf1")
+        items = lambda matches: sorted({m["metadata"]["item_id"] for m in matches})
+        single = await semantic_search("qf1", query, top_k=10, filters=metadata_filter(item_id="doc_c"))
+        images = await semantic_search("qf1", query, top_k=10, filters=metadata_filter(file_type="image_with_ocr"))
+        march = await semantic_search("qf1", query, top_k=10, filters=metadata_filter(
+            uploaded_after=datetime(2026, 3, 1), uploaded_before=datetime(2026, 3, 31)))
+        confident = await semantic_search("qf1", query, top_k=10, filters=metadata_filter(min_ocr_confidence=0.8))
+        document_service.tombstones.setdefault("qf1", {})["doc_c"] = 3
+        try:
+            deleted = await semantic_search("qf1", query, top_k=10, filters=metadata_filter(item_id="doc_c"))
+            without = await semantic_search("qf1", query, top_k=10, filters=metadata_filter(file_type="image_with_ocr"))
+        finally:
+            document_service.tombstones.pop("qf1", None)
+        return (items(single), len(single), items(images), items(march), items(confident),
+                deleted, items(without))
+
+    single, count, images, march, confident, deleted, without = asyncio.run(run())
+    assert single == ["doc_c"] and count == 3
+    assert images == ["doc_b", "doc_c"] and march == ["doc_b", "doc_c"]
+    assert confident == ["doc_a", "doc_b", "doc_d"]
+    assert deleted == [] and without == ["doc_b"]
+    print("✅ item_id, file_type, date e confidenza applicati prima dei punteggi")
+
+def test_local_prefilter():
+    """Test prefiltro dell'indice locale: solo le righe ammesse vengono valutate"""
+    print("\n🔍 Test prefiltro dell'indice locale...")
+
+    vectors = [[float((i * 13 + j * 7) % 17) - 8 for j in range(16)] for i in range(300)]
+
+    async def run(storage):
+        index = InMemoryIndex(16, FaultInjector("test"), storage=storage, rescore_factor=2)
+        await index.upsert([
+            {"id": f"v{i:03d}", "values": v, "metadata": {"group": i % 10}} for i, v in enumerate(vectors)
+        ], namespace="ns")
+        if storage == "int8":
+            store = index._stores["ns"]
+            scanned = []
+            approximate = store.approximate_scores
+
+            def counting(query, rows=None):
+                scanned.append(len(store.ids) if rows is None else len(rows))
+                return approximate(query, rows)
+
+            store.approximate_scores = counting
+        else:
+            scanned = None
+        response = await index.query(vectors[42], top_k=5, filter={"group": 2}, namespace="ns")
+        await index.close()
+        return [m.id for m in response.matches], scanned
+
+    exact, _ = asyncio.run(run("float32"))
+    quantized, scanned = asyncio.run(run("int8"))
+    assert exact[0] == "v042" and len(exact) == 5 and all(int(i[1:]) % 10 == 2 for i in exact)
+    assert quantized == exact
+    assert scanned == [30], scanned
+    print("✅ Stessi risultati; con int8 la scansione approssimata tocca 30 righe su 300")
+
+@uses_standins
+def test_query_endpoint_filters():
+    """Test endpoint /v1/query con filtri e validazione"""
+    print("\n🔍 Test endpoint /v1/query con filtri...")
+
+    from app.main import app
+
+    async def run():
+        await index_documents("qf2")
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://t") as client:
+            headers = {"X-API-Key": settings.dev_api_key}
+            ok = await client.post("/v1/query", headers=headers, json={
+                "user_id": "qf2", "query": "chimica", "top_k": 10,
+                "uploaded_after": "2026-05-01T00:00:00", "min_ocr_confidence": 0.5,
+            })
+            invalid = await client.post("/v1/query", headers=headers, json={
+                "user_id": "qf2", "query": "chimica", "min_ocr_confidence": 2,
+            })
+            return ok, invalid
+
+    ok, invalid = asyncio.run(run())
+    assert ok.status_code == 200, ok.text
+    matches = ok.json()["matches"]
+    assert len(matches) == 3 and {m["metadata"]["item_id"] for m in matches} == {"doc_d"}
+    assert invalid.status_code == 422
+    print("✅ Solo doc_d (dopo maggio, confidenza ≥ 0.5)")
+
+def main():
+    """Test completo locale"""
+    print("🧪 TEST LOCALE FILTRI DI RICERCA")
+    print("=" * 40)
+
+    test_metadata_filter()
+    test_filtered_search()
+    test_local_prefilter()
+    test_query_endpoint_filters()
+
+    print("\n🎉 Tutti i test dei filtri di ricerca passati!")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Test locale dello scheduler rate-limit
+Header x-ratelimit-*, retry con backoff e priorità interattiva
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import asyncio
+import time
+
+from app.services.rate_limiter import (
+    RateLimitScheduler, parse_reset_duration, PRIORITY_BATCH, PRIORITY_INTERACTIVE
+)
+
+class FakeRateLimitError(Exception):
+    """Errore 429 con header, come quelli dell'SDK OpenAI"""
+    status_code = 429
+
+    def __init__(self, headers):
+        super().__init__("rate limited")
+        self.response = type("Response", (), {"headers": headers})()
+
+def test_parse_reset_duration():
+    """Test parsing durate degli header"""
+    print("🔍 Test parsing durate...")
+
+    assert parse_reset_duration("20ms") == 0.02
+    assert parse_reset_duration("1s") == 1.0
+    assert parse_reset_duration("6m0s") == 360.0
+    assert parse_reset_duration("1.5") == 1.5
+    assert parse_reset_duration(None) is None
+    print("✅ Durate interpretate correttamente")
+
+def test_headers_update_buckets():
+    """Test sincronizzazione con gli header"""
+    print("\n🔍 Test sincronizzazione header...")
+
+    scheduler = RateLimitScheduler(default_rpm=100, default_tpm=1000)
+    scheduler.update_from_headers("model", {
+        "x-ratelimit-limit-requests": "500",
+        "x-ratelimit-remaining-requests": "3",
+        "x-ratelimit-limit-tokens": "20000",
+        "x-ratelimit-remaining-tokens": "10",
+    })
+    stats = scheduler.stats()["models"]["model"]
+    assert stats["rpm_limit"] == 500
+    assert stats["requests_available"] == 3
+    assert stats["tpm_limit"] == 20000
+    assert stats["tokens_available"] == 10
+    print(f"✅ Bucket allineati: {stats}")
+
+def test_retry_with_backoff():
+    """Test retry su 429 con retry-after"""
+    print("\n🔍 Test retry su 429...")
+
+    scheduler = RateLimitScheduler(default_rpm=1000, default_tpm=100000, backoff_base=0.01, backoff_max=0.05)
+    attempts = []
+
+    async def flaky():
+        attempts.append(time.monotonic())
+        if len(attempts) < 3:
+            raise FakeRateLimitError({"retry-after-ms": "50"})
+        return "ok"
+
+    assert asyncio.run(scheduler.call("model", 10, flaky)) == "ok"
+    assert len(attempts) == 3
+    assert attempts[1] - attempts[0] >= 0.05
+    assert scheduler.stats()["throttled"] == 2
+    print(f"✅ Riuscito dopo {len(attempts)} tentativi")
+
+def test_interactive_priority():
+    """Test priorità delle richieste interattive sull'ingest"""
+    print("\n🔍 Test priorità interattiva...")
+
+    # 60 RPM = 1 richiesta al secondo, bucket vuoto
+    scheduler = RateLimitScheduler(default_rpm=60, default_tpm=100000, interactive_reserve=0.0)
+    scheduler.update_from_headers("model", {"x-ratelimit-remaining-requests": "0"})
+    order = []
+
+    async def acquire(name, priority):
+        await scheduler.acquire("model", 1, priority)
+        order.append(name)
+
+    async def run():
+        batch = asyncio.ensure_future(acquire("batch", PRIORITY_BATCH))
+        await asyncio.sleep(0.1)
+        interactive = asyncio.ensure_future(acquire("interactive", PRIORITY_INTERACTIVE))
+        await asyncio.wait_for(asyncio.gather(batch, interactive), 5)
+
+    asyncio.run(run())
+
+    assert order == ["interactive", "batch"]
+    print(f"✅ Ordine di esecuzione: {order}")
+
+def main():
+    """Test completo locale"""
+    print("🧪 TEST LOCALE RATE LIMITER")
+    print("=" * 40)
+
+    test_parse_reset_duration()
+    test_headers_update_buckets()
+    test_retry_with_backoff()
+    test_interactive_priority()
+
+    print("\n🎉 Tutti i test rate limiter passati!")
+
+if __name__ == "__main__":
+    main()
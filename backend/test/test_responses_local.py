@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Test locale della codifica delle risposte
+Negoziazione Accept-Encoding, soglia di compressione, streaming, orjson e match tipizzati
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import asyncio
+import gzip
+import json
+
+import httpx
+from starlette.applications import Starlette
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+
+from app.core.responses import (
+    APIResponse, ResponseEncodingMiddleware, accepts_msgpack, brotli, choose_encoding, msgpack
+)
+from app.schemas import QueryOut
+
+def build_app():
+    async def large(request):
+        return APIResponse({"text": "voto esame " * 500})
+
+    async def small(request):
+        return APIResponse({"ok": True})
+
+    async def image(request):
+        return Response(b"\x89PNG" * 1000, media_type="image/png")
+
+    async def stream(request):
+        async def chunks():
+            for i in range(5):
+                yield f"riga {i} ".encode() * 100
+        return StreamingResponse(chunks(), media_type="text/plain")
+
+    app = Starlette(routes=[Route(f"/{f.__name__}", f) for f in (large, small, image, stream)])
+    return ResponseEncodingMiddleware(app, minimum_size=1024)
+
+def test_negotiation():
+    """Test scelta della codifica e del formato da Accept-Encoding e Accept"""
+    print("🔍 Test negoziazione...")
+
+    assert choose_encoding("gzip, deflate") == "gzip"
+    assert choose_encoding("gzip;q=0, identity") is None
+    assert choose_encoding("") is None
+    assert choose_encoding("*") == ("br" if brotli is not None else "gzip")
+    assert choose_encoding("br;q=0.5, gzip;q=0.9") == "gzip"
+    assert accepts_msgpack("application/msgpack, application/json;q=0.5")
+    assert not accepts_msgpack("application/json")
+    assert not accepts_msgpack("*/*")
+    print("✅ Codifiche e formati scelti correttamente")
+
+def test_compression():
+    """Test compressione sopra soglia, tipi esclusi e streaming"""
+    print("\n🔍 Test compressione...")
+
+    async def run():
+        transport = httpx.ASGITransport(app=build_app())
+        async with httpx.AsyncClient(transport=transport, base_url="http://t") as client:
+            headers = {"Accept-Encoding": "gzip"}
+            large = await client.get("/large", headers=headers)
+            small = await client.get("/small", headers=headers)
+            image = await client.get("/image", headers=headers)
+            stream = await client.get("/stream", headers=headers)
+            plain = await client.get("/large", headers={"Accept-Encoding": "identity"})
+        return large, small, image, stream, plain
+
+    large, small, image, stream, plain = asyncio.run(run())
+
+    assert large.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in large.headers["vary"]
+    assert int(large.headers["content-length"]) < len(plain.content) / 10
+    assert large.json() == plain.json()
+    assert "content-encoding" not in small.headers and small.json() == {"ok": True}
+    assert "content-encoding" not in image.headers
+    assert stream.headers["content-encoding"] == "gzip" and "content-length" not in stream.headers
+    assert stream.text == "".join(f"riga {i} " * 100 for i in range(5))
+    print(f"✅ {len(plain.content)} B → {large.headers['content-length']} B con gzip, piccoli e immagini invariati")
+
+def test_msgpack():
+    """Test MessagePack per i client che lo chiedono (se msgpack è installato)"""
+    print("\n🔍 Test MessagePack...")
+    if msgpack is None:
+        print("⚠️ msgpack non installato, test saltato")
+        return
+
+    async def run():
+        transport = httpx.ASGITransport(app=build_app())
+        async with httpx.AsyncClient(transport=transport, base_url="http://t") as client:
+            return await client.get("/small", headers={"Accept": "application/msgpack"})
+
+    response = asyncio.run(run())
+    assert response.headers["content-type"] == "application/msgpack"
+    assert "Accept" in response.headers["vary"]
+    assert msgpack.unpackb(response.content) == {"ok": True}
+    print(f"✅ {len(response.content)} B in MessagePack")
+
+def test_encoding_and_typed_matches():
+    """Test JSON compatto e metadati tipizzati con campi aggiuntivi mantenuti"""
+    print("\n🔍 Test serializzazione...")
+
+    out = QueryOut(matches=[{
+        "id": "doc_0000", "score": 0.5,
+        "metadata": {"item_id": "doc", "chunk_index": 3.0, "text": "è", "custom": [1, 2]},
+    }])
+    content = out.model_dump(mode="json", exclude_unset=True)
+    body = APIResponse(content).body
+
+    assert json.loads(body) == content
+    assert content["matches"][0]["metadata"] == {"item_id": "doc", "chunk_index": 3, "text": "è", "custom": [1, 2]}
+    assert "è".encode() in body and b" " not in body
+    assert gzip.decompress(gzip.compress(body)) == body
+    print(f"✅ {len(body)} B, metadati aggiuntivi mantenuti")
+
+def main():
+    """Test completo locale"""
+    print("🧪 TEST LOCALE CODIFICA RISPOSTE")
+    print("=" * 40)
+
+    test_negotiation()
+    test_compression()
+    test_msgpack()
+    test_encoding_and_typed_matches()
+
+    print("\n🎉 Tutti i test di codifica passati!")
+
+if __name__ == "__main__":
+    main()
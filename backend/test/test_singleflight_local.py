@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Test locale del single-flight
+Chiamate identiche concorrenti devono condividere una sola esecuzione
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import asyncio
+
+from app.services.singleflight import SingleFlight
+
+def test_concurrent_calls_coalesced():
+    """Test chiamate identiche concorrenti"""
+    print("🔍 Test chiamate concorrenti identiche...")
+
+    flight = SingleFlight("test", backend="test")
+    executions = []
+
+    async def slow_call(value):
+        executions.append(value)
+        await asyncio.sleep(0.1)
+        return value * 2
+
+    async def run():
+        return await asyncio.gather(*[flight.do("same-key", slow_call, 21) for _ in range(5)])
+
+    results = asyncio.run(run())
+
+    assert results == [42] * 5
+    assert len(executions) == 1
+    stats = flight.stats()
+    assert stats["calls"] == 5
+    assert stats["coalesced"] == 4
+    assert stats["in_flight"] == 0
+    print(f"✅ Una sola esecuzione, stats: {stats}")
+
+def test_errors_shared_and_not_cached():
+    """Test propagazione errori senza caching del fallimento"""
+    print("\n🔍 Test propagazione errori...")
+
+    flight = SingleFlight("test", backend="test")
+
+    async def failing_call():
+        raise RuntimeError("provider down")
+
+    async def ok_call():
+        return "ok"
+
+    async def run():
+        try:
+            await flight.do("k", failing_call)
+            assert False, "eccezione attesa"
+        except RuntimeError:
+            pass
+
+        # La chiave non resta in volo: la chiamata successiva riesegue
+        assert await flight.do("k", ok_call) == "ok"
+
+    asyncio.run(run())
+    print("✅ Errore propagato e chiave rilasciata")
+
+def test_cancelled_caller_does_not_cancel_others():
+    """Test cancellazione di un solo chiamante"""
+    print("\n🔍 Test cancellazione chiamante...")
+
+    flight = SingleFlight("test", backend="test")
+
+    async def slow_call():
+        await asyncio.sleep(0.1)
+        return "done"
+
+    async def run():
+        first = asyncio.ensure_future(flight.do("k", slow_call))
+        second = asyncio.ensure_future(flight.do("k", slow_call))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(run()) == "done"
+    print("✅ Gli altri chiamanti ricevono comunque il risultato")
+
+def main():
+    """Test completo locale"""
+    print("🧪 TEST LOCALE SINGLE-FLIGHT")
+    print("=" * 40)
+
+    test_concurrent_calls_coalesced()
+    test_errors_shared_and_not_cached()
+    test_cancelled_caller_does_not_cancel_others()
+
+    print("\n🎉 Tutti i test single-flight passati!")
+
+if __name__ == "__main__":
+    main()
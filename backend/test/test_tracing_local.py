@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Test locale del tracing
+Propagazione del contesto tra task async, thread e process pool
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import asyncio
+import json
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from app.core import tracing
+from app.core.config import settings
+
+def child_work(value):
+    """Eseguita nel processo figlio, dentro uno span figlio"""
+    with tracing.span("child.work"):
+        return value * 2
+
+def load_trace(directory, trace_id):
+    with open(os.path.join(directory, f"{trace_id}.jsonl"), encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+def test_context_propagation():
+    """Test span figli da task, thread e processi nella stessa trace"""
+    print("🔍 Test propagazione contesto...")
+
+    directory = tempfile.mkdtemp()
+    settings.tracing_enabled = True
+    tracing._exporter = tracing.JsonFileExporter(directory)
+
+    async def pipeline():
+        with tracing.span("root") as root:
+            async def task_step():
+                with tracing.span("task.step"):
+                    await asyncio.sleep(0)
+            await asyncio.gather(task_step(), task_step())
+
+            with ThreadPoolExecutor(max_workers=1) as pool:
+                pool.submit(tracing.wrap_context(child_work), 1).result()
+
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                result = pool.submit(tracing.run_with_context, tracing.capture_context(), child_work, 21).result()
+            assert result == 42
+            return root.trace_id
+
+    try:
+        trace_id = asyncio.run(pipeline())
+        tracing._exporter.flush()
+        spans = load_trace(directory, trace_id)
+    finally:
+        settings.tracing_enabled = False
+
+    names = [s["name"] for s in spans]
+    root = next(s for s in spans if s["name"] == "root")
+    assert names.count("task.step") == 2
+    assert names.count("child.work") == 2
+    assert all(s["trace_id"] == trace_id for s in spans)
+    assert any(s["pid"] != root["pid"] for s in spans)
+    print(f"✅ {len(spans)} span nella stessa trace: {sorted(set(names))}")
+
+def test_executor_spans_in_request_trace():
+    """Test span dell'encode locale (thread) e dell'OCR dell'ingest (processo) nella trace della richiesta"""
+    print("\n🔍 Test span degli executor...")
+
+    from app.services.bulk_ingest import BulkIngest
+    from app.services.local_embeddings import HashEncoder, LocalEmbeddingService
+
+    directory = tempfile.mkdtemp()
+    files = tempfile.mkdtemp()
+    with open(os.path.join(files, "nota.txt"), "w", encoding="utf-8") as f:
+        f.write("Appunti di analisi matematica. " * 10)
+    saved = (settings.embedding_model, settings.embedding_dimension)
+    settings.embedding_model, settings.embedding_dimension = "hashing", 384
+    settings.tracing_enabled = True
+    tracing._exporter = tracing.JsonFileExporter(directory)
+
+    async def request():
+        service = LocalEmbeddingService(HashEncoder(384))
+        ingest = BulkIngest(files, "tr1", os.path.join(files, "stato.json"), workers=1)
+        with tracing.span("request") as root:
+            await service.create_embeddings(["limite di una funzione"])
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                extracted = await ingest._extract_window(pool, [("nota.txt", "")])
+        await service.close()
+        return root.trace_id, extracted
+
+    try:
+        trace_id, extracted = asyncio.run(request())
+        tracing._exporter.flush()
+        spans = load_trace(directory, trace_id)
+    finally:
+        settings.tracing_enabled = False
+        settings.embedding_model, settings.embedding_dimension = saved
+
+    assert not isinstance(extracted[0], Exception), extracted
+    names = {s["name"] for s in spans}
+    assert {"request", "HashEncoder.encode", "extract_file"} <= names, names
+    assert all(s["trace_id"] == trace_id for s in spans)
+    print(f"✅ Encode e OCR nella trace {trace_id[:8]}…")
+
+def test_traceparent_parsing():
+    """Test parsing header W3C traceparent"""
+    print("\n🔍 Test traceparent...")
+
+    carrier = tracing.parse_traceparent("00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01")
+    assert carrier == {"trace_id": "0af7651916cd43dd8448eb211c80319c", "span_id": "b7ad6b7169203331", "sampled": True}
+    assert tracing.parse_traceparent("garbage") is None
+    # Id non esadecimali, tutti a zero o in maiuscolo: trace nuova
+    for header in ("00-../../../../tmp/escaped-aaaa-b7ad6b7169203331-01",
+                   "00-../../../../../tmp/escaped0000-b7ad6b7169203331-01",
+                   "00-00000000000000000000000000000000-b7ad6b7169203331-01",
+                   "00-0af7651916cd43dd8448eb211c80319c-0000000000000000-01",
+                   "00-0AF7651916CD43DD8448EB211C80319C-b7ad6b7169203331-01",
+                   "ff-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01"):
+        assert tracing.parse_traceparent(header) is None, header
+    assert tracing.parse_traceparent("00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-00")["sampled"] is False
+    print("✅ traceparent interpretato, header non validi scartati")
+
+def test_invalid_traceparent_request():
+    """Test richiesta con traceparent malevolo: trace nuova, nessun file fuori da TRACE_DIR"""
+    print("\n🔍 Test traceparent non valido in una richiesta...")
+
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    directory = tempfile.mkdtemp()
+    # trace_id di 32 caratteri che risale fino alla radice del filesystem
+    escaped = "../" * 10 + "es"
+    outside = os.path.normpath(os.path.join(directory, f"{escaped}.jsonl"))
+    settings.tracing_enabled = True
+    tracing._exporter = tracing.JsonFileExporter(directory)
+    header = f"00-{escaped}-b7ad6b7169203331-01"
+    try:
+        response = TestClient(app).get("/v1/health", headers={"traceparent": header})
+        tracing._exporter.flush()
+    finally:
+        settings.tracing_enabled = False
+
+    trace_id = response.headers["x-trace-id"]
+    assert tracing.TRACE_ID_RE.fullmatch(trace_id) and ".." not in trace_id
+    assert not os.path.exists(outside)
+    assert os.listdir(directory) == [f"{trace_id}.jsonl"]
+    print(f"✅ Trace nuova {trace_id[:8]}…, nessun file fuori dalla cartella")
+
+def main():
+    """Test completo locale"""
+    print("🧪 TEST LOCALE TRACING")
+    print("=" * 40)
+
+    test_context_propagation()
+    test_executor_spans_in_request_trace()
+    test_traceparent_parsing()
+    test_invalid_traceparent_request()
+
+    print("\n🎉 Tutti i test di tracing passati!")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Test locale dell'archivio vettoriale quantizzato
+Ricerca approssimata int8/float16 con re-scoring float32 da file,
+sostituzioni, eliminazioni e compattazione, integrazione con l'indice in memoria
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import asyncio
+
+import numpy as np
+
+from app.services.standins import FaultInjector, InMemoryIndex
+from app.services.vector_store import QuantizedVectorStore
+
+def exact_top(vectors, query, top_k):
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    scores = normalized @ (query / np.linalg.norm(query))
+    return [int(i) for i in np.argsort(-scores)[:top_k]]
+
+def test_recall_and_memory():
+    """Test recall rispetto alla ricerca esatta e byte in RAM"""
+    print("🔍 Test recall e memoria...")
+
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((2000, 64)).astype(np.float32)
+    queries = vectors[:20] + 0.3 * rng.standard_normal((20, 64)).astype(np.float32)
+
+    for storage, ram_ratio in (("int8", 0.3), ("float16", 0.55)):
+        store = QuantizedVectorStore(64, storage)
+        store.add([f"v{i}" for i in range(len(vectors))], vectors)
+        hits = 0
+        for query in queries:
+            found = [int(vector_id[1:]) for _, vector_id in store.search(query, 10)]
+            hits += len(set(found) & set(exact_top(vectors, query, 10)))
+        recall = hits / (10 * len(queries))
+        sizes = store.memory_bytes()
+        assert recall >= 0.95, recall
+        assert sizes["ram"] <= ram_ratio * sizes["disk"], sizes
+        # Punteggi esatti: il primo risultato è il coseno float32
+        score, vector_id = store.search(queries[0], 1)[0]
+        expected = float(vectors[0] @ queries[0] / np.linalg.norm(vectors[0]) / np.linalg.norm(queries[0]))
+        assert vector_id == "v0" and abs(score - expected) < 1e-5
+        store.close()
+        assert not os.path.exists(store.path)
+        print(f"✅ {storage}: recall@10 {recall:.2f}, RAM {sizes['ram']} B contro {sizes['disk']} B float32")
+
+def test_updates_and_compaction():
+    """Test sostituzione, eliminazione, maschera dei filtri e compattazione"""
+    print("\n🔍 Test modifiche...")
+
+    store = QuantizedVectorStore(4, "int8")
+    store.add(["a", "b"], [[1, 0, 0, 0], [0, 1, 0, 0]])
+    store.add(["a", "c"], [[0, 0, 2, 0], [0, 0, 0, 3]])
+    assert store.get("a") == [0.0, 0.0, 2.0, 0.0] and store.get("c") == [0.0, 0.0, 0.0, 3.0]
+    assert store.search([0, 0, 1, 0], 1)[0][1] == "a"
+
+    allowed = np.array([False, True, True])
+    assert [vector_id for _, vector_id in store.search([0, 0, 1, 0], 3, allowed)][0] != "a"
+
+    store.add([f"x{i}" for i in range(100)], np.ones((100, 4)))
+    store.remove([f"x{i}" for i in range(100)])
+    assert len(store) == 3 and len(store.ids) == 3
+    assert store.get("b") == [0.0, 1.0, 0.0, 0.0]
+    assert store.search([0, 1, 0, 0], 1)[0][1] == "b"
+    store.close()
+    print("✅ Righe sostituite sul posto, file compattato dopo le eliminazioni")
+
+def test_in_memory_index_quantized():
+    """Test indice in memoria con storage int8: stessi risultati della versione float32"""
+    print("\n🔍 Test indice in memoria quantizzato...")
+
+    async def run():
+        rng = np.random.default_rng(1)
+        vectors = [
+            {"id": f"doc_{i}_0000", "values": rng.standard_normal(32).tolist(),
+             "metadata": {"user_id": f"u{i % 2}", "item_id": f"doc_{i}"}}
+            for i in range(200)
+        ]
+        query = rng.standard_normal(32).tolist()
+        results = {}
+        for storage in ("float32", "int8"):
+            index = InMemoryIndex(32, FaultInjector("test"), storage=storage)
+            await index.upsert(vectors)
+            await index.delete(ids=["doc_0_0000"])
+            response = await index.query(query, top_k=5, filter={"user_id": "u0"},
+                                         include_metadata=True, include_values=True)
+            fetched = await index.fetch(["doc_2_0000", "doc_0_0000"])
+            results[storage] = ([m.id for m in response.matches], response.matches[0].values,
+                                list(fetched.vectors), fetched.vectors["doc_2_0000"].values)
+            await index.close()
+        return results
+
+    results = asyncio.run(run())
+    assert results["int8"][0] == results["float32"][0]
+    assert all(int(i.split("_")[1]) % 2 == 0 for i in results["int8"][0])
+    assert np.allclose(results["int8"][1], results["float32"][1])
+    assert results["int8"][2] == ["doc_2_0000"]
+    assert np.allclose(results["int8"][3], results["float32"][3])
+    print(f"✅ Stessi top 5 con int8 e float32: {results['int8'][0]}")
+
+def main():
+    """Test completo locale"""
+    print("🧪 TEST LOCALE ARCHIVIO QUANTIZZATO")
+    print("=" * 40)
+
+    test_recall_and_memory()
+    test_updates_and_compaction()
+    test_in_memory_index_quantized()
+
+    print("\n🎉 Tutti i test dell'archivio quantizzato passati!")
+
+if __name__ == "__main__":
+    main()